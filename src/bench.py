@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for inp2feap.
+
+Synthetic Abaqus .inp files with structured grids of quad (CPS4), hex (C3D8) or quadratic hex
+elements (C3D20, written on two lines each) are generated, including face and layer node sets,
+'generate' sets and element sets for materials and duplication. Each case is converted in a
+separate process, timing the build stages separately:
+
+   parse      reading the .inp file                 (MB/s of input)
+   elsets     material assignment from elsets       (elements/s)
+   duplicate  duplication of elements               (elements/s)
+   nsets      boun/load assignment to nsets         (nsets/s)
+   center     translation to the center of the mesh (nodes/s)
+   write      writing the FEAP output file          (MB/s of output)
+
+together with the peak resident set size after each stage. Results can be stored as a baseline
+file, and later runs fail if a stage got slower (or used more memory) than the baseline by more
+than the tolerance.
+
+Usage:
+   python bench.py                          run the default cases (up to 100k elements)
+   python bench.py --cases hex-1M c3d20-1M  run selected cases, see --list
+   python bench.py --save                   store the results in the baseline file
+"""
+import os, sys, json, time, shutil, argparse, resource, tempfile, subprocess
+import inp2feap
+
+KINDS = { "quad" : ("CPS4", 2, 1), "hex" : ("C3D8", 3, 1), "c3d20" : ("C3D20", 3, 2) } # element type, dimensions, lattice nodes per element edge
+SIZES = { "10k" : 10**4, "100k" : 10**5, "1M" : 10**6, "10M" : 10**7 }
+DEFAULT_CASES = ["quad-10k", "hex-10k", "c3d20-10k", "quad-100k", "hex-100k", "c3d20-100k"]
+PHASES = ["parse", "elsets", "duplicate", "nsets", "center", "write"]
+
+MAX_LAYER_SETS = 100 # number of layer nsets and slab elsets
+ITEMS_PER_LINE = 16  # maximum number of entries per data line in .inp files
+
+# node offsets of the element types on the node lattice, in Abaqus node order
+OFFSETS = {
+   "CPS4" : [(0,0), (1,0), (1,1), (0,1)],
+   "C3D8" : [(0,0,0), (1,0,0), (1,1,0), (0,1,0), (0,0,1), (1,0,1), (1,1,1), (0,1,1)],
+   "C3D20" : [(0,0,0), (2,0,0), (2,2,0), (0,2,0), (0,0,2), (2,0,2), (2,2,2), (0,2,2),
+              (1,0,0), (2,1,0), (1,2,0), (0,1,0), (1,0,2), (2,1,2), (1,2,2), (0,1,2),
+              (0,0,1), (2,0,1), (2,2,1), (0,2,1)] }
+
+def CaseNames():
+   return ["%s-%s" % (kind, size) for size in sorted(SIZES, key=SIZES.get) for kind in sorted(KINDS)]
+
+def _DataLines(items):
+   """ Format a list of integers as .inp data lines of at most ITEMS_PER_LINE entries. """
+   return "".join(", ".join(str(i) for i in items[pos:pos+ITEMS_PER_LINE]) + "\n" for pos in xrange(0, len(items), ITEMS_PER_LINE))
+
+class GridGenerator:
+   """
+   Writes a structured grid of 'numElems' (approximately) elements of the given kind, see KINDS.
+   Nodes lie on a lattice with one more node than elements per axis (twice as many for quadratic
+   elements), numbered with the first axis running fastest. Elements are numbered the same way,
+   so each layer of elements along the last axis is a range of element IDs.
+   """
+   def __init__(self, kind, numElems):
+      self.elemType, self.nDim, self.order = KINDS[kind]
+      n = max(1, int(round(numElems ** (1. / self.nDim))))
+      self.numCells = [n] * self.nDim
+      self.numLattice = [self.order * n + 1 for n in self.numCells]
+
+   def NodeId(self, index):
+      nid = 0
+      for d in reversed(xrange(self.nDim)):
+         nid = nid * self.numLattice[d] + index[d]
+      return nid + 1
+
+   def _Indices(self, counts):
+      """ All index tuples for the given counts per axis, first axis fastest. """
+      indices = [()]
+      for count in counts:
+         indices = [index + (i,) for i in xrange(count) for index in indices]
+      return indices
+
+   def Write(self, filename):
+      numLattice = self.numLattice
+      layerLen = 1
+      for n in self.numCells[:-1]: layerLen *= n
+      numLayers = self.numCells[-1]
+      numElems = layerLen * numLayers
+      numNodes = 1
+      for m in numLattice: numNodes *= m
+
+      with open(filename, 'w', 1 << 20) as f:
+         f.write("*Heading\n** synthetic %s grid %s\n" % (self.elemType, "x".join(str(n) for n in self.numCells)))
+         f.write("*Part, name=GRID\n*Node\n")
+         spacing = 1. / self.order
+         fmt = "%d" + ", %.6f" * self.nDim + "\n"
+         inner = self._Indices(numLattice[:-1])
+         for k in xrange(numLattice[-1]):
+            base = self.NodeId((0,) * (self.nDim-1) + (k,))
+            f.write("".join([fmt % ((base + r,) + tuple(i * spacing for i in index) + (k * spacing,)) for r, index in enumerate(inner)]))
+
+         f.write("*Element, type=%s\n" % self.elemType)
+         deltas = [self.NodeId(offset) - 1 for offset in OFFSETS[self.elemType]]
+         cells = self._Indices(self.numCells[:-1])
+         eid = 0
+         for k in xrange(numLayers):
+            lines = []
+            for cell in cells:
+               eid += 1
+               base = self.NodeId(tuple(self.order * c for c in cell + (k,)))
+               items = [eid] + [base + delta for delta in deltas]
+               lines.append(",\n".join(", ".join(str(i) for i in items[pos:pos+ITEMS_PER_LINE]) for pos in xrange(0, len(items), ITEMS_PER_LINE)) + "\n")
+            f.write("".join(lines))
+
+         # node sets: faces of the grid, some layers along the last axis and all nodes
+         for d, axis in enumerate("XYZ"[:self.nDim]):
+            for side, index in (("MIN", 0), ("MAX", numLattice[d]-1)):
+               counts = numLattice[:d] + [1] + numLattice[d+1:]
+               f.write("*Nset, nset=%s%s\n" % (axis, side))
+               f.write(_DataLines([self.NodeId(i[:d] + (index,) + i[d+1:]) for i in self._Indices(counts)]))
+         layerNodes = numNodes / numLattice[-1]
+         for k in xrange(0, numLattice[-1], max(1, numLattice[-1] / MAX_LAYER_SETS)):
+            f.write("*Nset, nset=N-LAYER%d, generate\n%d, %d, 1\n" % (k, k * layerNodes + 1, (k+1) * layerNodes))
+         f.write("*Nset, nset=N-ALL, generate\n1, %d, 1\n" % numNodes)
+
+         # element sets: slabs of element layers, every 7th element and all elements
+         numSlabs = min(numLayers, MAX_LAYER_SETS)
+         for s in xrange(numSlabs):
+            first, last = s * numLayers / numSlabs, (s+1) * numLayers / numSlabs
+            f.write("*Elset, elset=E-SLAB%d, generate\n%d, %d, 1\n" % (s, first * layerLen + 1, last * layerLen))
+         f.write("*Elset, elset=E-SAMPLE\n")
+         f.write(_DataLines(range(1, numElems+1, 7)))
+         f.write("*Elset, elset=E-ALL, generate\n1, %d, 1\n" % numElems)
+         f.write("*End Part\n")
+
+      return numElems, numSlabs
+
+def WriteCase(name, dataDir):
+   """ Generate the .inp and config files of a case if they don't exist yet. Returns the config file name. """
+   kind, size = name.split("-")
+   confFile = os.path.join(dataDir, name + ".json")
+   if os.path.isfile(confFile): return confFile
+
+   inpFile = os.path.join(dataDir, name + ".inp")
+   numElems, numSlabs = GridGenerator(kind, SIZES[size]).Write(inpFile)
+   elsets = [{ "name" : "E-ALL", "setMat" : 1 }]
+   elsets += [{ "name" : "E-SLAB%d" % s, "setMat" : 2 + s % 2 } for s in xrange(numSlabs)]
+   elsets[1]["duplicate"] = 4
+   elsets.append({ "name" : "E-SAMPLE", "setMat" : 5 })
+   conf = { "input" : name + ".inp", "output" : os.path.join(dataDir, "o" + name), "centerMesh" : True, "elsets" : elsets,
+            "nsets" : [{ "name" : "XMIN", "setBoun" : "1, 1, 1" }, { "name" : "XMAX", "setLoad" : "1., 0., 0." }] }
+   with open(confFile, 'w') as f: json.dump(conf, f, indent=1)
+   return confFile
+
+def RunCase(confFile):
+   """ Convert a config, timing each build stage. Returns the result dict of the case. """
+   result = { "phases" : {}, "throughput" : {}, "peakRssMB" : {} }
+   with inp2feap._CaptureOutput():
+      parser = inp2feap.ConfigFileParser(confFile)
+      parser._ParseConfig()
+      inpFile = os.path.join(parser.workingDir, parser.inputFile)
+      state = {}
+      stages = [("parse", lambda: state.update(mesh=parser._ParseInputFile(inpFile))),
+                ("elsets", lambda: parser._AssignElsets(state["mesh"])),
+                ("duplicate", lambda: parser._DuplicateElems(state["mesh"])),
+                ("nsets", lambda: state.update(nsets=parser._AssignNsets(state["mesh"].nsets))),
+                ("center", lambda: parser._CenterMesh(state["mesh"])),
+                ("write", lambda: parser._WriteOutput(state["mesh"], state["nsets"]))]
+      for phase, stage in stages:
+         start = time.time()
+         stage()
+         result["phases"][phase] = time.time() - start
+         result["peakRssMB"][phase] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+   mesh = state["mesh"]
+   amounts = { "parse" : (os.path.getsize(inpFile) / 1e6, "MB/s"), "elsets" : (mesh.NumElems(), "elems/s"),
+               "duplicate" : (len(mesh.elemDuplicate), "elems/s"), "nsets" : (len(parser.conf_nsets), "nsets/s"),
+               "center" : (mesh.NumNodes(), "nodes/s"), "write" : (os.path.getsize(parser.outputFile) / 1e6, "MB/s") }
+   for phase, (amount, unit) in amounts.iteritems():
+      result["throughput"][phase] = [amount / max(result["phases"][phase], 1e-9), unit]
+   result["elements"] = mesh.NumElems()
+   result["nodes"] = mesh.NumNodes()
+   return result
+
+def Compare(name, result, baseline, tolerance, minSeconds):
+   """ Return a list of regressions of 'result' against the baseline result of the case. """
+   regressions = []
+   for phase in PHASES:
+      old, new = baseline["phases"].get(phase), result["phases"][phase]
+      if old is not None and new > old * (1. + tolerance) and new - old > minSeconds:
+         regressions.append("%s %s: %.3f s, baseline %.3f s (+%.0f%%)" % (name, phase, new, old, 100. * (new/old - 1.) if old > 0 else 0.))
+   old, new = max(baseline["peakRssMB"].values()), max(result["peakRssMB"].values())
+   if new > old * (1. + tolerance):
+      regressions.append("%s peak RSS: %.1f MB, baseline %.1f MB" % (name, new, old))
+   return regressions
+
+def main():
+   argParser = argparse.ArgumentParser(description="Benchmark inp2feap on synthetic meshes.")
+   argParser.add_argument("--cases", nargs="+", default=DEFAULT_CASES, help="cases to run (default: %s)" % " ".join(DEFAULT_CASES))
+   argParser.add_argument("--list", action="store_true", help="list all cases and exit")
+   argParser.add_argument("--data", help="directory for generated files, kept for later runs (default: temporary directory)")
+   argParser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json"),
+                          help="baseline file (default: bench_baseline.json next to this script)")
+   argParser.add_argument("--save", action="store_true", help="store the results in the baseline file")
+   argParser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown per stage (default: 0.25)")
+   argParser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns below this absolute time (default: 0.05)")
+   argParser.add_argument("--run-case", help=argparse.SUPPRESS) # internal: run one config in this process and print the result
+   args = argParser.parse_args()
+
+   if args.run_case:
+      print json.dumps(RunCase(args.run_case))
+      return inp2feap.EXIT_SUCCESS
+   if args.list:
+      print "\n".join(CaseNames())
+      return inp2feap.EXIT_SUCCESS
+   for name in args.cases:
+      if name not in CaseNames(): argParser.error("unknown case '%s', see --list" % name)
+
+   baseline = {}
+   if os.path.isfile(args.baseline):
+      with open(args.baseline, 'r') as f: baseline = json.load(f)
+
+   dataDir = args.data or tempfile.mkdtemp(prefix="inp2feap-bench")
+   if not os.path.isdir(dataDir): os.makedirs(dataDir)
+   results = {}
+   regressions = []
+   try:
+      for name in args.cases:
+         print "Generating %s ..." % name
+         confFile = WriteCase(name, dataDir)
+         print "Running %s ..." % name
+         # every case runs in a fresh process, so the peak RSS is its own
+         output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run-case", confFile])
+         result = results[name] = json.loads(output.splitlines()[-1])
+
+         print "%-10s %10s %14s %12s %12s" % ("stage", "time [s]", "throughput", "", "peak RSS [MB]")
+         for phase in PHASES:
+            rate, unit = result["throughput"][phase]
+            print "%-10s %10.3f %14.1f %-12s %12.1f" % (phase, result["phases"][phase], rate, unit, result["peakRssMB"][phase])
+         if name in baseline:
+            regressions += Compare(name, result, baseline[name], args.tolerance, args.min_seconds)
+   finally:
+      if not args.data: shutil.rmtree(dataDir)
+
+   if args.save:
+      baseline.update(results)
+      with open(args.baseline, 'w') as f: json.dump(baseline, f, indent=1, sort_keys=True)
+      print "Baseline %s saved." % args.baseline
+
+   if len(regressions) > 0:
+      print "\n%d regressions against %s:" % (len(regressions), args.baseline)
+      print "\n".join(regressions)
+      return inp2feap.EXIT_FAILURE
+   print "\nNo regressions." if any(name in baseline for name in args.cases) else "\nNo baseline to compare with."
+   return inp2feap.EXIT_SUCCESS
+
+if __name__=="__main__":
+   sys.exit(main())
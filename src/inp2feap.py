@@ -0,0 +1,3588 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+   inp2feap
+   
+   
+   This program is used to convert finite element models from the Abaqus .inp format to a FEAP input file.
+   Its behavior is controlled completely by a configuration file following the JSON-syntax which must be
+   specified when running inp2feap. The configuration file states which .inp file will be read and how
+   exactly it will be processed.
+   See the main documentation for inp2feap on Github for information on how to use as well as possibilities
+   and limitations of the program. Advanced knowledge of finite element methods will probably be required
+   to make any sense of the information.
+   
+   https://www.github.com/dheller1/inp2feap
+   
+   The program is provided as is without any warranties. Feel free to use and/or modify as needed.
+   
+   Dominik Heller, September 2015
+   dominik.heller1@gmail.com
+   
+"""
+
+import os, sys, re, bz2, copy, glob, json, mmap, time, zlib, heapq, logging, cProfile, threading
+from array import array
+from itertools import izip, imap, islice, repeat, product, compress, chain
+from operator import add, sub, mul, eq, ne, gt, not_, rshift
+from bisect import bisect_left, bisect_right
+from cStringIO import StringIO
+
+try:
+   import resource # peak memory in profiles, not available on Windows
+except ImportError:
+   resource = None
+   
+try:
+   import lzma # .xz compressed files, provided by the backports.lzma package for Python 2
+except ImportError:
+   try: from backports import lzma
+   except ImportError: lzma = None
+
+class _LazyModule(object):
+   """
+   Stand-in for a module that is imported when one of its attributes is used first, so that starting the
+   converter (or importing it into a driver script) doesn't pay for modules only some conversions need.
+   """
+   def __init__(self, name):
+      self._name = name
+      self._module = None
+      
+   def __getattr__(self, attr):
+      if self._module is None: self._module = __import__(self._name)
+      return getattr(self._module, attr)
+   
+gzip = _LazyModule("gzip")
+Queue = _LazyModule("Queue")
+argparse = _LazyModule("argparse")
+hashlib = _LazyModule("hashlib")
+multiprocessing = _LazyModule("multiprocessing")
+
+# all messages go to this logger, which is silent unless a handler is added (see LogToConsole())
+log = logging.getLogger("inp2feap")
+log.addHandler(logging.NullHandler())
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+class _ConsoleHandler(logging.Handler):
+   """
+   Writes log messages to sys.stdout (looked up for every message, so that redirections of it apply), formatted
+   like the output of the command line tool: warnings and errors with their prefix, everything else as is.
+   """
+   PREFIXES = { logging.WARNING : "Warning: ", logging.ERROR : "Error: " }
+   
+   def emit(self, record):
+      try:
+         sys.stdout.write(_ConsoleHandler.PREFIXES.get(record.levelno, "") + record.getMessage() + "\n")
+      except Exception:
+         self.handleError(record)
+         
+def LogToConsole(level=logging.DEBUG):
+   """
+   Print the messages of inp2feap with at least the given level to stdout: logging.DEBUG includes the details
+   (lines starting with '.'), logging.INFO only the progress of each step and logging.WARNING only problems.
+   """
+   for handler in log.handlers:
+      if isinstance(handler, _ConsoleHandler): break
+   else: log.addHandler(_ConsoleHandler())
+   log.setLevel(level)
+   
+
+class Node(object):
+   """
+   A node in a finite element model is an entity comprising an id for identification and
+   spatial coordinates (x,y) for 2d or (x,y,z) for 3d models, respectively. 
+   Nodes are connected to other nodes via elements to form the finite element mesh.
+   
+   Node objects do not hold any data themselves, they are thin views onto one row of the
+   columnar storage in an AbaqusMesh. A Node constructed directly from (id, x, y[, z])
+   creates a private single-node mesh to store its data in.
+   """
+   __slots__ = ('_mesh', '_row')
+   
+   def __init__(self, *args):
+      if len(args) not in (3, 4): # id, x, y[, z]
+         raise ValueError("Invalid number of arguments (%d)!" % len(args))
+      
+      self._mesh = AbaqusMesh(nDim=len(args)-1)
+      self._mesh.AddNode(args[0], *args[1:])
+      self._row = 0
+      
+   @classmethod
+   def _View(cls, mesh, row):
+      """ Create a Node object viewing row 'row' of the node columns in 'mesh'. """
+      n = cls.__new__(cls)
+      n._mesh = mesh
+      n._row = row
+      return n
+   
+   def _GetCoord(self, d):
+      if d >= self._mesh.nDim: raise AttributeError("%dd node has no coordinate %d." % (self._mesh.nDim, d+1))
+      return self._mesh.coords[self._row*self._mesh.nDim + d]
+   
+   def _SetCoord(self, d, value):
+      if d >= self._mesh.nDim: raise AttributeError("%dd node has no coordinate %d." % (self._mesh.nDim, d+1))
+      self._mesh.coords[self._row*self._mesh.nDim + d] = float(value)
+      
+   id = property(lambda self: self._mesh.nodeIds[self._row])
+   nDim = property(lambda self: self._mesh.nDim)
+   x = property(lambda self: self._GetCoord(0), lambda self, v: self._SetCoord(0, v))
+   y = property(lambda self: self._GetCoord(1), lambda self, v: self._SetCoord(1, v))
+   z = property(lambda self: self._GetCoord(2), lambda self, v: self._SetCoord(2, v))
+      
+   def __str__(self):
+      if self.nDim == 2: 
+         s = '%8d, 0, %14.8f, %14.8f\n' % (self.id, self.x, self.y)
+      elif self.nDim == 3:
+         s = '%8d, 0, %14.8f, %14.8f, %14.8f\n' % (self.id, self.x, self.y, self.z)
+      return s
+      
+class Element(object):
+   """
+   Nodes in a finite element model are connected via elements to form the mesh.
+   The number of nodes per element (often called 'nel') can vary depending on the
+   type of element (e.g. beam element with 2 nodes, quadrilateral shell element with
+   4 nodes), the order of ansatz functions (quadratic beam: 3 nodes), and more.
+   
+   Elements of different types, and thus with different numbers of nodes, may be mixed in a model.
+   The order of nodes in the node list is not arbitrary, it can determine the element
+   orientation and might lead to errors if it is not set correctly.
+   
+   Like Node, an Element is only a thin view onto one row of the element columns of an
+   AbaqusMesh. Constructing it directly from (id, node1, node2, ...) creates a private
+   single-element mesh.
+   
+   Important member variables:
+      - id        (int)            Unique id to distinguish each element
+      - nodes     (list of ints)   List of node IDs belonging to the element
+      - type      (str)            Abaqus element type, or None if it is not known
+      - matn      (int)            Can be used to assign each element a distinct material number in FEAP
+   """
+   __slots__ = ('_mesh', '_row')
+   
+   def __init__(self, *args):
+      if len(args) < 2:
+         raise ValueError("Too few arguments (%d) for element!" % len(args))
+      
+      nodes = [int(a) for a in args[1:] if type(a) == int or len(a)>0]
+      self._mesh = AbaqusMesh(nodesPerElem=len(nodes))
+      self._mesh.AddElem(args[0], nodes)
+      self._row = 0
+      
+   @classmethod
+   def _View(cls, mesh, row):
+      """ Create an Element object viewing row 'row' of the element columns in 'mesh'. """
+      e = cls.__new__(cls)
+      e._mesh = mesh
+      e._row = row
+      return e
+   
+   def _GetNodes(self):
+      return self._mesh.ElemNodes(self._row).tolist()
+   
+   def _GetNumNodes(self):
+      offsets = self._mesh.elemOffsets
+      return offsets[self._row+1] - offsets[self._row]
+   
+   def _SetMatn(self, matn):
+      self._mesh.elemMats[self._row] = int(matn)
+   
+   id = property(lambda self: self._mesh.elemIds[self._row])
+   numNodes = property(_GetNumNodes)
+   nodes = property(_GetNodes)
+   type = property(lambda self: self._mesh.typeNames[self._mesh.elemTypes[self._row]] or None)
+   matn = property(lambda self: self._mesh.elemMats[self._row], _SetMatn)
+   duplicate = property(lambda self: self._mesh.elemDuplicate.get(self._row, []))
+         
+   def __str__(self):
+      nodes = self.nodes
+      return ("%8d, %d" + ", %d" * len(nodes) + "\n") % ((self.id, self.matn) + tuple(nodes))
+   
+class IdSet(object):
+   """
+   Compact set of node or element IDs, e.g. the members of an *Nset or *Elset section. Ranges from
+   'generate' lines are stored as (start, stop, step) runs with an inclusive stop like in the .inp
+   file, explicitly listed IDs as one sorted array of integers. A set of all elements of a large
+   model thus costs a few bytes instead of a list of millions of Python integers.
+   
+   Membership is tested by arithmetic on the runs and a binary search in the array, and iteration
+   yields all IDs in ascending order. IDs listed several times in a section are kept several times,
+   like in the lists of IDs used before.
+   """
+   def __init__(self, ids=()):
+      self.runs = []
+      self._ids = array('i')
+      self._sorted = True
+      self.extend(ids)
+      
+   def append(self, i):
+      ids = self._ids
+      if len(ids) > 0 and i < ids[-1]: self._sorted = False
+      ids.append(i)
+      
+   def extend(self, ids):
+      for i in ids: self.append(i)
+      
+   def AddRange(self, start, stop, step=1):
+      """ Add the IDs start, start+step, ... up to and including stop. """
+      if step <= 0: raise ValueError("Error: Invalid increment %d for a generated set." % step)
+      if stop >= start: self.runs.append((start, stop - (stop-start) % step, step))
+      
+   def Ids(self):
+      """ The explicitly listed IDs as sorted array. """
+      if not self._sorted:
+         self._ids = array('i', sorted(self._ids))
+         self._sorted = True
+      return self._ids
+   
+   def __len__(self):
+      return len(self._ids) + sum([(stop-start) / step + 1 for start, stop, step in self.runs])
+   
+   def __contains__(self, i):
+      for start, stop, step in self.runs:
+         if start <= i <= stop and (i-start) % step == 0: return True
+      ids = self.Ids()
+      pos = bisect_left(ids, i)
+      return pos < len(ids) and ids[pos] == i
+   
+   def __iter__(self):
+      sources = [xrange(start, stop+1, step) for start, stop, step in self.runs]
+      if len(self._ids) > 0: sources.append(self.Ids())
+      if len(sources) == 1: return iter(sources[0])
+      return heapq.merge(*sources)
+   
+   def __eq__(self, other):
+      return list(self) == list(other)
+   
+   def __ne__(self, other):
+      return not self == other
+   
+   def __repr__(self):
+      return "IdSet(%s)" % list(self)
+
+class IdBitmap(object):
+   """
+   Set of the distinct IDs in a column, e.g. all node IDs of a mesh. If the IDs are dense, i.e.
+   non-negative and the largest one is below MAX_SPREAD times their number (or MIN_SIZE), they are
+   stored as a bytearray with one flag per possible ID, which costs a byte per ID instead of the tens
+   of bytes per member of a set, and two sets are compared flag by flag (see Difference()). Sparse IDs
+   are stored as one sorted array of integers and found by binary search instead.
+   """
+   MAX_SPREAD = 8
+   MIN_SIZE = 1 << 16
+   
+   def __init__(self, ids):
+      self.flags = self._ids = None
+      maxId = max(ids) if len(ids) > 0 else -1
+      if maxId < max(IdBitmap.MAX_SPREAD * len(ids), IdBitmap.MIN_SIZE) and (len(ids) == 0 or min(ids) >= 0):
+         flags = self.flags = bytearray(maxId + 1)
+         for i in ids: flags[i] = 1
+      else:
+         self._ids = array('i', sorted(ids))
+   
+   def __len__(self):
+      if self.flags is not None: return self.flags.count('\x01')
+      ids = self._ids
+      return len(ids) - sum(imap(eq, islice(ids, 1, None), ids))
+   
+   def __contains__(self, i):
+      if self.flags is not None: return 0 <= i < len(self.flags) and self.flags[i] == 1
+      ids = self._ids
+      pos = bisect_left(ids, i)
+      return pos < len(ids) and ids[pos] == i
+   
+   def __iter__(self):
+      if self.flags is not None: return compress(xrange(len(self.flags)), self.flags)
+      ids = self._ids
+      return compress(ids, chain([True], imap(ne, islice(ids, 1, None), ids)))
+   
+   def Difference(self, other):
+      """ Return the IDs in this set which are not in the IdBitmap 'other', in ascending order. """
+      flags, otherFlags = self.flags, other.flags
+      if flags is None or otherFlags is None: return list(compress(self, imap(not_, imap(other.__contains__, self))))
+      common = min(len(flags), len(otherFlags))
+      return list(compress(xrange(common), imap(gt, flags, otherFlags))) + list(compress(xrange(common, len(flags)), islice(flags, common, None)))
+   
+   def Missing(self, ids):
+      """ Return the distinct IDs in the sequence 'ids' (e.g. a small node set) which are not in this set, in ascending order. """
+      return sorted(set(compress(ids, imap(not_, imap(self.__contains__, ids)))))
+   
+def _DeferredList(name):
+   """ Property for the IdSet of set members which is only read from the .inp file on first access (see _MemberSet.Defer()). """
+   attr = '_' + name
+   
+   def Get(self):
+      if self._loader is not None:
+         loader, self._loader = self._loader, None
+         setattr(self, attr, loader())
+      return getattr(self, attr)
+   
+   def Set(self, value):
+      self._loader = None
+      setattr(self, attr, value if isinstance(value, IdSet) else IdSet(value))
+      
+   return property(Get, Set)
+   
+class _MemberSet(object):
+   """ Base class for node and element sets, whose members may be loaded on demand. """
+   _loader = None
+   
+   def Defer(self, loader):
+      """ Read the members by calling 'loader' on first access instead of storing them now. """
+      self._loader = loader
+      
+   def IsLoaded(self):
+      return self._loader is None
+   
+   def DeferredRange(self):
+      """ Byte range (start, end) of the .inp section the members will be read from, or None if they are loaded. """
+      if isinstance(self._loader, _SectionLoader): return (self._loader.start, self._loader.end)
+      return None
+   
+class NodeSet(_MemberSet):
+   """
+   A node set is a collection of nodes with a name.
+   It is possible to define specific boundary condition or load statements for all nodes within a node set.
+   As an example, in a shell model with intersections, a formulation is often used where nodes at
+   which intersections are present comprise 6 degrees of freedom, while other nodes comprise 5 DOFs.
+   By assigning all intersection nodes to a node set, the 6th DOF can be made available only on nodes in the
+   set while being locked on all other nodes. 
+   """
+   nodes = _DeferredList('nodes')
+   
+   def __init__(self, *args):
+      self.nodes = IdSet()
+      self.name = "Unnamed nset"
+      self.generate = False
+      self.setBoun = ""
+      self.setLoad = ""
+      self.select = None # NodeSelection choosing the members by their coordinates (config nsets only)
+      
+   def __str__(self):
+      f = StringIO()
+      FeapWriter(f).WriteNodeSet(self)
+      return f.getvalue()
+
+class ElSet(_MemberSet):
+   """
+   An ElSet (element set) is a collection of elements with a name.
+   It is mainly used to be able to assign a specific material number in FEAP to elements in a set
+   (setMat parameter).
+   """
+   elems = _DeferredList('elems')
+   
+   def __init__(self, *args):
+      self.elems = IdSet()
+      self.name = "Unnamed elset"
+      self.setMat = 1
+      self.generate = False
+      self.duplicate = []
+      
+class ElementType:
+   """
+   Maps all elements of an Abaqus element type (e.g. S3R in a mesh of mostly S4R shells) to a FEAP material,
+   so that a suitable FEAP element formulation can be selected for each topology.
+   The material number is either set to 'setMat', or 'matOffset' is added to the number assigned by the elsets.
+   """
+   def __init__(self, name="UNKNOWN"):
+      self.name = name
+      self.setMat = None
+      self.matOffset = 0
+      
+   def Material(self, matn):
+      """ Return the material number for an element of this type which was assigned material 'matn' before. """
+      if self.setMat is not None: return self.setMat
+      return matn + self.matOffset
+   
+class _MeshRows(object):
+   """ Read-only sequence of Node or Element views onto the columns of an AbaqusMesh. """
+   __slots__ = ('_mesh', '_cls', '_ids')
+   
+   def __init__(self, mesh, cls, ids):
+      self._mesh = mesh
+      self._cls = cls
+      self._ids = ids
+      
+   def __len__(self):
+      return len(self._ids)
+   
+   def __getitem__(self, row):
+      if row < 0: row += len(self._ids)
+      if not 0 <= row < len(self._ids): raise IndexError("Mesh row index out of range.")
+      return self._cls._View(self._mesh, row)
+   
+   def __iter__(self):
+      for row in xrange(len(self._ids)):
+         yield self._cls._View(self._mesh, row)
+      
+def _NumberArray(typecode, tokens):
+   """
+   Convert a list of number strings to an array with the given typecode ('i' or 'd'). The tokens are decoded as
+   one JSON array, which is several times faster than converting them one by one; numbers which are not valid
+   JSON (like '1.' or '+2') are converted by int() or float() instead. Raises ValueError for invalid numbers.
+   """
+   try: return array(typecode, json.loads('[' + ','.join(tokens) + ']'))
+   except (ValueError, TypeError): return array(typecode, map(int if typecode == 'i' else float, tokens))
+   
+def _IndexByName(sets):
+   """ Map names to node or element sets. For sets with identical names, the first one in the list is used. """
+   index = {}
+   for s in sets: index.setdefault(s.name, s)
+   return index
+   
+class AbaqusMesh(object):
+   """
+   An AbaqusMesh object gathers all mesh information from an Abaqus model which is currently
+   read from inp2feap, that is: Nodes, elements, node sets, element sets.
+   
+   Nodes and elements are stored column-wise in typed arrays instead of one Python object
+   per entity, which keeps memory consumption at a few bytes per value even for meshes with
+   millions of nodes. Coordinates are a flat, row-major array with 'nDim' values per node.
+   Connectivity is stored in compressed sparse row (CSR) form: the node IDs of all elements are
+   concatenated in 'elemNodes', and the nodes of element row r are elemNodes[elemOffsets[r]:elemOffsets[r+1]].
+   Elements of different types with different numbers of nodes can thus be mixed without padding.
+   The 'nodes' and 'elems' members provide Node/Element views for convenient (but slow) access
+   to single rows.
+   
+   'nodesPerElem' is the number of nodes of all elements, -1 if there are no elements yet, or
+   MIXED if elements with different numbers of nodes have been added.
+   
+   Important member variables:
+      - nodeIds       (array of ints)     Node IDs, one per node
+      - coords        (array of floats)   Nodal coordinates, nDim per node
+      - elemIds       (array of ints)     Element IDs, one per element
+      - elemOffsets   (array of ints)     Start of each element's nodes in elemNodes, plus the total length
+      - elemNodes     (array of ints)     Element connectivity (node IDs) of all elements
+      - elemTypes     (array of ints)     Element type of each element, as index into typeNames
+      - elemMats      (array of ints)     FEAP material number, one per element
+      - elemDuplicate (dict)              Maps element rows to lists of material numbers for duplicates
+      - typeNames     (list of strs)      Abaqus element type names ("" if not known)
+      - typeNodes     (list of ints)      Number of nodes of each element type
+   """
+   MIXED = 0 # nodesPerElem of meshes with elements of different sizes
+   
+   def __init__(self, nDim=-1, nodesPerElem=-1):
+      self.nDim = nDim
+      self.nodesPerElem = nodesPerElem
+      
+      self.nodeIds = array('i')
+      self.coords = array('d')
+      
+      self.elemIds = array('i')
+      self.elemOffsets = array('i', [0])
+      self.elemNodes = array('i')
+      self.elemTypes = array('H')
+      self.elemMats = array('i')
+      self.elemDuplicate = {}
+      self.typeNames = []
+      self.typeNodes = []
+      
+      self.nsets = []
+      self.elsets = []
+      
+   # typed columns, pickled as raw machine values instead of lists of Python numbers
+   ARRAYS = ('nodeIds', 'coords', 'elemIds', 'elemOffsets', 'elemNodes', 'elemTypes', 'elemMats')
+   TYPECODES = ('i', 'd', 'i', 'i', 'i', 'H', 'i')
+   
+   def __getstate__(self):
+      state = self.__dict__.copy()
+      for name in AbaqusMesh.ARRAYS: state[name] = state[name].tostring()
+      return state
+   
+   def __setstate__(self, state):
+      self.__dict__.update(state)
+      for name, typecode in zip(AbaqusMesh.ARRAYS, AbaqusMesh.TYPECODES):
+         values = array(typecode)
+         values.fromstring(state[name])
+         setattr(self, name, values)
+   
+   nodes = property(lambda self: _MeshRows(self, Node, self.nodeIds))
+   elems = property(lambda self: _MeshRows(self, Element, self.elemIds))
+   
+   def NumNodes(self):
+      return len(self.nodeIds)
+   
+   def NumElems(self):
+      return len(self.elemIds)
+   
+   def BoundingBox(self):
+      """ Minimum and maximum coordinates of all nodes as two lists with nDim entries, from strided views into the coordinate column. """
+      nDim = self.nDim
+      return [min(self.coords[d::nDim]) for d in xrange(nDim)], [max(self.coords[d::nDim]) for d in xrange(nDim)]
+   
+   def NodeRowIndex(self):
+      """ Return a dict mapping node IDs to their row in the node columns. """
+      return dict(izip(self.nodeIds, xrange(len(self.nodeIds))))
+   
+   def ElemRowIndex(self):
+      """ Return a dict mapping element IDs to their row in the element columns. """
+      return dict(izip(self.elemIds, xrange(len(self.elemIds))))
+   
+   def ElemNodes(self, row):
+      """ Return the node IDs of the element in row 'row' as array. """
+      return self.elemNodes[self.elemOffsets[row]:self.elemOffsets[row+1]]
+   
+   def ElemRowsUsing(self, nodeIds):
+      """ Return the sorted rows of all elements using any of the node IDs in the set 'nodeIds'. """
+      positions = compress(xrange(len(self.elemNodes)), imap(nodeIds.__contains__, self.elemNodes))
+      return sorted(set(imap(sub, imap(bisect_right, repeat(self.elemOffsets), positions), repeat(1))))
+   
+   def TypeIndex(self, elemType, numNodes):
+      """ Return the index of element type 'elemType' (None if unknown) with 'numNodes' nodes in typeNames, adding the type if necessary. """
+      name = elemType or ""
+      if name in self.typeNames:
+         index = self.typeNames.index(name)
+         if self.typeNodes[index] != numNodes:
+            raise ValueError("Elements %swith %d nodes can't be added to elements with %d nodes." % ("of type %s " % name if name else "", numNodes, self.typeNodes[index]))
+         return index
+      
+      if self.nodesPerElem == -1: self.nodesPerElem = numNodes
+      elif self.nodesPerElem != numNodes: self.nodesPerElem = AbaqusMesh.MIXED
+      self.typeNames.append(name)
+      self.typeNodes.append(numNodes)
+      return len(self.typeNames) - 1
+   
+   def TypeRuns(self):
+      """ Return (type index, first row, end row) for each run of consecutive elements of the same type. """
+      types = self.elemTypes
+      runs = []
+      start = 0
+      for row in xrange(1, len(types)):
+         if types[row] != types[start]:
+            runs.append((types[start], start, row))
+            start = row
+      if len(types) > 0: runs.append((types[start], start, len(types)))
+      return runs
+   
+   def AddNode(self, nid, *coords):
+      """ Append a node with ID 'nid' and 2 or 3 coordinates. Arguments may be numbers or strings. """
+      nid = int(nid)
+      if nid < 0: raise ValueError("Negative node ID not supported.")
+      
+      if self.nDim == -1: self.nDim = len(coords)
+      elif len(coords) != self.nDim:
+         raise ValueError("Node %d spatial dimension %d doesn't match mesh dimension %d." % (nid, len(coords), self.nDim))
+      
+      coords = [float(c) for c in coords]
+      self.nodeIds.append(nid)
+      self.coords.extend(coords)
+      
+   def AddNodeBlock(self, text, numLines):
+      """
+      Append the nodes of 'numLines' data lines of a *Node block, given as one string 'text', converting all
+      fields in one step. Returns False without changing the mesh if the lines don't form a regular table of
+      node IDs and coordinates; they must then be added one by one with AddNode() to locate the error.
+      """
+      tokens = text.replace(',', ' ').split()
+      if numLines == 0 or len(tokens) % numLines != 0: return False
+      stride = len(tokens) / numLines
+      nDim = stride - 1
+      if nDim < 1 or self.nDim not in (-1, nDim) or text.count(',') != numLines * nDim: return False
+      
+      try:
+         nodeIds = _NumberArray('i', tokens[::stride])
+         del tokens[::stride]
+         coords = _NumberArray('d', tokens)
+      except (ValueError, OverflowError):
+         return False
+      if min(nodeIds) < 0: return False
+      
+      self.nDim = nDim
+      self.nodeIds.extend(nodeIds)
+      self.coords.extend(coords)
+      return True
+      
+   def AddElem(self, eid, nodes, matn=1, elemType=None):
+      """ Append an element with ID 'eid', a list of node IDs 'nodes', material number 'matn' and Abaqus type 'elemType'. """
+      eid = int(eid)
+      
+      try: typeIndex = self.TypeIndex(elemType, len(nodes))
+      except ValueError as e: raise ValueError("Element %d: %s" % (eid, e))
+      
+      nodes = [int(n) for n in nodes]
+      self.elemIds.append(eid)
+      self.elemNodes.extend(nodes)
+      self.elemOffsets.append(len(self.elemNodes))
+      self.elemTypes.append(typeIndex)
+      self.elemMats.append(int(matn))
+      
+class ElementAssembler(object):
+   """
+   Assembles elements from the stream of integers in the data lines of an *Element block.
+   Abaqus wraps the node list of elements with many nodes (e.g. C3D20) onto continuation lines,
+   so element records cannot be assumed to start on a new line. The assembler collects the
+   integers of each line in a buffer and moves a cursor over it in steps of (1 + number of nodes),
+   appending each complete record directly to the element columns of the mesh. Only an incomplete
+   record at the end of a line is kept in the buffer, so each value is copied just once.
+   All elements fed to one assembler are of type 'elemType' (None if not known).
+   """
+   # number of nodes for element types which can not be derived by the naming rules in NodesForType()
+   ELEMENT_NODES = { "S4R5" : 4, "S8R5" : 8, "S9R5" : 9, "STRI3" : 3, "STRI65" : 6,
+                     "B21" : 2, "B22" : 3, "B31" : 2, "B32" : 3, "B33" : 2,
+                     "SFM3D3" : 3, "SFM3D4" : 4, "SFM3D4R" : 4, "SFM3D6" : 6, "SFM3D8" : 8, "SFM3D8R" : 8 }
+   
+   # element families where the trailing number is the number of nodes (e.g. C3D20R, S4R, CPS8, T3D2)
+   NODES_BY_NAME = re.compile(r"^(C3D|CPS|CPE|CPEG|CAX|DC3D|DC2D|DCAX|M3D|S|SC|T2D|T3D|R3D)(\d+)[A-Z]*$")
+   
+   @staticmethod
+   def NodesForType(elemType):
+      """ Return the number of nodes for an Abaqus element type name, or None if it is not known. """
+      if elemType is None: return None
+      elemType = elemType.strip().upper()
+      if elemType in ElementAssembler.ELEMENT_NODES: return ElementAssembler.ELEMENT_NODES[elemType]
+      
+      m = ElementAssembler.NODES_BY_NAME.match(elemType)
+      if m is None: return None
+      return int(m.group(2))
+   
+   def __init__(self, mesh, numNodes, elemType=None):
+      self.typeIndex = mesh.TypeIndex(elemType, numNodes)
+      self.mesh = mesh
+      self.stride = 1 + numNodes # first number is the element ID
+      self.buffer = []
+      
+   def Feed(self, fields):
+      """ Add the comma-separated fields of one data line and append all elements completed by them. """
+      self.FeedValues([int(s) for s in fields if s.strip() != ""])
+      
+   def FeedBlock(self, text):
+      """ Add several data lines, given as one string 'text', converting all fields in one step. Raises ValueError for non-integer fields. """
+      self.FeedValues(_NumberArray('i', text.replace(',', ' ').split()))
+      
+   def FeedValues(self, values):
+      """ Add a list of integers and append all elements completed by them. """
+      buf = self.buffer
+      buf.extend(values)
+      
+      stride = self.stride
+      numElems = len(buf) / stride
+      if numElems == 0: return
+      end = numElems * stride
+      
+      # complete records are split into columns by extended slicing instead of element by element
+      mesh = self.mesh
+      nodes = buf[:end]
+      del nodes[::stride]
+      start = len(mesh.elemNodes)
+      mesh.elemIds.extend(array('i', buf[:end:stride]))
+      mesh.elemNodes.extend(array('i', nodes))
+      mesh.elemOffsets.extend(array('i', xrange(start + stride-1, start + len(nodes) + 1, stride-1)))
+      mesh.elemTypes.extend(array('H', [self.typeIndex]) * numElems)
+      mesh.elemMats.extend(array('i', [1]) * numElems)
+      
+      # drop consumed input, keeping only a partial record for the next line
+      del buf[:end]
+      
+   def Pending(self):
+      """ Number of integers read which do not yet form a complete element. """
+      return len(self.buffer)
+   
+COMPRESSION_MAGIC = [("gz", "\x1f\x8b"), ("bz2", "BZh"), ("xz", "\xfd7zXZ\x00")]
+
+def Compression(filename, sniff=True):
+   """
+   Return the compression format ('gz', 'bz2' or 'xz') of a file, or None for uncompressed files. Existing
+   files are recognized by their magic bytes if 'sniff' is set, otherwise (or for new files) the file
+   name extension is used.
+   """
+   if sniff and os.path.isfile(filename):
+      with open(filename, 'rb') as f: magic = f.read(6)
+      for compression, prefix in COMPRESSION_MAGIC:
+         if magic.startswith(prefix): return compression
+      return None
+   extension = os.path.splitext(filename)[1].lower().lstrip('.')
+   return extension if extension in ("gz", "bz2", "xz") else None
+
+def _RequireLzma():
+   if lzma is None: raise ValueError("Error: .xz compressed files require the lzma module (package backports.lzma for Python 2).")
+   
+def _FileChunks(filename, compression=None):
+   """
+   Generator yielding the contents of a file in chunks of about InpFileParser.CHUNK_BYTES, decompressed if
+   'compression' is given. Files consisting of several concatenated compressed streams are supported.
+   """
+   if compression is None:
+      with open(filename, 'rb') as f:
+         for data in iter(lambda: f.read(InpFileParser.CHUNK_BYTES), ""): yield data
+      return
+   
+   if compression == "xz": _RequireLzma()
+   NewDecompressor = { "gz" : lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+                       "bz2" : bz2.BZ2Decompressor,
+                       "xz" : lambda: lzma.LZMADecompressor() }[compression]
+   decompressor = NewDecompressor()
+   with open(filename, 'rb') as f:
+      while True:
+         data = f.read(InpFileParser.CHUNK_BYTES)
+         if not data: break
+         text = []
+         while data:
+            try: text.append(decompressor.decompress(data))
+            except EOFError: # the previous stream ended exactly at the end of the last chunk
+               decompressor = NewDecompressor()
+               continue
+            data = decompressor.unused_data
+            if data: decompressor = NewDecompressor() # next stream
+         yield "".join(text)
+         
+def _LinesFromChunks(chunks):
+   """ Generator yielding the lines of text given in arbitrary chunks, see _FileChunks(). """
+   rest = ""
+   for chunk in chunks:
+      lines = (rest + chunk).splitlines(True)
+      rest = lines.pop() if len(lines) > 0 and not lines[-1].endswith('\n') else ""
+      for line in lines: yield line
+   if rest: yield rest
+   
+class _ReadAhead:
+   """
+   Iterates over the items of another iterable, typically the chunks of a file (see _FileChunks()), which
+   are produced by a separate thread and handed over in a queue of at most 'depth' items. Reading and
+   decompressing the file (both release the GIL) thus overlaps with processing the previous chunks, while
+   the bounded queue limits the memory held by a producer that is faster than its consumer.
+   Exceptions raised by the producer are re-raised in the consumer.
+   """
+   def __init__(self, items, depth=4):
+      self.queue = Queue.Queue(depth)
+      self.stopped = False
+      self.thread = threading.Thread(target=self._Produce, args=(items,))
+      self.thread.daemon = True
+      self.thread.start()
+      
+   def _Put(self, item):
+      # wake up regularly to notice a consumer that stopped early
+      while not self.stopped:
+         try:
+            self.queue.put(item, timeout=0.1)
+            return True
+         except Queue.Full: pass
+      return False
+      
+   def _Produce(self, items):
+      try:
+         for item in items:
+            if not self._Put((True, item)): return
+         self._Put((False, None))
+      except Exception:
+         self._Put((False, sys.exc_info()))
+         
+   def __iter__(self):
+      try:
+         while True:
+            ok, item = self.queue.get()
+            if ok: yield item
+            elif item is None: break
+            else: raise item[0], item[1], item[2]
+      finally:
+         self.stopped = True
+         self.thread.join()
+         
+class _WriteBehind:
+   """
+   File-like wrapper handing the data given to write() over to a separate thread, which writes (and compresses)
+   it to the file 'f', so that formatting the next rows overlaps with the output. At most 'depth' writes are
+   queued. Errors of the writer thread are raised by the next write() or by close(), which waits for all
+   queued data to be written and closes 'f'.
+   """
+   def __init__(self, f, depth=16):
+      self.f = f
+      self.queue = Queue.Queue(depth)
+      self.position = 0
+      self.error = None
+      self.thread = threading.Thread(target=self._Consume)
+      self.thread.daemon = True
+      self.thread.start()
+      
+   def _Consume(self):
+      while True:
+         data = self.queue.get()
+         if data is None: break
+         if self.error is not None: continue # drain the queue
+         try: self.f.write(data)
+         except Exception: self.error = sys.exc_info()
+         
+   def _RaiseError(self):
+      if self.error is not None:
+         error, self.error = self.error, None
+         raise error[0], error[1], error[2]
+      
+   def write(self, data):
+      self._RaiseError()
+      self.queue.put(data)
+      self.position += len(data)
+      
+   def tell(self):
+      return self.position
+   
+   def close(self):
+      if self.thread.is_alive():
+         self.queue.put(None)
+         self.thread.join()
+         self.f.close()
+      self._RaiseError()
+      
+   def __enter__(self):
+      return self
+   
+   def __exit__(self, *exc):
+      self.close()
+      
+class _CountingStream(object):
+   """ File-like wrapper counting the bytes written to a stream that may not support tell(), e.g. sys.stdout. """
+   def __init__(self, f):
+      self.f = f
+      self.position = 0
+      
+   def write(self, data):
+      self.f.write(data)
+      self.position += len(data)
+      
+   def tell(self):
+      return self.position
+   
+def OpenOutput(filename):
+   """ Open a file for writing, compressed if its name ends with .gz, .bz2 or .xz. """
+   compression = Compression(filename, sniff=False)
+   if compression == "gz": return gzip.GzipFile(filename, 'wb', compresslevel=6)
+   if compression == "bz2": return bz2.BZ2File(filename, 'wb', FeapWriter.BUFFER_SIZE)
+   if compression == "xz":
+      _RequireLzma()
+      return lzma.LZMAFile(filename, 'wb')
+   return open(filename, 'w', FeapWriter.BUFFER_SIZE)
+   
+class SectionFilter:
+   """
+   Selects the sections of an .inp file which are actually needed, e.g. by a config file: the node and element
+   sets with the given names (None for all sets), and the *Node and *Element sections if 'nodes' and 'elems'
+   are set. The parser skips the data lines of all other *Node, *Element, *Nset and *Elset sections without
+   splitting or converting them.
+   
+   Since an element in several elsets gets the material of the last one (see ConfigFileParser._AssignElsets()),
+   all elsets following the first selected one are needed, too. Sections must therefore be passed to Wants()
+   in file order, starting over after Reset().
+   """
+   def __init__(self, nsets=None, elsets=None, nodes=True, elems=True):
+      self.nsets = None if nsets is None else set(nsets)
+      self.elsets = None if elsets is None else set(elsets)
+      self.nodes = nodes
+      self.elems = elems
+      self.Reset()
+      
+   def Reset(self):
+      """ Start over at the beginning of a file. """
+      self._elsetFound = False
+      
+   def Wants(self, readMode, params):
+      """ Whether the data lines of a section with the given read mode and keyword parameters are needed. """
+      if readMode == InpFileParser.READ_NODES: return self.nodes
+      if readMode == InpFileParser.READ_ELEMS: return self.elems
+      if readMode == InpFileParser.READ_NSET: return self.nsets is None or params.get('nset', "UNKNOWN_NSET") in self.nsets
+      if readMode == InpFileParser.READ_ELSET:
+         if self.elsets is None or params.get('elset', "UNKNOWN_ELSET") in self.elsets: self._elsetFound = True
+         return self._elsetFound
+      return True
+   
+   def Union(self, other):
+      """ Return a filter selecting all sections needed by this or the other filter. """
+      union = lambda a, b: None if a is None or b is None else a | b
+      return SectionFilter(union(self.nsets, other.nsets), union(self.elsets, other.elsets), self.nodes or other.nodes, self.elems or other.elems)
+   
+   def Key(self):
+      """ A string identifying the selection, e.g. for the mesh cache. """
+      names = lambda s: "*" if s is None else ",".join(sorted(s))
+      return "nsets=%s;elsets=%s;nodes=%d;elems=%d" % (names(self.nsets), names(self.elsets), self.nodes, self.elems)
+   
+class KeywordSection(object):
+   """
+   A keyword line of an .inp file together with the data lines following it, given as byte ranges:
+   the keyword line is [start, dataStart), its data lines are [dataStart, end).
+   """
+   __slots__ = ('keyword', 'readMode', 'params', 'flags', 'start', 'dataStart', 'end')
+   
+   def __init__(self, keyword, readMode, params, flags, start, dataStart, end):
+      self.keyword = keyword
+      self.readMode = readMode
+      self.params = params
+      self.flags = flags
+      self.start = start
+      self.dataStart = dataStart
+      self.end = end
+      
+class KeywordIndex:
+   """
+   Index of all keyword lines (*Node, *Element, *Nset, *Elset, *Part, *Instance, ...) of an .inp file.
+   The file is memory-mapped and searched for line starts with a '*', so building the index costs no
+   more than a single pass over the file at memory speed and no data line is split or converted.
+   Any data lines before the first keyword are indexed as a section with keyword None, read as nodes
+   like the line-by-line parser does.
+   
+   The index keeps the file mapped until Close() is called.
+   """
+   def __init__(self, filename):
+      self.filename = filename
+      self.sections = []
+      
+      with open(filename, 'rb') as f:
+         self.size = os.fstat(f.fileno()).st_size
+         self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else ""
+      
+      starts = []
+      pos = 0 if self.mm[:1] == '*' else self.mm.find('\n*')
+      while pos != -1:
+         if self.mm[pos] == '\n': pos += 1
+         starts.append(pos)
+         pos = self.mm.find('\n*', pos)
+         
+      if len(starts) == 0 or starts[0] > 0:
+         end = starts[0] if len(starts) > 0 else self.size
+         if end > 0: self.sections.append(KeywordSection(None, InpFileParser.READ_NODES, {}, set(), 0, 0, end))
+         
+      for i, start in enumerate(starts):
+         end = starts[i+1] if i+1 < len(starts) else self.size
+         lineEnd = self.mm.find('\n', start, end)
+         dataStart = lineEnd+1 if lineEnd != -1 else end
+         line = self.mm[start:dataStart]
+         keyword = line.split(',', 1)[0].strip()
+         readMode = InpFileParser.KEYWORD_MODES.get(keyword, InpFileParser.UNKNOWN)
+         params, flags = InpFileParser._ParseKeywordParams(line)
+         self.sections.append(KeywordSection(keyword, readMode, params, flags, start, dataStart, end))
+         
+   def Close(self):
+      if self.size > 0: self.mm.close()
+      
+   def KeywordLine(self, section):
+      return self.mm[section.start:section.dataStart]
+   
+   def CountLines(self, start, end):
+      """ Number of lines in the byte range [start, end), counted in windows of CHUNK_BYTES. """
+      count = 0
+      for pos in xrange(start, end, InpFileParser.CHUNK_BYTES):
+         count += self.mm[pos:min(end, pos+InpFileParser.CHUNK_BYTES)].count('\n')
+      if end > start and end == self.size and self.mm[end-1] != '\n': count += 1
+      return count
+   
+class _SectionLoader(object):
+   """ Loads the members of a node or element set from its *Nset/*Elset section in an .inp file when called. """
+   def __init__(self, filename, start, end):
+      self.filename = filename
+      self.start = start
+      self.end = end
+      
+   def __call__(self):
+      builder = MeshBuilder()
+      with open(self.filename, 'rb') as f:
+         builder.Consume(InpFileParser._RecordsFromLines(InpFileParser._ReadLines(f, self.start, self.end)))
+      sets = builder.mesh.nsets + builder.mesh.elsets
+      return sets[0].nodes if len(builder.mesh.nsets) > 0 else sets[0].elems
+   
+class InpFileParser:
+   """
+   This class serves to be able to read an Abaqus .inp-file as an input file and extract
+   all relevant information regarding nodes, elements, node sets, and element sets.
+   
+   It must be initialized with a filename. The number of nodes per element, 'nodesPerElem',
+   can be set or determined automatically from the type of each *Element block. Blocks of element
+   types with different numbers of nodes may be mixed.
+   The method Parse() then reads and interprets the .inp file, returning an AbaqusMesh object
+   on success. The file is streamed line by line through the Records() generator, which can also
+   be consumed directly to process the file without building a mesh.
+   
+   Some basic error handling and warning functionality is present and the parser has been tested
+   with several different input files. Nonetheless, careful inspection of the read data should
+   be carried out in case of any problems.
+   """
+   READ_NODES = 1
+   READ_ELEMS = 2
+   READ_NSET = 3
+   READ_ELSET = 4
+   UNKNOWN = 0
+   KEYWORD = -1
+   DATA_BLOCK = -2
+   UNUSED = -3
+   
+   # dispatch table from keywords to the read mode for the data lines following them,
+   # any keyword not listed here switches to UNKNOWN mode
+   KEYWORD_MODES = { "*Node" : READ_NODES,
+                     "*Element" : READ_ELEMS,
+                     "*Nset" : READ_NSET,
+                     "*Elset" : READ_ELSET }
+   
+   # parallel parsing: *Node/*Element blocks of at least PARALLEL_MIN_BYTES are split
+   # into line-aligned chunks of about CHUNK_BYTES each
+   CHUNK_BYTES = 4 << 20
+   PARALLEL_MIN_BYTES = 1 << 20
+   
+   # bulk conversion: *Node/*Element data is tokenized in blocks of BLOCK_BYTES (indexed files) or
+   # BLOCK_LINES lines (DATA_BLOCK records), small enough for the temporary lists to stay in the CPU caches
+   BLOCK_BYTES = 1 << 18
+   BLOCK_LINES = 1 << 12
+   
+   def __init__(self, filename=None, nodesPerElem=None, jobs=1, lazy=False, select=None):
+      """
+      Initialize the parser with a filename and (optionally) number of nodes per element and
+      number of processes to use for parsing. In lazy mode, the members of node and element sets
+      are only read when they are accessed and sections with unknown keywords are skipped.
+      If a SectionFilter 'select' is given, sections not selected by it are skipped.
+      """
+      self.filename = filename
+      self.nodesPerElem = nodesPerElem
+      self.jobs = jobs
+      self.lazy = lazy
+      self.select = select
+      self.splitBlocks = True # read *Node/*Element sections in line-aligned chunks (see _PlanSegments())
+      self.compression = Compression(filename) if filename is not None else None
+      self.readAhead = False # stream the file, reading it in a separate thread (see _ReadAhead)
+      self.nodesListener = None # called with the mesh after each block of parsed nodes when streaming
+      
+   @staticmethod
+   def _ParseKeywordParams(line):
+      """ Split the parameters of a keyword line like '*Elset, elset=Foo, generate' into a dict and a set of flags. """
+      params = {}
+      flags = set()
+      for p in line.strip().split(',')[1:]:
+         if p.count('=') > 0:
+            var, val = p.split('=', 1)
+            params[var.strip()] = val.strip()
+         elif p.strip() != "":
+            flags.add(p.strip())
+      return params, flags
+   
+   @staticmethod
+   def _RecordsFromLines(lines, lineNumber=1, readMode=READ_NODES, blocks=False, select=None):
+      """
+      Generator yielding the records for an iterable of lines, the first one having the given line number.
+      If 'blocks' is set, consecutive *Node/*Element data lines are gathered into DATA_BLOCK records.
+      Sections not selected by the SectionFilter 'select' are reported with read mode UNUSED.
+      """
+      keywordModes = InpFileParser.KEYWORD_MODES
+      blockModes = (InpFileParser.READ_NODES, InpFileParser.READ_ELEMS) if blocks else ()
+      maxLines = InpFileParser.BLOCK_LINES
+      inBlock = readMode in blockModes
+      block = []
+      blockStart = lineNumber
+      unusedLines = unusedBytes = 0
+      if select is not None: select.Reset()
+      
+      for lineNumber, line in enumerate(lines, lineNumber):
+         if inBlock and not line.startswith("*"):
+            if len(block) == 0: blockStart = lineNumber
+            block.append(line)
+            if len(block) >= maxLines:
+               yield InpFileParser.DATA_BLOCK, blockStart, (readMode, block)
+               block = []
+               
+         elif readMode == InpFileParser.UNUSED and not line.startswith("*"):
+            # count the data lines of unused sections, but don't split them
+            if unusedLines == 0: blockStart = lineNumber
+            unusedLines += 1
+            unusedBytes += len(line)
+            
+         elif line.startswith("*"):
+            if len(block) > 0:
+               yield InpFileParser.DATA_BLOCK, blockStart, (readMode, block)
+               block = []
+            if unusedLines > 0:
+               yield InpFileParser.UNUSED, blockStart, (unusedLines, unusedBytes)
+               unusedLines = unusedBytes = 0
+            readMode = keywordModes.get(line.split(',', 1)[0].strip(), InpFileParser.UNKNOWN)
+            if readMode == InpFileParser.UNKNOWN:
+               yield InpFileParser.KEYWORD, lineNumber, (readMode, None, None)
+            else:
+               params, flags = InpFileParser._ParseKeywordParams(line)
+               if select is not None and not select.Wants(readMode, params): readMode = InpFileParser.UNUSED
+               yield InpFileParser.KEYWORD, lineNumber, (readMode, params, flags)
+            inBlock = readMode in blockModes
+               
+         elif readMode == InpFileParser.UNKNOWN:
+            yield readMode, lineNumber, None
+         
+         else:
+            yield readMode, lineNumber, line.strip().split(',')
+            
+      if len(block) > 0:
+         yield InpFileParser.DATA_BLOCK, blockStart, (readMode, block)
+      if unusedLines > 0:
+         yield InpFileParser.UNUSED, blockStart, (unusedLines, unusedBytes)
+      
+   def Records(self, blocks=False):
+      """
+      Generator reading the .inp file incrementally and yielding one (kind, lineNumber, data) record
+      per line, so that memory consumption does not depend on the file size.
+      
+      For keyword lines, kind is KEYWORD and data is a tuple (readMode, params, flags), where readMode is
+      looked up once in KEYWORD_MODES. For data lines, kind is the current read mode and data is the list
+      of comma-separated fields (None in UNKNOWN mode, where lines are not split at all).
+      
+      If 'blocks' is set, up to BLOCK_LINES consecutive data lines of *Node and *Element sections are yielded
+      as one record with kind DATA_BLOCK, the line number of its first line and data (readMode, list of lines),
+      so that they can be converted in bulk.
+      
+      Keyword lines of sections not selected by the parser's SectionFilter have the read mode UNUSED. Their
+      data lines are not split but yielded as one record with kind UNUSED and data (number of lines, bytes).
+      
+      Compressed files are decompressed in chunks. If 'readAhead' is set, the file is read (and decompressed)
+      in a separate thread while the records of the previous chunks are processed.
+      """
+      if self.compression or self.readAhead:
+         chunks = _FileChunks(self.filename, self.compression)
+         if self.readAhead: chunks = _ReadAhead(chunks)
+         for record in self._RecordsFromLines(_LinesFromChunks(chunks), blocks=blocks, select=self.select):
+            yield record
+         return
+      
+      with open(self.filename, 'r') as f:
+         for record in self._RecordsFromLines(f, blocks=blocks, select=self.select):
+            yield record
+            
+   def _PlanSegments(self, index):
+      """
+      Split the indexed file into a list of segments in file order:
+         ('lines', start, end)         byte range to be parsed line by line in this process
+         ('block', section, tasks)     large *Node/*Element section, parsed in parallel; tasks are the
+                                       arguments of _ParseChunk() for its line-aligned chunks
+         ('bulk', section, tasks)      other *Node/*Element section, whose chunks are parsed in this process
+         ('set', section)              *Nset/*Elset section whose members are read on demand (lazy mode)
+         ('skip', section)             section with unknown keyword, not read at all (lazy mode)
+         ('unused', section)           section not selected by the SectionFilter, not read at all
+      """
+      segments = []
+      lineStart = 0 # start of pending range to be parsed line by line
+      if self.select is not None: self.select.Reset()
+      for section in index.sections:
+         readMode = section.readMode
+         if self.select is not None and section.keyword is not None and not self.select.Wants(readMode, section.params):
+            segment = ('unused', section)
+         elif self.lazy and readMode in (InpFileParser.READ_NSET, InpFileParser.READ_ELSET):
+            segment = ('set', section)
+         elif self.lazy and readMode == InpFileParser.UNKNOWN:
+            segment = ('skip', section)
+         elif self.splitBlocks and readMode in (InpFileParser.READ_NODES, InpFileParser.READ_ELEMS) and section.keyword is not None:
+            parallel = self.jobs > 1 and section.end - section.dataStart >= InpFileParser.PARALLEL_MIN_BYTES
+            numNodes = elemType = None
+            if readMode == InpFileParser.READ_ELEMS:
+               elemType = section.params.get('type')
+               numNodes = self.nodesPerElem or ElementAssembler.NodesForType(elemType)
+            chunkBytes = InpFileParser.CHUNK_BYTES if parallel else InpFileParser.BLOCK_BYTES
+            tasks = [(self.filename, readMode, start, end, numNodes, elemType) for start, end in self._SplitBlock(index.mm, section.dataStart, section.end, chunkBytes)]
+            segment = ('block' if parallel else 'bulk', section, tasks)
+         else: continue
+         
+         if section.start > lineStart: segments.append(('lines', lineStart, section.start))
+         segments.append(segment)
+         lineStart = section.end
+         
+      if index.size > lineStart: segments.append(('lines', lineStart, index.size))
+      return segments
+      
+   @staticmethod
+   def _SplitBlock(mm, start, end, chunkBytes=None):
+      """
+      Split the byte range [start, end) of a data block into chunks of about chunkBytes (default: CHUNK_BYTES),
+      starting at line boundaries. Lines ending with a comma are continued on the next line (wrapped element
+      records), so chunks never start right after such a line.
+      """
+      chunkBytes = chunkBytes or InpFileParser.CHUNK_BYTES
+      chunks = []
+      while end - start > chunkBytes:
+         pos = start + chunkBytes
+         split = -1
+         while pos < end:
+            nl = mm.find('\n', pos, end)
+            if nl == -1: break
+            if mm[max(start, nl-64):nl].rstrip().endswith(','): pos = nl+1; continue
+            split = nl+1
+            break
+         if split == -1 or split >= end: break
+         chunks.append((start, split))
+         start = split
+      chunks.append((start, end))
+      return chunks
+   
+   @staticmethod
+   def _ReadLines(f, start, end):
+      """ Generator yielding the lines in the byte range [start, end) of file f, reading at most CHUNK_BYTES at once. """
+      f.seek(start)
+      rest = ""
+      while start < end:
+         data = f.read(min(InpFileParser.CHUNK_BYTES, end-start))
+         if not data: break
+         start += len(data)
+         lines = (rest + data).splitlines(True)
+         rest = lines.pop() if start < end and not lines[-1].endswith('\n') else ""
+         for line in lines: yield line
+      if rest: yield rest
+      
+   def _ParseIndexed(self, index):
+      """
+      Parse the file following the segments planned from the keyword index. Large *Node/*Element blocks
+      are split into chunks which are parsed in a pool of 'jobs' processes, while all other lines as well as
+      the keyword lines of the parallel blocks are parsed in this process and the chunk results are merged
+      in file order. The chunks of smaller blocks (or of all blocks if jobs is 1) are parsed in this process.
+      In lazy mode, set sections are only indexed and unknown sections skipped.
+      Returns a MeshBuilder.
+      """
+      segments = self._PlanSegments(index)
+      tasks = [task for segment in segments if segment[0] == 'block' for task in segment[2]]
+      
+      pool = None
+      if len(tasks) > 0:
+         log.debug(".Parsing %d chunks with %d processes.", len(tasks), self.jobs)
+         pool = multiprocessing.Pool(self.jobs)
+      try:
+         results = pool.imap(_ParseChunk, tasks) if pool else None
+         builder = MeshBuilder(self.nodesPerElem)
+         lineNumber = 1
+         with open(self.filename, 'rb') as f:
+            for segment in segments:
+               if segment[0] == 'lines':
+                  lineNumber += builder.Consume(self._RecordsFromLines(self._ReadLines(f, segment[1], segment[2]), lineNumber, blocks=True))
+                  
+               elif segment[0] in ('block', 'bulk'):
+                  section, blockTasks = segment[1], segment[2]
+                  lineNumber += builder.Consume(self._RecordsFromLines([index.KeywordLine(section)], lineNumber))
+                  for task in blockTasks:
+                     chunk, numLines, pending = results.next() if segment[0] == 'block' else _ParseChunk(task, lineNumber)
+                     if pending != 0 and task is not blockTasks[-1]:
+                        raise ChunkAlignmentError("Chunk starting at line %d ends within an element record." % lineNumber)
+                     builder.Append(chunk, pending)
+                     lineNumber += numLines
+                     
+               elif segment[0] == 'unused':
+                  section = segment[1]
+                  keywordLines = index.CountLines(section.start, section.dataStart)
+                  numLines = index.CountLines(section.dataStart, section.end)
+                  builder.Consume([(InpFileParser.KEYWORD, lineNumber, (InpFileParser.UNUSED, section.params, section.flags)),
+                                   (InpFileParser.UNUSED, lineNumber + keywordLines, (numLines, section.end - section.dataStart))])
+                  lineNumber += keywordLines + numLines
+                  
+               else:
+                  section = segment[1]
+                  if segment[0] == 'set':
+                     builder.AddDeferredSet(section, _SectionLoader(self.filename, section.start, section.end))
+                  else:
+                     builder.SkipSection(section)
+                  lineNumber += index.CountLines(section.start, section.end)
+                  
+         if pool: pool.close()
+         return builder
+      finally:
+         if pool: pool.terminate()
+         
+   def Parse(self):
+      log.info("Parsing input file '%s'.", self.filename)
+      
+      # compressed files cannot be memory-mapped for the keyword index and are streamed instead
+      streamed = self.compression or self.readAhead
+      if self.compression:
+         log.debug(".Decompressing %s input file, parsing it serially.", self.compression)
+      if self.readAhead:
+         log.debug(".Reading input file in a separate thread, parsing it serially.")
+         
+      if not streamed:
+         index = KeywordIndex(self.filename)
+         try:
+            try: builder = self._ParseIndexed(index)
+            except ChunkAlignmentError as e:
+               log.warning("%s Falling back to serial parsing.", e)
+               self.splitBlocks = False
+               try: builder = self._ParseIndexed(index)
+               finally: self.splitBlocks = True
+         finally:
+            index.Close()
+      
+      else:
+         builder = MeshBuilder(self.nodesPerElem)
+         builder.nodesListener = self.nodesListener
+         builder.Consume(self.Records(blocks=True))
+      builder.Finish()
+      
+      mesh = builder.mesh
+      if mesh.nodesPerElem == AbaqusMesh.MIXED:
+         types = ", ".join(["%s: %d nodes" % (name or "unknown type", nel) for name, nel in zip(mesh.typeNames, mesh.typeNodes)])
+         log.debug(".Parsed %d nodes (ndim=%d) and %d elements (%s).", mesh.NumNodes(), mesh.nDim, mesh.NumElems(), types)
+      else:
+         log.debug(".Parsed %d nodes (ndim=%d) and %d elements (nodes per element=%d).", mesh.NumNodes(), mesh.nDim, mesh.NumElems(), mesh.nodesPerElem)
+      if len(mesh.nsets)>0:
+         log.debug(".Parsed %d node sets and %d element sets", len(mesh.nsets), len(mesh.elsets))
+      if len(builder.ignoredLines)>0: log.debug(".Ignored lines with unknown input: %s", ", ".join([str(l) for l in builder.ignoredLines]))
+      if builder.skippedSections>0: log.debug(".Skipped %d sections with unknown keywords.", builder.skippedSections)
+      if builder.unusedSections>0:
+         log.debug(".Skipped %d unused sections (%d lines, %.1f MB).", builder.unusedSections, builder.unusedLines, builder.unusedBytes / 1e6)
+      
+      log.info("Successfully read input file.")
+      
+      return mesh
+   
+class ChunkAlignmentError(Exception):
+   """ Raised if a chunk of an *Element block parsed in parallel does not end at an element boundary. """
+   pass
+   
+def _ParseChunk(task, lineNumber=None):
+   """
+   Worker function for parallel parsing. Parses a byte range of a *Node or *Element block (nodes per
+   element given by numNodes, or None for one element per line; element type elemType) into a new AbaqusMesh.
+   Returns that mesh, the number of lines parsed and the number of integers left over from an incomplete
+   element record. Invalid lines are reported with their line number if the number of the chunk's first
+   line is given, otherwise relative to the chunk.
+   """
+   filename, readMode, start, end, numNodes, elemType = task
+   with open(filename, 'rb') as f:
+      f.seek(start)
+      text = f.read(end-start)
+   numLines = text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+   
+   builder = MeshBuilder(numNodes)
+   chunk = builder.mesh
+   pending = 0
+   if readMode == InpFileParser.READ_ELEMS and numNodes is not None:
+      builder.assembler = ElementAssembler(chunk, numNodes, elemType)
+   builder.elemType = elemType
+   try:
+      builder.AddDataBlock(readMode, text, numLines, lineNumber or 1)
+   except ValueError as e:
+      if lineNumber is not None: raise
+      raise ValueError("%s (counted from the chunk starting at byte %d)" % (e, start))
+   if builder.assembler is not None: pending = builder.assembler.Pending()
+   return chunk, numLines, pending
+   
+class MeshBuilder:
+   """
+   Builds an AbaqusMesh from the (kind, lineNumber, data) records produced by an InpFileParser.
+   All state between records (current node or element set, element assembler) is kept in the
+   builder, so records can be consumed in several portions and merged with partial meshes parsed
+   elsewhere (see InpFileParser._ParseIndexed()).
+   """
+   def __init__(self, nodesPerElem=None):
+      self.nodesPerElem = nodesPerElem
+      self.mesh = AbaqusMesh(nodesPerElem=nodesPerElem if nodesPerElem != None else -1)
+      
+      self.assembler = None # assembles elements of known size from the current *Element block
+      self.elemType = None # element type of the current *Element block
+      self.curNset = None
+      self.curElset = None
+      self.ignoredLines = []
+      self.skippedSections = 0
+      self.unusedSections = 0 # sections not selected by the parser's SectionFilter
+      self.unusedLines = 0
+      self.unusedBytes = 0
+      self.nodesListener = None # called with the mesh after each DATA_BLOCK record of nodes
+      
+   def _ElementAssembler(self, elemType):
+      """
+      Create an ElementAssembler for an *Element block with the given type, or return None if the
+      number of nodes per element can be determined neither from the parser settings nor from the type.
+      """
+      typeNodes = ElementAssembler.NodesForType(elemType)
+      
+      if self.nodesPerElem is not None:
+         if typeNodes is not None and typeNodes != self.nodesPerElem:
+            log.warning("Element type %s has %d nodes, using %d nodes per element as specified.", elemType, typeNodes, self.nodesPerElem)
+         return ElementAssembler(self.mesh, self.nodesPerElem, elemType)
+      
+      if typeNodes is not None:
+         if self.mesh.nodesPerElem == -1:
+            log.debug(".Assuming %d nodes per element (element type %s).", typeNodes, elemType)
+         elif (elemType or "") not in self.mesh.typeNames:
+            log.debug(".Adding elements of type %s with %d nodes.", elemType, typeNodes)
+         return ElementAssembler(self.mesh, typeNodes, elemType)
+      
+      return None
+   
+   def _EndElementBlock(self):
+      # check if the previous element block was completely processed, otherwise there might be misaligned input data
+      if self.assembler is not None and self.assembler.Pending() != 0:
+         log.warning("There are still %d unprocessed element input entries.", self.assembler.Pending())
+      self.assembler = None
+      
+   def Consume(self, records):
+      """ Add all records to the mesh. Returns the number of records consumed. """
+      mesh = self.mesh
+      curNset = self.curNset
+      curElset = self.curElset
+      numRecords = 0
+      
+      for kind, lineNumber, data in records:
+         numRecords += 1
+         
+         if kind == InpFileParser.DATA_BLOCK:
+            readMode, lines = data
+            numRecords += len(lines) - 1
+            if readMode == InpFileParser.READ_ELEMS: self._CheckElemSize(lines[0].split(','))
+            self.AddDataBlock(readMode, "".join(lines), len(lines), lineNumber)
+            if readMode == InpFileParser.READ_NODES and self.nodesListener is not None: self.nodesListener(mesh)
+            
+         elif kind == InpFileParser.READ_NODES or kind == InpFileParser.READ_ELEMS:
+            if kind == InpFileParser.READ_ELEMS: self._CheckElemSize(data)
+            self._AddDataLine(kind, data, lineNumber)
+                  
+         elif kind == InpFileParser.READ_NSET:
+            self._AddMembers(curNset.nodes, curNset.generate, data)
+               
+         elif kind == InpFileParser.READ_ELSET:
+            self._AddMembers(curElset.elems, curElset.generate, data)
+            
+         elif kind == InpFileParser.UNKNOWN:
+            self.ignoredLines.append(lineNumber)
+            
+         elif kind == InpFileParser.UNUSED:
+            numLines, numBytes = data
+            numRecords += numLines - 1
+            self.unusedLines += numLines
+            self.unusedBytes += numBytes
+            
+         elif kind == InpFileParser.KEYWORD:
+            readMode, params, flags = data
+            
+            self._EndElementBlock()
+            
+            if readMode == InpFileParser.UNUSED:
+               self.unusedSections += 1
+            
+            elif readMode == InpFileParser.READ_ELEMS:
+               self.elemType = params.get('type')
+               self.assembler = self._ElementAssembler(self.elemType)
+               
+            elif readMode == InpFileParser.READ_NSET:
+               curNset = NodeSet()
+               curNset.name = params.get('nset', "UNKNOWN_NSET")
+               curNset.generate = 'generate' in flags
+               mesh.nsets.append(curNset)
+               
+            elif readMode == InpFileParser.READ_ELSET:
+               curElset = ElSet()
+               curElset.name = params.get('elset', "UNKNOWN_ELSET")
+               curElset.generate = 'generate' in flags
+               mesh.elsets.append(curElset)
+               
+      self.curNset = curNset
+      self.curElset = curElset
+      return numRecords
+   
+   def _CheckElemSize(self, fields):
+      """ Announce the number of nodes per element if it is taken from the first line of an *Element section of unknown type. """
+      if self.assembler is None and self.mesh.nodesPerElem == -1:
+         log.debug(".Assuming %d nodes per element.", len([s for s in fields if s.strip()!=""])-1)
+         
+   def _AddDataLine(self, readMode, fields, lineNumber):
+      """ Add the fields of one *Node or *Element data line, reporting invalid input with the line number. """
+      try:
+         if readMode == InpFileParser.READ_NODES:
+            self.mesh.AddNode(*fields)
+         elif self.assembler is not None:
+            self.assembler.Feed(fields)
+         else:
+            # number of nodes unknown, assume one element per line
+            args = [s for s in fields if s.strip()!=""]
+            self.mesh.AddElem(args[0], args[1:], elemType=self.elemType)
+      except (ValueError, IndexError) as e:
+         raise ValueError("Error: Invalid input in line %d: %s" % (lineNumber, e))
+      
+   def AddDataBlock(self, readMode, text, numLines, lineNumber):
+      """
+      Add 'numLines' data lines of a *Node or *Element section, given as one string 'text', the first one having
+      the given line number. All fields are converted in one step; only if that fails, the lines are added one by
+      one to find and report the invalid input.
+      """
+      if readMode == InpFileParser.READ_NODES:
+         if self.mesh.AddNodeBlock(text, numLines): return
+      elif self.assembler is not None:
+         try: return self.assembler.FeedBlock(text)
+         except (ValueError, OverflowError): pass
+         
+      for lineNumber, line in enumerate(text.splitlines(), lineNumber):
+         self._AddDataLine(readMode, line.strip().split(','), lineNumber)
+   
+   @staticmethod
+   def _AddMembers(ids, generate, data):
+      """ Add the IDs of a data line of an *Nset/*Elset section to the IdSet 'ids'. Lines of generated sets are ranges (from, to, increment). """
+      fields = [s for s in data if s.strip()!=""]
+      if generate:
+         if len(fields)!= 3: raise BaseException("Error: Invalid number of arguments (%d) for generated set - need 3 args (from, to, increment)" % len(fields))
+         ids.AddRange(int(fields[0]), int(fields[1]), int(fields[2]))
+      else:
+         ids.extend([int(s) for s in fields])
+         
+   def AddDeferredSet(self, section, loader):
+      """ Add a node or element set for an *Nset/*Elset section, whose members will be read by 'loader' on first access. """
+      self._EndElementBlock()
+      self.curNset = self.curElset = None
+      
+      if section.readMode == InpFileParser.READ_NSET:
+         nset = NodeSet()
+         nset.name = section.params.get('nset', "UNKNOWN_NSET")
+         nset.generate = 'generate' in section.flags
+         nset.Defer(loader)
+         self.mesh.nsets.append(nset)
+      else:
+         elset = ElSet()
+         elset.name = section.params.get('elset', "UNKNOWN_ELSET")
+         elset.generate = 'generate' in section.flags
+         elset.Defer(loader)
+         self.mesh.elsets.append(elset)
+         
+   def SkipSection(self, section):
+      """ Skip a section with unknown keyword without reading its data lines. """
+      self._EndElementBlock()
+      self.skippedSections += 1
+      
+   def Append(self, chunk, pending=0):
+      """
+      Append the nodes and elements of a partial mesh parsed from a chunk of the current *Node or *Element
+      block. 'pending' is the number of integers left over from an incomplete element at the end of the chunk.
+      """
+      mesh = self.mesh
+      if chunk.NumNodes() > 0:
+         if mesh.nDim == -1: mesh.nDim = chunk.nDim
+         elif chunk.nDim != mesh.nDim:
+            raise ValueError("Node %d spatial dimension %d doesn't match mesh dimension %d." % (chunk.nodeIds[0], chunk.nDim, mesh.nDim))
+         mesh.nodeIds.extend(chunk.nodeIds)
+         mesh.coords.extend(chunk.coords)
+         
+      if chunk.NumElems() > 0:
+         if mesh.nodesPerElem == -1 and self.assembler is None:
+            log.debug(".Assuming %d nodes per element.", chunk.nodesPerElem)
+         try: typeMap = [mesh.TypeIndex(name, nel) for name, nel in zip(chunk.typeNames, chunk.typeNodes)]
+         except ValueError as e: raise ValueError("Element %d: %s" % (chunk.elemIds[0], e))
+         
+         # shift the chunk's offsets behind the existing connectivity and translate its type indices
+         base = len(mesh.elemNodes)
+         mesh.elemOffsets.extend(array('i', [base + offset for offset in chunk.elemOffsets[1:]]))
+         if len(typeMap) == 1: mesh.elemTypes.extend(array('H', typeMap) * chunk.NumElems())
+         else: mesh.elemTypes.extend(array('H', [typeMap[t] for t in chunk.elemTypes]))
+         mesh.elemIds.extend(chunk.elemIds)
+         mesh.elemNodes.extend(chunk.elemNodes)
+         mesh.elemMats.extend(chunk.elemMats)
+         
+      if pending != 0:
+         log.warning("There are still %d unprocessed element input entries.", pending)
+         
+   def Finish(self):
+      """ Called after the last record. """
+      self._EndElementBlock()
+      
+class CustomInput:
+   """
+   This is a rudimentary helper class allowing to generate custom input blocks for FEAP input files.
+   It will just print the contents of its 'block' member variable to open the block (e.g. 'vbou' to start
+   defining additional boundary conditions) and continue printing 
+   
+   Important member variables:
+      - block     (str)            Type of input command (e.g. 'vbou', 'link', 'eloa', anything.
+      - cards     (list of strs)   List of input card as specified for the respective FEAP command,
+                                   separated by line breaks when written to the FEAP input file. 
+      - pos       (int)            Determines the position of the custom input block. If pos <= 0,
+                                   the custom input is written before applying boun/load commands
+                                   emanating from node sets. For pos > 0 it is written afterwards
+                                   (in this case, one could also include it into the footer).
+   """
+   def __init__(self, block="UNKNOWN", pos=1, cards=[]):
+      self.block = block
+      self.pos = pos
+      self.cards = cards
+      
+   def __str__(self):
+      s = ""
+      s+= self.block + "\n"
+      s+= "\n".join(self.cards)
+      return s
+            
+class NodeRenumberer:
+   """
+   Renumbers the nodes of an AbaqusMesh to the IDs 1..N. FEAP's profile solver is sensitive to the
+   node numbering, so the default ordering method is Reverse Cuthill-McKee ("rcm"), which reduces
+   the profile and bandwidth of the stiffness matrix: starting from a pseudo-peripheral node (found
+   as by George and Liu) of each connected part of the mesh, nodes are numbered in breadth-first
+   order, visiting the neighbors of each node by increasing degree, and the order is finally
+   reversed. Method "compact" keeps the order of the node IDs and only removes gaps.
+   
+   The node adjacency is derived from the element connectivity and stored in compressed form, as
+   offsets into one flat array of neighbor rows. Apply() rewrites the node columns (sorted by their new
+   IDs), the element connectivity and all node sets.
+   """
+   METHODS = ["rcm", "compact"]
+   
+   def __init__(self, mesh):
+      self.mesh = mesh
+      
+   @staticmethod
+   def Metrics(elemNodes, elemOffsets):
+      """
+      Return (profile, bandwidth) of the node numbering used in the CSR connectivity 'elemNodes'/'elemOffsets'. The bandwidth
+      is the largest difference of node IDs within an element, the profile the sum of the differences between
+      each node ID and the smallest ID connected to it.
+      """
+      first = {}
+      bandwidth = 0
+      for elem in xrange(len(elemOffsets)-1):
+         nodes = elemNodes[elemOffsets[elem]:elemOffsets[elem+1]]
+         lo = min(nodes)
+         bandwidth = max(bandwidth, max(nodes) - lo)
+         for n in nodes:
+            if first.get(n, n) > lo: first[n] = lo
+      return sum([n - lo for n, lo in first.iteritems()]), bandwidth
+   
+   def _Adjacency(self):
+      """ Return (offsets, neighbors): the rows of the nodes adjacent to node row v are neighbors[offsets[v]:offsets[v+1]]. """
+      mesh = self.mesh
+      elemOffsets = mesh.elemOffsets
+      numNodes = mesh.NumNodes()
+      rowOf = mesh.NodeRowIndex()
+      try:
+         conn = array('i', [rowOf[nid] for nid in mesh.elemNodes])
+      except KeyError as e:
+         raise ValueError("Error: Cannot renumber nodes, node %d used by an element is not defined." % e.args[0])
+      
+      # elements incident to each node
+      counts = array('i', [0]) * (numNodes+1)
+      for row in conn: counts[row+1] += 1
+      for row in xrange(numNodes): counts[row+1] += counts[row]
+      incidence = array('i', [0]) * len(conn)
+      fill = array('i', counts)
+      for elem in xrange(mesh.NumElems()):
+         for row in conn[elemOffsets[elem]:elemOffsets[elem+1]]:
+            incidence[fill[row]] = elem
+            fill[row] += 1
+         
+      offsets = array('i', [0])
+      neighbors = array('i')
+      for row in xrange(numNodes):
+         adjacent = set()
+         for elem in incidence[counts[row]:counts[row+1]]:
+            adjacent.update(conn[elemOffsets[elem]:elemOffsets[elem+1]])
+         adjacent.discard(row)
+         neighbors.extend(adjacent)
+         offsets.append(len(neighbors))
+      return offsets, neighbors
+   
+   @staticmethod
+   def _Levels(start, offsets, neighbors):
+      """ Breadth-first level structure (list of lists of node rows) of the part of the mesh containing 'start'. """
+      seen = set([start])
+      levels = []
+      level = [start]
+      while len(level) > 0:
+         levels.append(level)
+         nextLevel = []
+         for v in level:
+            for w in neighbors[offsets[v]:offsets[v+1]]:
+               if w not in seen:
+                  seen.add(w)
+                  nextLevel.append(w)
+         level = nextLevel
+      return levels
+   
+   def RcmOrder(self):
+      """ Return the node rows in Reverse Cuthill-McKee order. """
+      offsets, neighbors = self._Adjacency()
+      numNodes = self.mesh.NumNodes()
+      degree = array('i', [offsets[v+1] - offsets[v] for v in xrange(numNodes)])
+      
+      order = array('i')
+      visited = bytearray(numNodes)
+      for seed in sorted(xrange(numNodes), key=degree.__getitem__):
+         if visited[seed]: continue
+         
+         # pseudo-peripheral node: start from the last level of the deepest level structure
+         start = seed
+         levels = self._Levels(start, offsets, neighbors)
+         while True:
+            candidate = min(levels[-1], key=degree.__getitem__)
+            candidateLevels = self._Levels(candidate, offsets, neighbors)
+            if len(candidateLevels) <= len(levels): break
+            start, levels = candidate, candidateLevels
+            
+         # Cuthill-McKee: breadth-first, unvisited neighbors by increasing degree
+         visited[start] = 1
+         head = len(order)
+         order.append(start)
+         while head < len(order):
+            v = order[head]
+            head += 1
+            adjacent = [w for w in neighbors[offsets[v]:offsets[v+1]] if not visited[w]]
+            adjacent.sort(key=degree.__getitem__)
+            for w in adjacent: visited[w] = 1
+            order.extend(adjacent)
+            
+      order.reverse()
+      return order
+   
+   def CompactOrder(self):
+      """ Return the node rows sorted by node ID. """
+      nodeIds = self.mesh.nodeIds
+      return array('i', sorted(xrange(len(nodeIds)), key=nodeIds.__getitem__))
+   
+   def Apply(self, order):
+      """ Give node row order[i] the ID i+1 and rewrite nodes, elements and node sets accordingly. """
+      mesh = self.mesh
+      nDim = mesh.nDim
+      newIds = array('i', [0]) * len(order)
+      for i, row in enumerate(order): newIds[row] = i+1
+      newIdOf = dict(izip(mesh.nodeIds, newIds))
+      
+      coords = mesh.coords
+      mesh.coords = array('d')
+      for row in order: mesh.coords.extend(coords[row*nDim:(row+1)*nDim])
+      mesh.nodeIds = array('i', xrange(1, len(order)+1))
+      try:
+         mesh.elemNodes = array('i', [newIdOf[nid] for nid in mesh.elemNodes])
+      except KeyError as e:
+         raise ValueError("Error: Cannot renumber nodes, node %d used by an element is not defined." % e.args[0])
+      
+      for nset in mesh.nsets:
+         missing = [nid for nid in nset.nodes if nid not in newIdOf]
+         if len(missing) > 0:
+            log.warning("Dropping %d undefined nodes (e.g. %d) from nset %s.", len(missing), missing[0], nset.name)
+         nset.nodes = [newIdOf[nid] for nid in nset.nodes if nid in newIdOf]
+         
+   def Renumber(self, method="rcm"):
+      """ Renumber the nodes with the given method and report the profile and bandwidth before and after. """
+      mesh = self.mesh
+      before = NodeRenumberer.Metrics(mesh.elemNodes, mesh.elemOffsets)
+      self.Apply(self.RcmOrder() if method == "rcm" else self.CompactOrder())
+      after = NodeRenumberer.Metrics(mesh.elemNodes, mesh.elemOffsets)
+      log.debug(".Renumbered %d nodes (%s): profile %d -> %d, bandwidth %d -> %d.", mesh.NumNodes(), method, before[0], after[0], before[1], after[1])
+      
+class NodeMerger:
+   """
+   Merges coincident nodes of an AbaqusMesh, e.g. the edge nodes shared by parts which were meshed separately and
+   carry different IDs, so that FEAP would see the parts as disconnected. Nodes closer than 'tol' are merged
+   (transitively) into the one with the smallest ID: element connectivity and node sets are remapped to the
+   surviving IDs and the merged nodes are dropped.
+   
+   Candidates are found by a spatial hash of the quantized coordinates in near-linear time. With cells of edge
+   length 2*tol, two nodes closer than tol share a cell in at least one of the 2^nDim grids shifted by 0 or tol
+   along each axis. The cell keys of all nodes are computed column by column and sorted for each grid (in C by
+   itertools and the builtin sorted), so only the few nodes sharing a cell with another one are looked at in Python.
+   """
+   def __init__(self, mesh, tol):
+      self.mesh = mesh
+      self.tol = float(tol)
+      
+   def _Cells(self):
+      """ Generator yielding the lists of rows of all nodes sharing a cell, for each of the shifted grids. """
+      mesh = self.mesh
+      nDim = mesh.nDim
+      numNodes = mesh.NumNodes()
+      cMin, cMax = mesh.BoundingBox()
+      
+      # cell keys are stored as machine integers unless the number of cells exceeds their range
+      shape = [int((cMax[d] - cMin[d]) * (1. / self.tol)) // 2 + 2 for d in xrange(nDim)]
+      Column = list if reduce(mul, shape) > sys.maxint else lambda values: array('l', values)
+      
+      # index of each node along each axis in the grids shifted by 0 and by tol, derived from its index q in a grid of
+      # cells of size tol as q>>1 and (q+1)>>1, and multiplied by the stride of the axis in the combined cell key
+      axisKeys = []
+      stride = 1
+      for d in xrange(nDim):
+         q = Column(imap(int, imap(mul, imap(sub, mesh.coords[d::nDim], repeat(cMin[d])), repeat(1. / self.tol))))
+         axisKeys.append((Column(imap(mul, imap(rshift, q, repeat(1)), repeat(stride))),
+                          Column(imap(mul, imap(rshift, imap(add, q, repeat(1)), repeat(1)), repeat(stride)))))
+         stride *= shape[d]
+      del q
+      
+      for shift in product((0, 1), repeat=nDim):
+         keys = axisKeys[0][shift[0]]
+         for d in xrange(1, nDim): keys = Column(imap(add, keys, axisKeys[d][shift[d]]))
+         # keys of more than one node are equal to their neighbor in sorted order
+         sortedKeys = sorted(keys)
+         shared = set(compress(sortedKeys, imap(eq, sortedKeys, islice(sortedKeys, 1, None))))
+         if len(shared) == 0: continue
+         cells = {}
+         for row in compress(xrange(numNodes), imap(shared.__contains__, keys)):
+            cells.setdefault(keys[row], []).append(row)
+         for rows in cells.itervalues(): yield rows
+         
+   def Survivors(self):
+      """ Return a dict mapping the rows of all nodes to be merged to the row of the node they are merged into. """
+      mesh = self.mesh
+      nDim = mesh.nDim
+      coords, nodeIds = mesh.coords, mesh.nodeIds
+      tol2 = self.tol ** 2
+      parent = {}
+      
+      def Root(row):
+         while parent.get(row, row) != row: row = parent[row]
+         return row
+      
+      for rows in self._Cells():
+         for i, a in enumerate(rows):
+            pa = coords[a*nDim:(a+1)*nDim]
+            for b in rows[i+1:]:
+               if sum([(pa[d] - coords[b*nDim+d]) ** 2 for d in xrange(nDim)]) > tol2: continue
+               ra, rb = Root(a), Root(b)
+               if ra == rb: continue
+               # the node with the smaller ID survives
+               if nodeIds[rb] < nodeIds[ra]: ra, rb = rb, ra
+               parent[rb] = ra
+               
+      return dict((row, Root(row)) for row in parent if Root(row) != row)
+   
+   def Merge(self):
+      """ Merge the coincident nodes and report how many were merged. Returns the number of merged (dropped) nodes. """
+      mesh = self.mesh
+      nDim = mesh.nDim
+      if mesh.NumNodes() == 0: return 0
+      survivors = self.Survivors()
+      if len(survivors) == 0:
+         log.debug(".No coincident nodes found (tolerance %g).", self.tol)
+         return 0
+      nodeIds = mesh.nodeIds
+      idMap = dict((nodeIds[row], nodeIds[root]) for row, root in survivors.iteritems())
+      
+      # connectivity: dict.get(id, id) keeps all IDs which are not merged
+      mesh.elemNodes = array('i', imap(idMap.get, mesh.elemNodes, mesh.elemNodes))
+      targets = set(idMap.itervalues())
+      collapsed = [row for row in mesh.ElemRowsUsing(targets) if len(set(mesh.ElemNodes(row))) < mesh.elemOffsets[row+1] - mesh.elemOffsets[row]]
+      
+      for nset in mesh.nsets:
+         nodes = list(nset.nodes)
+         if any(nid in idMap for nid in nodes):
+            nset.nodes = sorted(set(idMap.get(nid, nid) for nid in nodes))
+            
+      # drop the merged nodes, column by column
+      keep = [True] * mesh.NumNodes()
+      for row in survivors: keep[row] = False
+      coords = mesh.coords
+      mesh.nodeIds = array('i', compress(nodeIds, keep))
+      mesh.coords = array('d', [0.]) * (len(mesh.nodeIds) * nDim)
+      for d in xrange(nDim): mesh.coords[d::nDim] = array('d', compress(coords[d::nDim], keep))
+      
+      log.debug(".Merged %d coincident nodes into %d (tolerance %g), %d nodes remain.", len(survivors), len(targets), self.tol, mesh.NumNodes())
+      examples = sorted(idMap.items())[:5]
+      log.debug(".Merged nodes (merged -> surviving ID): %s%s", ", ".join(["%d -> %d" % e for e in examples]), ", ..." if len(idMap) > len(examples) else "")
+      if len(collapsed) > 0:
+         log.warning("%d elements have coincident nodes after merging with tolerance %g (e.g. element %d).", len(collapsed), self.tol, mesh.elemIds[collapsed[0]])
+      return len(survivors)
+   
+class MeshValidator:
+   """
+   Checks the integrity of a parsed AbaqusMesh before it is converted, so that errors show up right away
+   instead of in FEAP: duplicate node and element IDs, elements and node sets referring to undefined
+   nodes, elements with repeated nodes, element types of another spatial dimension than the nodes and
+   nodes not used by any element. All checks work on whole columns, the node IDs are collected in
+   IdBitmaps (a byte per ID) and the element connectivity is compared column by column, so the mesh is
+   checked in linear time at the speed of the builtins. Only the (usually few) offending IDs are looked
+   at individually.
+   
+   Validate() returns the report as a dict with the number of errors and warnings and one entry per
+   check, which is saved as JSON by the command line option --validate.
+   """
+   ERROR = "error"
+   WARNING = "warning"
+   MAX_EXAMPLES = 5
+   
+   # spatial dimension of Abaqus element families, by the beginning of the element type name
+   TYPE_DIMS = ((re.compile(r"(DC|C|M|T|R)3D|SC?\d|STRI|B3"), 3), (re.compile(r"CPS|CPE|CG?AX|(DC|T|R)2D|B2"), 2))
+   
+   def __init__(self, mesh):
+      self.mesh = mesh
+      self.checks = []
+      
+   @staticmethod
+   def TypeDim(elemType):
+      """ Return the spatial dimension of the Abaqus element type 'elemType', or None if unknown. """
+      for pattern, nDim in MeshValidator.TYPE_DIMS:
+         if pattern.match(elemType.upper()): return nDim
+      return None
+   
+   @staticmethod
+   def _Duplicates(ids, distinct):
+      """ Return the IDs occurring more than once in the array 'ids', given the set (IdBitmap) of its 'distinct' IDs. """
+      if len(distinct) == len(ids): return []
+      ids = sorted(ids)
+      return sorted(set(compress(islice(ids, 1, None), imap(eq, islice(ids, 1, None), ids))))
+   
+   def _Check(self, name, severity, message, count, examples):
+      """ Add the result of a check with 'count' findings, described by 'message', to the report. """
+      self.checks.append({ "check" : name, "severity" : severity, "message" : message, "count" : count,
+                           "examples" : list(examples)[:MeshValidator.MAX_EXAMPLES] })
+      
+   def _DegenerateRows(self):
+      """ Return the rows of all elements with repeated nodes. """
+      mesh = self.mesh
+      rows = []
+      for typeIndex, start, end in mesh.TypeRuns():
+         numNodes = mesh.typeNodes[typeIndex]
+         if numNodes < 2: continue
+         first, last = mesh.elemOffsets[start], mesh.elemOffsets[end]
+         columns = [mesh.elemNodes[first+i:last:numNodes] for i in xrange(numNodes)]
+         rows.extend(compress(xrange(start, end), imap(ne, imap(len, imap(set, izip(*columns))), repeat(numNodes))))
+      return rows
+   
+   def Validate(self):
+      """ Run all checks and return the report. """
+      mesh = self.mesh
+      elemIds = mesh.elemIds
+      self.checks = []
+      
+      nodeSet = IdBitmap(mesh.nodeIds)
+      duplicates = MeshValidator._Duplicates(mesh.nodeIds, nodeSet)
+      self._Check("duplicateNodeIds", MeshValidator.ERROR, "node IDs are defined more than once", len(duplicates), duplicates)
+      duplicates = MeshValidator._Duplicates(elemIds, IdBitmap(elemIds))
+      self._Check("duplicateElemIds", MeshValidator.ERROR, "element IDs are defined more than once", len(duplicates), duplicates)
+      
+      used = IdBitmap(mesh.elemNodes)
+      missing = set(used.Difference(nodeSet))
+      rows = mesh.ElemRowsUsing(missing) if missing else []
+      self._Check("undefinedElemNodes", MeshValidator.ERROR, "elements refer to undefined nodes", len(rows),
+                  ["%d (node %d)" % (elemIds[row], min(missing.intersection(mesh.ElemNodes(row)))) for row in rows[:MeshValidator.MAX_EXAMPLES]])
+      rows = self._DegenerateRows()
+      self._Check("degenerateElems", MeshValidator.ERROR, "elements have repeated nodes", len(rows), imap(elemIds.__getitem__, rows))
+      
+      wrongTypes = [(name, mesh.elemTypes.count(index)) for index, name in enumerate(mesh.typeNames)
+                    if name and MeshValidator.TypeDim(name) not in (None, mesh.nDim)]
+      self._Check("elemDimension", MeshValidator.ERROR, "elements are of a type for another spatial dimension than the %dD nodes" % mesh.nDim,
+                  sum(count for name, count in wrongTypes), [name for name, count in wrongTypes])
+      
+      count, examples = 0, []
+      for nset in mesh.nsets:
+         missing = nodeSet.Missing(nset.nodes)
+         if len(missing) == 0: continue
+         count += len(missing)
+         examples.append("%s (node %d)" % (nset.name, missing[0]))
+      self._Check("undefinedNsetNodes", MeshValidator.ERROR, "members of node sets are undefined nodes", count, examples)
+      
+      unused = nodeSet.Difference(used)
+      self._Check("unusedNodes", MeshValidator.WARNING, "nodes are not used by any element", len(unused), unused)
+      
+      return { "nodes" : mesh.NumNodes(), "elems" : mesh.NumElems(), "nDim" : mesh.nDim, "checks" : self.checks,
+               "errors" : sum(check["count"] for check in self.checks if check["severity"] == MeshValidator.ERROR),
+               "warnings" : sum(check["count"] for check in self.checks if check["severity"] == MeshValidator.WARNING) }
+   
+   @staticmethod
+   def Report(report):
+      """ Print the findings of a report returned by Validate(). """
+      log.info("Validated mesh with %d nodes and %d elements: %d errors, %d warnings.", report["nodes"], report["elems"], report["errors"], report["warnings"])
+      for check in report["checks"]:
+         if check["count"] == 0: continue
+         Log = log.error if check["severity"] == MeshValidator.ERROR else log.warning
+         Log("%d %s (e.g. %s).", check["count"], check["message"], ", ".join(map(str, check["examples"])))
+   
+class NodeSelection:
+   """
+   Geometric selection of the nodes of a config nset, given as a dict like {"x": "min"}, {"z": 2.5, "tol": 0.01} or
+   {"x": [0, 10], "y": [0, 5]}. Each axis (x, y, z) is restricted either to a plane, given by a coordinate or by
+   "min"/"max" of the mesh's bounding box, or to a closed range [lo, hi] whose bounds may also be "min"/"max".
+   Axes not given are unrestricted. All bounds are widened by 'tol', which defaults to TOLERANCE times the largest
+   extent of the bounding box.
+   Coordinates refer to the nodes as read from the .inp file: the selection is made before "centerMesh" moves
+   the origin, so it doesn't depend on centering, but differs from the coordinates written to the coor block.
+   """
+   AXES = "xyz"
+   TOLERANCE = 1e-6
+   
+   def __init__(self, spec):
+      self.spec = spec
+      self.bounds = {} # axis index -> (lo, hi), each a number or "min"/"max"
+      self.tol = None
+      for var, value in spec.iteritems():
+         if var == "tol":
+            if type(value) not in (int, float) or value < 0:
+               raise ValueError("Error: Invalid tolerance %r in node selection, expected a number >= 0." % (value,))
+            self.tol = float(value)
+         elif var in NodeSelection.AXES:
+            bound = value if type(value) == list else [value, value]
+            if len(bound) != 2 or not all(NodeSelection._IsBound(b) for b in bound):
+               raise ValueError("Error: Invalid bounds %r for axis %s in node selection, expected a coordinate, \"min\", \"max\" or a list [lo, hi] of them." % (value, var))
+            self.bounds[NodeSelection.AXES.index(var)] = tuple(str(b) if type(b) == unicode else b for b in bound)
+         else:
+            raise ValueError("Error: Unknown parameter '%s' in node selection, expected x, y, z or tol." % var)
+      if len(self.bounds) == 0:
+         raise ValueError("Error: Node selection %r doesn't restrict any axis." % (spec,))
+         
+   @staticmethod
+   def _IsBound(value):
+      return type(value) in (int, float) or value in ("min", "max")
+   
+   def Key(self):
+      """ Canonical form of the selection, e.g. for the output manifest. """
+      return sorted(self.bounds.items()) + [self.tol]
+   
+   def Box(self, cMin, cMax):
+      """ The selected box (lo, hi) as two lists with one entry per axis, for a mesh with the given bounding box. """
+      nDim = len(cMin)
+      tol = self.tol if self.tol is not None else NodeSelection.TOLERANCE * max([cMax[d] - cMin[d] for d in xrange(nDim)] + [0.])
+      lo, hi = list(cMin), list(cMax)
+      for d, bound in self.bounds.iteritems():
+         if d >= nDim: raise ValueError("Error: Node selection on axis %s of a %dd mesh." % (NodeSelection.AXES[d], nDim))
+         value = lambda b: cMin[d] if b == "min" else cMax[d] if b == "max" else float(b)
+         lo[d], hi[d] = value(bound[0]) - tol, value(bound[1]) + tol
+      return lo, hi
+   
+   def __str__(self):
+      return ", ".join(["%s=%s" % (NodeSelection.AXES[d], "%s" % (lo,) if lo == hi else "[%s,%s]" % (lo, hi)) for d, (lo, hi) in sorted(self.bounds.items())])
+   
+class NodeGrid:
+   """
+   Uniform grid over the bounding box of the nodes of an AbaqusMesh, answering box queries (see Rows())
+   without scanning all nodes. The cells are cubes holding about NODES_PER_CELL nodes on average (flat
+   axes and axes thinner than a cell get a single layer of cells). Like the element connectivity, the
+   grid is stored in compressed form: the node rows are sorted by cell into 'order', and the rows of
+   cell c are order[cellStart[c]:cellStart[c+1]]. Cells are numbered with the last axis varying
+   fastest, so the cells of a box along the last axis are contiguous in 'order'.
+   Building the grid takes a few passes over the coordinate columns and a sort, done in C by the
+   builtins map and sorted; a query only visits the cells overlapping its box and checks the
+   coordinates of the nodes in them.
+   """
+   NODES_PER_CELL = 8
+   FLAT = 1e-9 # axes whose extent is below this fraction of the largest one are flat
+   
+   def __init__(self, mesh):
+      self.mesh = mesh
+      nDim = mesh.nDim
+      numNodes = mesh.NumNodes()
+      self.cMin, self.cMax = mesh.BoundingBox()
+      extents = [self.cMax[d] - self.cMin[d] for d in xrange(nDim)]
+      
+      # edge length of cubic cells (relative to the largest extent) in the occupied axes, so that there are at most
+      # numNodes/NODES_PER_CELL of them; axes thinner than a cell get a single layer and are left out until none is
+      maxExtent = max(extents)
+      relExtents = [e / maxExtent if maxExtent > 0 else 0. for e in extents]
+      numCells = max(1., float(numNodes) / NodeGrid.NODES_PER_CELL)
+      axes = [d for d in xrange(nDim) if relExtents[d] > NodeGrid.FLAT]
+      while axes:
+         size = (reduce(mul, [relExtents[d] for d in axes], 1.) / numCells) ** (1. / len(axes))
+         if all(relExtents[d] >= size for d in axes): break
+         axes = [d for d in axes if relExtents[d] >= size]
+      self.shape = [1] * nDim
+      for d in axes: self.shape[d] = int(relExtents[d] / size)
+      # cell index along axis d is int((x - cMin[d]) * scales[d]), slightly reduced so that the maximum falls into the last cell
+      self.scales = [self.shape[d] * (1. - 1e-9) / extents[d] if self.shape[d] > 1 else 0. for d in xrange(nDim)]
+      
+      # cell of every node, axis by axis
+      cells = None
+      for d in xrange(nDim):
+         index = imap(int, imap(mul, imap(sub, mesh.coords[d::nDim], repeat(self.cMin[d])), repeat(self.scales[d])))
+         cells = list(index) if cells is None else list(imap(add, imap(mul, cells, repeat(self.shape[d])), index))
+      
+      numCells = reduce(mul, self.shape, 1)
+      self.order = array('i', sorted(xrange(numNodes), key=cells.__getitem__))
+      sortedCells = array('i', imap(cells.__getitem__, self.order))
+      self.cellStart = array('i', imap(bisect_left, repeat(sortedCells), xrange(numCells + 1)))
+      
+   def _Cell(self, d, x):
+      """ Index of the cell containing coordinate x along axis d, clamped to the grid. """
+      return max(0, min(int((x - self.cMin[d]) * self.scales[d]), self.shape[d] - 1))
+   
+   def Rows(self, lo, hi):
+      """ Ascending rows of all nodes with lo[d] <= x[d] <= hi[d] on every axis d. """
+      nDim = self.mesh.nDim
+      if any(lo[d] > hi[d] or lo[d] > self.cMax[d] or hi[d] < self.cMin[d] for d in xrange(nDim)): return []
+      ranges = [(self._Cell(d, lo[d]), self._Cell(d, hi[d])) for d in xrange(nDim)]
+      
+      # candidates from all cells overlapping the box, one contiguous run of cells along the last axis at a time
+      order, cellStart, shape = self.order, self.cellStart, self.shape
+      first, last = ranges[-1]
+      rows = []
+      for prefix in product(*[xrange(i0, i1 + 1) for i0, i1 in ranges[:-1]]):
+         base = 0
+         for d, i in enumerate(prefix): base = base * shape[d] + i
+         base *= shape[-1]
+         rows.extend(order[cellStart[base + first]:cellStart[base + last + 1]])
+         
+      # the cells at the border of the box also contain nodes outside of it
+      coords = self.mesh.coords
+      for d in xrange(nDim):
+         if lo[d] > self.cMin[d] or hi[d] < self.cMax[d]:
+            l, h = lo[d], hi[d]
+            rows = [r for r in rows if l <= coords[r*nDim+d] <= h]
+      rows.sort()
+      return rows
+   
+class FeapWriter:
+   """
+   Writes the mesh blocks of a FEAP input file (coor, elem, boun/load from node sets) to a file-like object.
+   
+   Instead of formatting one node or element at a time, rows are processed in chunks: the values of
+   CHUNK_ROWS rows are interleaved from the mesh columns into one flat list by slice assignment and
+   formatted with a single %-operation on the repeated row format, so the per-row overhead of the
+   Python interpreter is avoided. Files written with it should be opened with a large buffer
+   (BUFFER_SIZE) so that the chunks go to disk in few system calls.
+   """
+   CHUNK_ROWS = 4096
+   BUFFER_SIZE = 1 << 20
+   
+   def __init__(self, f):
+      self.f = f
+      self.coorRows = None # number of rows of the coor block written so far, None if it wasn't started
+      
+   def _WriteRows(self, rowFmt, numRows, columns):
+      """
+      Write 'numRows' rows formatted with 'rowFmt'. 'columns' is a list of (values, width) tuples, where
+      values is a flat sequence with 'width' entries per row. Entries of all columns are used in that order.
+      """
+      rowWidth = sum([width for values, width in columns])
+      for start in xrange(0, numRows, FeapWriter.CHUNK_ROWS):
+         end = min(start + FeapWriter.CHUNK_ROWS, numRows)
+         flat = [0] * ((end-start) * rowWidth)
+         offset = 0
+         for values, width in columns:
+            for j in xrange(width):
+               flat[offset+j::rowWidth] = values[start*width+j:end*width:width]
+            offset += width
+         self.f.write((rowFmt * (end-start)) % tuple(flat))
+      
+   def WriteCoor(self, mesh, start=0):
+      """ Write the input cards of a coor block for all nodes in the mesh, beginning with the node in row 'start'. """
+      nodeIds, coords = mesh.nodeIds, mesh.coords
+      if start > 0: nodeIds, coords = nodeIds[start:], coords[start*mesh.nDim:]
+      self._WriteRows('%8d, 0' + ', %14.8f' * mesh.nDim + '\n', mesh.NumNodes() - start,
+                      [(nodeIds, 1), (coords, mesh.nDim)])
+      
+   def WriteCoorBlock(self, mesh):
+      """
+      Write the coor block for the nodes added to the mesh since the last call, starting the block first if
+      necessary. Pipelined builds call this for each block of parsed nodes, the mesh output for the rest.
+      """
+      if self.coorRows is None:
+         self.f.write('coor\n')
+         self.coorRows = 0
+      self.WriteCoor(mesh, self.coorRows)
+      self.coorRows = mesh.NumNodes()
+      
+   def WriteElem(self, mesh, typeIndex=None):
+      """ Write the input cards of an elem block for all elements in the mesh, or only those of type mesh.typeNames[typeIndex]. """
+      if typeIndex is None and mesh.nodesPerElem != AbaqusMesh.MIXED:
+         self._WriteRows('%8d, %d' + ', %d' * mesh.nodesPerElem + '\n', mesh.NumElems(),
+                         [(mesh.elemIds, 1), (mesh.elemMats, 1), (mesh.elemNodes, mesh.nodesPerElem)])
+         return
+      
+      # consecutive elements of the same type share one row format
+      offsets = mesh.elemOffsets
+      for t, start, end in mesh.TypeRuns():
+         if typeIndex is not None and t != typeIndex: continue
+         nel = mesh.typeNodes[t]
+         self._WriteRows('%8d, %d' + ', %d' * nel + '\n', end-start,
+                         [(mesh.elemIds[start:end], 1), (mesh.elemMats[start:end], 1), (mesh.elemNodes[offsets[start]:offsets[end]], nel)])
+         
+   def WriteElemBlocks(self, mesh):
+      """
+      Write the elem blocks for all elements in the mesh: a single block if all elements have the same number of
+      nodes, otherwise one block per element type (in order of first appearance) separated by blank lines.
+      """
+      if mesh.nodesPerElem != AbaqusMesh.MIXED:
+         self.f.write('elem\n')
+         self.WriteElem(mesh)
+         return
+      
+      for t, name in enumerate(mesh.typeNames):
+         if t > 0: self.f.write('\n')
+         self.f.write('elem ** TYPE=%s\n' % (name or "UNKNOWN"))
+         self.WriteElem(mesh, t)
+      
+   def WriteNodeSet(self, nset):
+      """ Write a boun or load block setting the node set's setBoun or setLoad card for all its nodes (sorted). """
+      nodes = array('i', nset.nodes)
+      
+      # setLoad takes precedence if both are given
+      if len(nset.setLoad) > 0: block, card = "load", nset.setLoad
+      elif len(nset.setBoun) > 0: block, card = "boun", nset.setBoun
+      else: return
+      
+      self.f.write("%s ** NSET=%s\n" % (block, nset.name))
+      self._WriteRows("%d, 0, " + card.replace('%', '%%') + "\n", len(nodes), [(nodes, 1)])
+      
+class MeshCache:
+   """
+   Persistent on-disk cache of parsed meshes, so that repeated conversions of the same .inp file
+   (e.g. with a modified config, header or footer) don't need to parse it again.
+   
+   Entries are keyed by a hash of the input file's contents (a SHA-1 digest, read in chunks), the
+   'nodesPerElem' setting, the SectionFilter used for parsing and the cache format version, so any
+   change of the input file invalidates its entry, even if its size and modification time are kept
+   (e.g. by cp -p or rsync). An entry is a single file consisting of a one-line JSON header (including
+   the element types) followed by the raw machine values of all mesh columns and explicitly listed
+   members of loaded sets, which are read back with one bulk array.fromfile() call per column
+   (generated ranges of sets are part of the JSON header). Sets not loaded yet (lazy parsing) are
+   stored as the byte range of their .inp section and stay deferred after loading.
+   
+   The cache directory is kept below 'maxBytes' by evicting the least recently used entries.
+   """
+   MAGIC = "inp2feap mesh cache"
+   VERSION = 3
+   
+   def __init__(self, cacheDir, maxBytes=1 << 30):
+      self.cacheDir = cacheDir
+      self.maxBytes = maxBytes
+      self.digests = {} # digests of the input files, computed once for Load() and Store() of a build
+      
+   @staticmethod
+   def Digest(filename):
+      """ SHA-1 hex digest of the contents of the file 'filename'. """
+      digest = hashlib.sha1()
+      with open(filename, 'rb') as f:
+         for chunk in iter(lambda: f.read(FeapWriter.BUFFER_SIZE), ""): digest.update(chunk)
+      return digest.hexdigest()
+   
+   def _Path(self, filename, nodesPerElem, select=None):
+      if filename not in self.digests: self.digests[filename] = MeshCache.Digest(filename)
+      key = [self.digests[filename], str(nodesPerElem), str(MeshCache.VERSION)]
+      if select is not None: key.append(select.Key())
+      return os.path.join(self.cacheDir, hashlib.sha1("|".join(key)).hexdigest() + ".mesh")
+   
+   def Load(self, filename, nodesPerElem=None, select=None):
+      """ Return the cached mesh for the .inp file 'filename' (parsed with SectionFilter 'select'), or None if there is no valid entry. """
+      path = self._Path(filename, nodesPerElem, select)
+      if not os.path.isfile(path): return None
+      
+      try:
+         with open(path, 'rb') as f:
+            if f.readline().rstrip('\n') != "%s %d" % (MeshCache.MAGIC, MeshCache.VERSION): raise ValueError("wrong format")
+            header = json.loads(f.readline())
+            
+            mesh = AbaqusMesh(header["nDim"], header["nodesPerElem"])
+            mesh.typeNames = [str(name) for name, nel in header["types"]]
+            mesh.typeNodes = [nel for name, nel in header["types"]]
+            for name, length in header["arrays"]:
+               values = array(getattr(mesh, str(name)).typecode)
+               values.fromfile(f, length)
+               setattr(mesh, str(name), values)
+               
+            for setInfo in header["sets"]:
+               if setInfo["type"] == "nset":
+                  memberSet = NodeSet()
+                  mesh.nsets.append(memberSet)
+               else:
+                  memberSet = ElSet()
+                  mesh.elsets.append(memberSet)
+               memberSet.name = str(setInfo["name"])
+               memberSet.generate = setInfo["generate"]
+               
+               if "range" in setInfo:
+                  memberSet.Defer(_SectionLoader(filename, *setInfo["range"]))
+               else:
+                  members = IdSet()
+                  members.runs = [tuple(run) for run in setInfo["runs"]]
+                  members.Ids().fromfile(f, setInfo["count"])
+                  if setInfo["type"] == "nset": memberSet.nodes = members
+                  else: memberSet.elems = members
+                  
+      except (ValueError, KeyError, EOFError, IOError) as e:
+         log.warning("Ignoring invalid mesh cache entry %s (%s).", path, e)
+         return None
+      
+      os.utime(path, None) # mark as recently used
+      log.debug(".Loaded %d nodes and %d elements from mesh cache %s.", mesh.NumNodes(), mesh.NumElems(), path)
+      return mesh
+   
+   def Store(self, filename, mesh, nodesPerElem=None, select=None):
+      """ Store the mesh parsed from the .inp file 'filename', then evict old entries if the cache is too large. """
+      if not os.path.isdir(self.cacheDir): os.makedirs(self.cacheDir)
+      path = self._Path(filename, nodesPerElem, select)
+      
+      sets = [("nset", s) for s in mesh.nsets] + [("elset", s) for s in mesh.elsets]
+      header = { "nDim" : mesh.nDim,
+                 "nodesPerElem" : mesh.nodesPerElem,
+                 "types" : zip(mesh.typeNames, mesh.typeNodes),
+                 "arrays" : [(name, len(getattr(mesh, name))) for name in AbaqusMesh.ARRAYS],
+                 "sets" : [] }
+      for setType, memberSet in sets:
+         setInfo = { "type" : setType, "name" : memberSet.name, "generate" : memberSet.generate }
+         if memberSet.DeferredRange() is not None: setInfo["range"] = memberSet.DeferredRange()
+         else:
+            members = memberSet.nodes if setType == "nset" else memberSet.elems
+            setInfo["runs"] = members.runs
+            setInfo["count"] = len(members.Ids())
+         header["sets"].append(setInfo)
+      
+      # write to a temporary file first, so that no incomplete entry can be read by another process
+      tmpPath = "%s.%d.tmp" % (path, os.getpid())
+      with open(tmpPath, 'wb') as f:
+         f.write("%s %d\n" % (MeshCache.MAGIC, MeshCache.VERSION))
+         f.write(json.dumps(header) + "\n")
+         for name in AbaqusMesh.ARRAYS:
+            getattr(mesh, name).tofile(f)
+         for setType, memberSet in sets:
+            if memberSet.DeferredRange() is None:
+               (memberSet.nodes if setType == "nset" else memberSet.elems).Ids().tofile(f)
+      os.rename(tmpPath, path)
+      log.debug(".Stored mesh in cache %s.", path)
+      
+      self._Evict(keep=path)
+      
+   def _Evict(self, keep=None):
+      """ Remove least recently used entries until the cache size is below maxBytes. The entry 'keep' is never removed. """
+      entries = []
+      for name in os.listdir(self.cacheDir):
+         path = os.path.join(self.cacheDir, name)
+         if name.endswith(".mesh") and path != keep:
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+      
+      total = sum([size for mtime, size, path in entries]) + (os.path.getsize(keep) if keep else 0)
+      for mtime, size, path in sorted(entries):
+         if total <= self.maxBytes: break
+         os.remove(path)
+         total -= size
+         log.debug(".Evicted mesh cache entry %s.", path)
+      
+class OutputManifest:
+   """
+   Record of the pieces a FEAP output file was assembled from, stored as JSON next to the output
+   file ('<output>.manifest') if the config enables "incremental" builds.
+
+   Each piece (header, coor/elem blocks, custom input blocks, boun/load blocks of node sets, footer)
+   is stored with its byte range in the output file and a key hashing everything its text depends on.
+   A later build compares the keys to find the pieces which changed, and keeps the byte ranges of
+   all other pieces instead of generating them again. The size and modification time of the output
+   file are recorded as well, so the manifest is ignored once the output was modified otherwise.
+   """
+   VERSION = 1
+
+   def __init__(self, outputFile):
+      self.outputFile = outputFile
+      self.path = outputFile + ".manifest"
+      self.pieces = [] # (name, key, offset, length) in file order
+
+   @staticmethod
+   def Key(*values):
+      return hashlib.sha1(json.dumps(values)).hexdigest()
+
+   def _Stamp(self):
+      st = os.stat(self.outputFile)
+      return [st.st_size, st.st_mtime]
+
+   def Load(self):
+      """ Read the manifest. Returns False if there is none or it doesn't match the output file. """
+      try:
+         with open(self.path, 'r') as f:
+            data = json.load(f)
+         if data["version"] != OutputManifest.VERSION or data["output"] != self._Stamp(): return False
+         self.pieces = [(str(name), str(key), offset, length) for name, key, offset, length in data["pieces"]]
+      except (IOError, OSError, ValueError, KeyError, TypeError):
+         return False
+      return True
+
+   def Save(self):
+      with open(self.path, 'w') as f:
+         json.dump({"version": OutputManifest.VERSION, "output": self._Stamp(), "pieces": self.pieces}, f)
+
+   def Remove(self):
+      if os.path.isfile(self.path): os.remove(self.path)
+
+class _ProfiledStage:
+   """ Context manager measuring one stage of a StageProfiler. """
+   def __init__(self, profiler, name):
+      self.profiler = profiler
+      self.record = { "name" : name, "amount" : None, "unit" : None }
+      self.cprofile = None
+      
+   def Count(self, amount, unit):
+      """ Set the amount of data processed in this stage (e.g. MB, elements) to compute its throughput. """
+      self.record["amount"] = amount
+      self.record["unit"] = unit
+      
+   def __enter__(self):
+      self.start = time.time()
+      self.times = os.times()
+      if self.profiler.cprofileStage == self.record["name"]:
+         self.cprofile = self.profiler.cprofile = cProfile.Profile()
+         self.cprofile.enable()
+      return self
+   
+   def __exit__(self, excType, excValue, traceback):
+      if self.cprofile is not None: self.cprofile.disable()
+      wall = time.time() - self.start
+      times = os.times()
+      record = self.record
+      record["wall"] = wall
+      record["cpu"] = (times[0] + times[1]) - (self.times[0] + self.times[1])
+      record["workerCpu"] = (times[2] + times[3]) - (self.times[2] + self.times[3])
+      record["peakRssMB"] = StageProfiler.PeakRss()
+      record["rate"] = record["amount"] / wall if record["amount"] is not None and wall > 0. else None
+      record["failed"] = excType is not None
+      self.profiler.stages.append(record)
+      
+class StageProfiler:
+   """
+   Records wall time, CPU time (of this process and of finished worker processes), peak memory and
+   throughput of the stages of a build. ConfigFileParser.Build() records its stages in a profiler
+   in any case, which costs next to nothing. Report() prints them and Save() writes them as metrics
+   JSON file.
+   One stage can be run under cProfile, its statistics are saved next to the metrics file.
+   The peak memory is the resident set size high-water mark of this process, it is only available
+   where the resource module is.
+   """
+   STAGES = ["config", "read", "incremental", "parse", "validate", "merge", "elsets", "duplicate", "types", "renumber", "nsets", "center", "write"]
+   
+   def __init__(self, cprofileStage=None):
+      self.stages = [] # one dict per finished stage
+      self.cprofileStage = cprofileStage
+      self.cprofile = None
+      
+   def Stage(self, name):
+      """ Context manager measuring the stage 'name'. """
+      return _ProfiledStage(self, name)
+   
+   @staticmethod
+   def PeakRss():
+      if resource is None: return None
+      # ru_maxrss is in kilobytes on Linux, but in bytes on Mac OS X
+      return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.**2 if sys.platform == "darwin" else 1024.)
+   
+   def Report(self):
+      log.info("%-12s %10s %10s %12s %14s   %s", "stage", "wall [s]", "cpu [s]", "workers [s]", "peak RSS [MB]", "throughput")
+      for stage in self.stages:
+         rss = "%14.1f" % stage["peakRssMB"] if stage["peakRssMB"] is not None else "%14s" % "-"
+         rate = "%.1f %s/s" % (stage["rate"], stage["unit"]) if stage["rate"] is not None else ""
+         log.info("%-12s %10.3f %10.3f %12.3f %s   %s", stage["name"], stage["wall"], stage["cpu"], stage["workerCpu"], rss, rate)
+      log.info("%-12s %10.3f", "total", sum(stage["wall"] for stage in self.stages))
+      
+   def Save(self, filename, **info):
+      """ Write the stages and additional 'info' to the JSON file 'filename' and dump the cProfile statistics, if any. """
+      metrics = dict(info)
+      metrics["stages"] = self.stages
+      metrics["totalWall"] = sum(stage["wall"] for stage in self.stages)
+      metrics["peakRssMB"] = StageProfiler.PeakRss()
+      if self.cprofile is not None:
+         metrics["cprofile"] = "%s.%s.prof" % (os.path.splitext(filename)[0], self.cprofileStage)
+         self.cprofile.dump_stats(metrics["cprofile"])
+         log.info("cProfile statistics of stage '%s' written to %s.", self.cprofileStage, metrics["cprofile"])
+      with open(filename, 'w') as f:
+         json.dump(metrics, f, indent=1, sort_keys=True)
+      log.info("Metrics written to %s.", filename)
+      
+class ConfigFileParser:
+   """
+   Parser to read and interpret the JSON-style configuration file required to run this program.
+   That file includes all required information to completely convert an Abaqus '.inp' file to a FEAP
+   input file. It specifies the .inp-file, the file to write to, header and footer, and more. For a
+   complete list, refer to the project documentation.
+   Please note that the Python JSON parser is very restrictive, small syntax errors such as extra
+   commas at the end of a list may already lead to non-readable files.
+   
+   A ConfigFileParser object is initialized with the config file and invoked with Build(), which will
+   subsequently read and interpret the JSON config file, the Abaqus .inp file, header and footer
+   and assemble all information to produce the FEAP output file which is also specified in the JSON
+   config file.
+   Provided all input is correct and no errors occur, all what the inp2feap main routine does is
+   initializing a ConfigFileParser object with a JSON file specified as a command line parameter
+   or by interactive input and call Build().
+   
+   This class includes some definitions on how what it expects in the JSON config file. Make sure
+   to extend them when adding further functionality.
+   """
+   REQUIRED_VARS = ["input", "output"]
+   KNOWN_VARS = ["input", "output", "nodesPerElem", "header", "footer", "centerMesh", "elsets", "nsets", "customInput", "cacheDir", "cacheSize",
+                 "incremental", "renumber", "elemTypes", "pipeline", "mergeNodes", "meshInclude"]
+   ASSUMED_TYPES = { "input" : str, "output" : str, "nodesPerElem" : int, "header" : str, "footer" : str, "centerMesh" : bool, "nsets" : list, "elsets" : list, "customInput" : dict,
+                     "cacheDir" : str, "cacheSize" : int, "incremental" : bool, "renumber" : str, "elemTypes" : list, "pipeline" : bool,
+                     "mergeNodes" : dict, "meshInclude" : str }
+   
+   CHILD_REQUIRED_VARS = { "elsets" : ["name"],
+                           "nsets" :  ["name"],
+                           "elemTypes" : ["type"],
+                           "customInput" : ["block", "pos", "cards"],
+                           "mergeNodes" : ["tol"] }
+   CHILD_KNOWN_VARS = { "elsets" : ["name", "setMat", "duplicate"],
+                        "nsets" :  ["name", "setBoun", "setLoad", "select"],
+                        "elemTypes" : ["type", "setMat", "matOffset"],
+                        "customInput" : ["block", "pos", "cards"],
+                        "mergeNodes" : ["tol"]}
+   CHILD_ASSUMED_TYPES = { "elsets": {"name" : str, "setMat" : int, "duplicate" : int},
+                           "nsets":  {"name" : str, "setBoun" : str, "setLoad" : str, "select" : dict},
+                           "elemTypes": {"type" : str, "setMat" : int, "matOffset" : int},
+                           "customInput" : {"block" : str, "pos" : int, "cards" : list},
+                           "mergeNodes" : {"tol" : float}}
+   
+   def __init__(self, confFile=None, jobs=1):
+      self.confFile = confFile # name of the JSON config file, or a dict with its contents
+      self.jobs = jobs # number of processes used to parse the .inp file
+      
+      self.inputFile = None  # abaqus .inp file to read mesh data from
+      self.outputFile = None # feap iFoobar file to write data to
+      self.outputStream = None # file-like object to write to instead of the output file (see Convert())
+      self.headerFile = None # optional header file to insert before coor/elem blocks
+      self.footerFile = None # optional footer file to append after all mesh data has been written
+      
+      self.nodesPerElem = None # nodes per element
+      self.centerMesh = False  # center mesh
+      
+      self.cacheDir = None   # optional directory for the persistent mesh cache
+      self.cacheSize = 1024  # maximum size of the mesh cache in MB
+      self.incremental = False # keep a manifest to regenerate only changed parts of the output
+      self.renumber = None     # node renumbering method (see NodeRenumberer)
+      self.mergeTol = None     # tolerance for merging coincident nodes (see NodeMerger)
+      self.inputDigest = None  # digest of the .inp file's contents in the current build (see _InputStamp())
+      self.meshInclude = None  # directory of shared include files for the coor/elem blocks, relative to the output file (see _MeshIncludes())
+      self.pipeline = False    # write the output in a separate thread while parsing (see _ParsePipelined())
+      self.profiler = StageProfiler() # timings of the build stages
+      self.validate = False  # check the integrity of the parsed mesh and abort if it has errors (see MeshValidator)
+      self.validation = None # report of the mesh validation
+      
+      self.headerString = ""
+      self.footerString = ""
+      
+      self.elsets = []
+      self.nsets = []
+      self.conf_elemTypes = []
+      self.customInputs = []
+       
+      pass
+   
+   def _ParseCustomInput(self, inp):
+      """ Parse JSON substring specifying a custom input. """
+      for var in ConfigFileParser.CHILD_REQUIRED_VARS["customInput"]:
+         if var not in inp.keys():
+            log.error("Required parameter '%s' not found in custom input. Aborting.", var)
+            return 1
+            
+      for var, value in inp.iteritems():
+         if var not in ConfigFileParser.CHILD_KNOWN_VARS["customInput"]:
+            log.warning("Unknown parameter '%s' in custom input. Will be ignored.", var)
+            
+            if type(value) == unicode: value = str(value)
+            
+            if type(value) != ConfigFileParser.CHILD_ASSUMED_TYPES["customInput"][var]:
+               log.warning("Unsupported type '%s' for parameter '%s' in custom input.", type(value), var)
+               
+      ci = CustomInput(inp["block"], inp["pos"], inp["cards"])
+      return ci
+
+   
+   def _ParseMergeNodes(self, merge):
+      """ Parse JSON substring specifying the merging of coincident nodes. Returns the tolerance or None. """
+      for var in ConfigFileParser.CHILD_REQUIRED_VARS["mergeNodes"]:
+         if var not in merge.keys():
+            log.warning("Required parameter '%s' not found in mergeNodes, nodes will not be merged.", var)
+            return None
+         
+      for var, value in merge.iteritems():
+         if var not in ConfigFileParser.CHILD_KNOWN_VARS["mergeNodes"]:
+            log.warning("Unknown parameter '%s' in mergeNodes. Will be ignored.", var)
+         elif type(value) not in (int, float):
+            log.warning("Unsupported type '%s' for parameter '%s' in mergeNodes.", type(value), var)
+            
+      try: tol = float(merge["tol"])
+      except (TypeError, ValueError): tol = 0.
+      if not tol > 0.:
+         log.warning("Tolerance of mergeNodes must be positive, nodes will not be merged.")
+         return None
+      return tol
+   
+   def _ParseElsets(self, elsets):
+      """ Parse JSON substring specifying an element set. """
+      elsetObjs = []
+      
+      for elset in elsets:
+         for elsetVar in ConfigFileParser.CHILD_REQUIRED_VARS["elsets"]:
+            if elsetVar not in elset.keys():
+               log.error("Required parameter '%s' not found in elset. Aborting.", elsetVar)
+               return 1
+            
+         elsetObj = ElSet()
+               
+         for elsetVar, elsetValue in elset.iteritems():
+            if elsetVar not in ConfigFileParser.CHILD_KNOWN_VARS["elsets"]:
+               log.warning("Unknown parameter '%s' in elset. Will be ignored.", elsetVar)
+            
+            if type(elsetValue) == unicode: elsetValue = str(elsetValue)
+            
+            if type(elsetValue) != ConfigFileParser.CHILD_ASSUMED_TYPES["elsets"][elsetVar]:
+               log.warning("Unsupported type '%s' for parameter '%s' in elset.", type(elsetValue), elsetVar)
+               
+            if elsetVar == "name": elsetObj.name = str(elsetValue)
+            elif elsetVar == "setMat" : elsetObj.setMat = int(elsetValue)
+            elif elsetVar == "duplicate" : elsetObj.duplicate.append( int(elsetValue) )
+         
+         elsetObjs.append(elsetObj)
+         
+      return elsetObjs
+   
+   def _ParseElemTypes(self, elemTypes):
+      """ Parse JSON substring specifying the material mapping of an element type. """
+      elemTypeObjs = []
+      
+      for elemType in elemTypes:
+         for typeVar in ConfigFileParser.CHILD_REQUIRED_VARS["elemTypes"]:
+            if typeVar not in elemType.keys():
+               log.error("Required parameter '%s' not found in element type. Aborting.", typeVar)
+               return 1
+            
+         elemTypeObj = ElementType()
+         
+         for typeVar, typeValue in elemType.iteritems():
+            if typeVar not in ConfigFileParser.CHILD_KNOWN_VARS["elemTypes"]:
+               log.warning("Unknown parameter '%s' in element type. Will be ignored.", typeVar)
+               continue
+            
+            if type(typeValue) == unicode: typeValue = str(typeValue)
+            
+            if type(typeValue) != ConfigFileParser.CHILD_ASSUMED_TYPES["elemTypes"][typeVar]:
+               log.warning("Unsupported type '%s' for parameter '%s' in element type.", type(typeValue), typeVar)
+               
+            if typeVar == "type": elemTypeObj.name = str(typeValue)
+            elif typeVar == "setMat" : elemTypeObj.setMat = int(typeValue)
+            elif typeVar == "matOffset" : elemTypeObj.matOffset = int(typeValue)
+         
+         elemTypeObjs.append(elemTypeObj)
+         
+      return elemTypeObjs
+   
+   def _ParseNsets(self, nsets):
+      """ Parse JSON substring specifying a node set. """
+      nsetObjs = []
+      
+      for nset in nsets:
+         for nsetVar in ConfigFileParser.CHILD_REQUIRED_VARS["nsets"]:
+            if nsetVar not in nset.keys():
+               log.error("Required parameter '%s' not found in nset. Aborting.", nsetVar)
+               return 1
+            
+         nsetObj = NodeSet()
+               
+         for nsetVar, nsetValue in nset.iteritems():
+            if nsetVar not in ConfigFileParser.CHILD_KNOWN_VARS["nsets"]:
+               log.warning("Unknown parameter '%s' in nset. Will be ignored.", nsetVar)
+            
+            if type(nsetValue) == unicode: nsetValue = str(nsetValue)
+            
+            if type(nsetValue) != ConfigFileParser.CHILD_ASSUMED_TYPES["nsets"][nsetVar]:
+               log.warning("Unsupported type '%s' for parameter '%s' in nset.", type(nsetValue), nsetVar)
+               
+            if nsetVar == "name": nsetObj.name = str(nsetValue)
+            elif nsetVar == "setBoun" : nsetObj.setBoun = str(nsetValue)
+            elif nsetVar == "setLoad" : nsetObj.setLoad = str(nsetValue)
+            elif nsetVar == "select" : nsetObj.select = NodeSelection(nsetValue)
+         
+         nsetObjs.append(nsetObj)
+         
+      return nsetObjs
+   
+   def _ParseConfig(self, confFile=None):
+      """ Invoked as a main routine to parse the specified JSON config file, or the config dict given instead of its name. """
+      if confFile is not None: self.confFile = confFile
+      if self.confFile is None:
+         raise ValueError("Error: No config file specified for parser!")
+      
+      elsetObjs = []
+      nsetObjs = []
+      
+      if isinstance(self.confFile, dict):
+         # config given by a driver script (see Convert()), paths are relative to the current directory
+         conf = self.confFile
+         self.confName = "<config dict>"
+         self.workingDir = ""
+      else:
+         with open(self.confFile, 'r') as f:
+            try: conf = json.load(f)
+            except Exception as e: raise BaseException("Couldn't load JSON from %s. " % self.confFile + str(e))
+         self.confName = self.confFile
+         self.workingDir = os.path.dirname(os.path.relpath(self.confFile))
+      
+      for var in ConfigFileParser.REQUIRED_VARS:
+         if var not in conf.keys() and not (var == "output" and self.outputStream is not None):
+            log.error("Required parameter '%s' not found in config file. Aborting.", var)
+            return EXIT_FAILURE
+      
+      for var, value in conf.iteritems():
+         if var not in ConfigFileParser.KNOWN_VARS:
+            log.warning("Unknown parameter '%s' in config file. Will be ignored.", var)
+            continue
+         
+         if type(value) == unicode: value = str(value)
+         
+         if type(value) != ConfigFileParser.ASSUMED_TYPES[var]:
+            log.warning("Unsupported type '%s' for parameter '%s'.", type(value), var)
+         
+         if var == "input": self.inputFile = str(value)
+         elif var == "output": self.outputFile = str(value)
+         elif var == "header": self.headerFile = str(value)
+         elif var == "footer": self.footerFile = str(value)
+         
+         elif var == "centerMesh": self.centerMesh = bool(value)
+         
+         elif var == "nodesPerElem": self.nodesPerElem = int(value)
+         
+         elif var == "cacheDir": self.cacheDir = str(value)
+         elif var == "cacheSize": self.cacheSize = int(value)
+         elif var == "incremental": self.incremental = bool(value)
+         elif var == "pipeline": self.pipeline = bool(value)
+         elif var == "renumber":
+            if value in NodeRenumberer.METHODS: self.renumber = value
+            else: log.warning("Unknown renumbering method '%s', nodes will not be renumbered.", value)
+         elif var == "mergeNodes": self.mergeTol = self._ParseMergeNodes(value)
+         elif var == "meshInclude": self.meshInclude = str(value)
+         
+         elif var == "elsets":
+            elsetObjs = self._ParseElsets(value)
+         elif var == "nsets":
+            nsetObjs = self._ParseNsets(value)
+         elif var == "elemTypes":
+            self.conf_elemTypes = self._ParseElemTypes(value)
+         
+         elif var == "customInput":
+            ci = self._ParseCustomInput(value)
+            self.customInputs.append(ci)
+            
+      log.info("Successfully parsed config file '%s'.", self.confName)
+      log.debug(".Found instructions for %d nsets and %d elsets.", len(nsetObjs), len(elsetObjs))
+      log.debug(".Found %d custom input blocks.", len(self.customInputs))
+      
+      self.customInputs.sort(key=lambda ci: ci.pos)
+      
+      self.conf_nsets = nsetObjs
+      self.conf_elsets = elsetObjs
+      
+      return EXIT_SUCCESS
+   
+   def SectionFilter(self):
+      """ The sections of the .inp file needed for this config: nodes, elements and the node and element sets it refers to. Call after _ParseConfig(). """
+      return SectionFilter(nsets=[nset.name for nset in self.conf_nsets if nset.select is None], elsets=[elset.name for elset in self.conf_elsets])
+   
+   def _ParseInputFile(self, inputFile, select=None, readAhead=False, nodesListener=None):
+      """
+      Called to parse the Abaqus .inp file with the help of an InpFileParser object, skipping all sections
+      not selected by the SectionFilter 'select' (default: the sections needed by this config). If a cache
+      directory is configured, the mesh is loaded from the mesh cache instead if possible, or stored there
+      after parsing. 'readAhead' and 'nodesListener' are passed to the InpFileParser.
+      """
+      if select is None: select = self.SectionFilter()
+      cache = None
+      if self.cacheDir:
+         cache = MeshCache(os.path.join(self.workingDir, self.cacheDir), self.cacheSize << 20)
+         mesh = cache.Load(inputFile, self.nodesPerElem, select)
+         if mesh is not None: return mesh
+      
+      ifp = InpFileParser(inputFile, jobs=self.jobs, lazy=True, select=select)
+      if self.nodesPerElem:
+         ifp.nodesPerElem = self.nodesPerElem
+      ifp.readAhead = readAhead
+      ifp.nodesListener = nodesListener
+      mesh = ifp.Parse()
+      
+      if cache is not None: cache.Store(inputFile, mesh, self.nodesPerElem, select)
+      return mesh
+   
+   def _ParsePipelined(self, inputFile):
+      """
+      Parse the .inp file while the output is already being written by a separate thread (see _WriteBehind):
+      the pieces before the mesh right away and the coor rows of each block of nodes as soon as it is parsed.
+      The input file is read by another thread (see _ReadAhead). Centering moves the nodes after parsing,
+      in that case the coor block is only written with the rest of the mesh.
+      Returns the mesh and the FeapWriter to complete the output with (see _WriteOutput()).
+      """
+      f = _WriteBehind(OpenOutput(self.outputFile))
+      try:
+         writer = FeapWriter(f)
+         pieces = self._Pieces(None, [])
+         self._WritePieces(f, pieces[:[name for name, key, content in pieces].index("mesh")], writer=writer)
+         mesh = self._ParseInputFile(inputFile, readAhead=True, nodesListener=None if self.centerMesh else writer.WriteCoorBlock)
+      except:
+         self._DiscardOutput(f)
+         raise
+      return mesh, writer
+   
+   def _AssignElsets(self, mesh):
+      """
+      Transfer material numbers and duplication instructions from the config file's elsets to the
+      mesh's elsets and write them to the element material column.
+      
+      Every mesh elset is applied to its members in file order, so an element contained in several
+      elsets ends up with the material of the last one (and the duplicates of the last one having any).
+      Elsets are looked up by name and elements by ID via dicts, so the cost is linear in the
+      number of elements plus the total size of all elsets.
+      Unconfigured elsets before the first configured one only set the default material and are skipped,
+      so their members are never read if the mesh was parsed in lazy mode.
+      """
+      elsetsByName = _IndexByName(mesh.elsets)
+      configured = set()
+      for conf_elset in self.conf_elsets:
+         # try to find this elset (from config file) in mesh and assign specified material number
+         mesh_elset = elsetsByName.get(conf_elset.name)
+         if mesh_elset is None:
+            log.warning("Couldn't find elset '%s' (specified in %s) in mesh %s.", conf_elset.name, self.confName, self.inputFile)
+            continue
+         
+         configured.add(id(mesh_elset))
+         mesh_elset.setMat = conf_elset.setMat
+         log.debug(".Setting material number %d for all elements in elset %s.", mesh_elset.setMat, mesh_elset.name)
+         if len(conf_elset.duplicate) > 0:
+            mesh_elset.duplicate = conf_elset.duplicate
+            log.debug(".Elset %s will be duplicated (materials %s).", mesh_elset.name, conf_elset.duplicate)
+      
+      first = [i for i, elset in enumerate(mesh.elsets) if id(elset) in configured]
+      if len(first) == 0: return
+      
+      rowOf = mesh.ElemRowIndex()
+      elemMats = mesh.elemMats
+      for elset in mesh.elsets[first[0]:]:
+         rows = [rowOf[eid] for eid in elset.elems if eid in rowOf]
+         setMat = elset.setMat
+         for row in rows: elemMats[row] = setMat
+         # duplicate elements in any 'duplicate' elsets
+         if len(elset.duplicate) > 0:
+            mesh.elemDuplicate.update(dict.fromkeys(rows, elset.duplicate))
+   
+   def InputKey(self):
+      """ Identifies the parsed mesh this config needs: (real path of the .inp file, nodesPerElem). Call after _ParseConfig(). """
+      return (os.path.realpath(os.path.join(self.workingDir, self.inputFile)), self.nodesPerElem)
+   
+   def _InputStamp(self):
+      """
+      Identity of the .inp file's current contents: their SHA-1 digest (see MeshCache.Digest()), computed once per
+      build. Size and modification time don't suffice, copies (cp -p, rsync) and archives may keep both for new contents.
+      """
+      if self.inputDigest is None: self.inputDigest = MeshCache.Digest(os.path.join(self.workingDir, self.inputFile))
+      return [self.inputDigest]
+   
+   def _MeshKey(self, stamp):
+      """ Key of the coor/elem blocks: the .inp file 'stamp' and all settings modifying nodes or elements. """
+      return OutputManifest.Key(stamp, self.nodesPerElem, self.centerMesh, self.renumber, self.mergeTol, [(e.name, e.setMat, e.duplicate) for e in self.conf_elsets],
+                                [(t.name, t.setMat, t.matOffset) for t in self.conf_elemTypes])
+   
+   def _MeshIncludes(self, mesh, stamp):
+      """
+      The shared include files of the coor and elem blocks as (name in the include command, path, function writing
+      the block to a FeapWriter). The files are addressed by the keys of their contents, which start with the digest
+      of the .inp file's contents (see _InputStamp()), so the load cases of a model, which differ only in their
+      boun/load blocks, custom input, header or footer, refer to the same files and write them only once, and any
+      change of the .inp file gives new names. The coor key leaves out the elsets and elemTypes, which only change
+      the elem block. Files no longer referenced by any output are removed, see _UpdateIncludeRefs().
+      """
+      coorKey = OutputManifest.Key(stamp, self.nodesPerElem, self.centerMesh, self.renumber, self.mergeTol)
+      includes = []
+      for block, key, Write in (("coor", coorKey, lambda writer: writer.WriteCoorBlock(mesh)),
+                                ("elem", self._MeshKey(stamp), lambda writer: writer.WriteElemBlocks(mesh))):
+         name = "%s_%s.inc" % (block, key[:16])
+         if self.meshInclude not in ("", "."): name = self.meshInclude.rstrip("/") + "/" + name
+         includes.append((name, os.path.join(os.path.dirname(self.outputFile), name), Write))
+      return includes
+   
+   @staticmethod
+   def _WriteInclude(path, Write):
+      """
+      Write an include file with the function Write(writer), unless it exists already. It is written under a temporary
+      name and renamed when complete, so builds running in parallel (e.g. in batch mode) never use a partial file.
+      """
+      if os.path.isfile(path):
+         log.debug(".Reusing include file %s.", path)
+         return
+      temp = "%s.%d.tmp" % (path, os.getpid())
+      with open(temp, 'w', FeapWriter.BUFFER_SIZE) as f:
+         Write(FeapWriter(f))
+         f.write('\n')
+      try: os.rename(temp, path)
+      except OSError:
+         # on Windows, another build may have renamed its copy first
+         os.remove(temp)
+         if not os.path.isfile(path): raise
+      log.debug(".Wrote include file %s.", path)
+   
+   @staticmethod
+   def _IncludeRefs(path):
+      """ Return the names of the include files listed in the refs file 'path' (see _UpdateIncludeRefs()), none if it can't be read. """
+      try:
+         with open(path, 'r') as f: return [str(name) for name in json.load(f)["includes"]]
+      except (IOError, OSError, ValueError, KeyError, TypeError):
+         return []
+   
+   def _UpdateIncludeRefs(self, includes):
+      """
+      Record that the output refers to the include files 'includes' (see _MeshIncludes()), and remove the ones it
+      referred to before unless another output still does. Every output lists its include files in its own refs
+      file 'refs_<key of the output path>.json' in the include directory. It is written before the include files
+      are, so that a build running in parallel doesn't remove a file which is about to be reused.
+      """
+      directory = os.path.dirname(includes[0][1])
+      if directory and not os.path.isdir(directory):
+         try: os.makedirs(directory)
+         except OSError:
+            if not os.path.isdir(directory): raise
+      output = os.path.realpath(self.outputFile)
+      refsPath = os.path.join(directory, "refs_%s.json" % OutputManifest.Key(output)[:16])
+      names = [os.path.basename(path) for name, path, Write in includes]
+      stale = set(ConfigFileParser._IncludeRefs(refsPath)) - set(names)
+   
+      tmpPath = "%s.%d.tmp" % (refsPath, os.getpid())
+      with open(tmpPath, 'w') as f: json.dump({ "output" : output, "includes" : names }, f)
+      os.rename(tmpPath, refsPath)
+   
+      if not stale: return
+      for other in glob.glob(os.path.join(directory, "refs_*.json")):
+         if other != refsPath: stale.difference_update(ConfigFileParser._IncludeRefs(other))
+      for name in sorted(stale):
+         path = os.path.join(directory, name)
+         if os.path.isfile(path):
+            os.remove(path)
+            log.debug(".Removed include file %s, which is no longer referenced.", path)
+   
+   def _Pieces(self, mesh, nsets):
+      """
+      The contents of the output file as a list of (name, key, content) in file order, see OutputManifest.
+      'content' is either a string or a function writing the piece to a FeapWriter. 'nsets' are the node sets
+      to write boun/load blocks for, 'mesh' is only used to write the coor/elem blocks and may be None if
+      these are never written.
+      """
+      stamp = self._InputStamp()
+      pieces = []
+      
+      # header
+      if self.headerFile: pieces.append(("header", OutputManifest.Key(self.headerString), self.headerString + "\n"))
+      
+      # nodes and elems, modified by elsets and centering, or the commands including them from shared files
+      if self.meshInclude is None:
+         def WriteMesh(writer):
+            writer.WriteCoorBlock(mesh)
+            writer.f.write('\n')
+            writer.WriteElemBlocks(mesh)
+         pieces.append(("mesh", self._MeshKey(stamp), WriteMesh))
+      else:
+         includes = self._MeshIncludes(mesh, stamp)
+         def WriteMesh(writer):
+            self._UpdateIncludeRefs(includes)
+            for name, path, Write in includes: ConfigFileParser._WriteInclude(path, Write)
+            writer.f.write("".join(["include,%s\n" % name for name, path, Write in includes]))
+         pieces.append(("mesh", OutputManifest.Key(self._MeshKey(stamp), self.meshInclude), WriteMesh))
+      
+      # custom input blocks with pos < 0 come before nset-boun-blocks, the rest after them
+      customPieces = [("custom %d" % i, OutputManifest.Key(ci.block, ci.pos, ci.cards), "\n" + str(ci) + "\n") for i, ci in enumerate(self.customInputs)]
+      numBefore = len([ci for ci in self.customInputs if ci.pos < 0])
+      pieces.extend(customPieces[:numBefore])
+      
+      # boun/load-blocks generated from node sets
+      def WriteNodeSet(nset):
+         def Write(writer):
+            writer.f.write('\n')
+            writer.WriteNodeSet(nset)
+            writer.f.write('\n')
+         return Write
+      for nset in nsets:
+         pieces.append(("nset " + nset.name, OutputManifest.Key(stamp, self.renumber, self.mergeTol, nset.name, nset.setBoun, nset.setLoad, nset.select and nset.select.Key()),
+                        WriteNodeSet(nset)))
+      
+      pieces.extend(customPieces[numBefore:])
+      
+      # footer
+      if self.footerFile: pieces.append(("footer", OutputManifest.Key(self.footerString), "\n" + self.footerString))
+      
+      return pieces
+   
+   def _WritePieces(self, f, pieces, old=None, writer=None):
+      """
+      Write 'pieces' to f and return their (name, key, offset, length) records. A piece with a record in
+      the dict 'old' is copied from the given byte range of the old output file 'old[None]' instead of
+      being generated. Generated pieces are written with 'writer', by default a new FeapWriter for f.
+      """
+      if writer is None: writer = FeapWriter(f)
+      records = []
+      for name, key, content in pieces:
+         offset = f.tell()
+         if old is not None and name in old:
+            source = old[None]
+            source.seek(old[name][2])
+            remaining = old[name][3]
+            while remaining > 0:
+               data = source.read(min(remaining, FeapWriter.BUFFER_SIZE))
+               if len(data) == 0: raise IOError("Output file %s is shorter than recorded in its manifest." % self.outputFile)
+               f.write(data)
+               remaining -= len(data)
+         elif callable(content): content(writer)
+         else: f.write(content)
+         records.append((name, key, offset, f.tell() - offset))
+      return records
+   
+   def _BuildIncremental(self):
+      """
+      Try to update the output file of a previous incremental build instead of building it from scratch.
+      This requires a manifest matching the output file and an unchanged coor/elem piece, i.e. the same .inp
+      file, elsets and mesh settings. Then the .inp file is not parsed, only the members of node sets with
+      changed boun/load blocks are read.
+      If all changed pieces come after the coor/elem blocks, the output is truncated before the first
+      changed piece and the rest is appended in place, otherwise a new file is written copying the
+      unchanged pieces. Returns False if the output needs to be built from scratch.
+      """
+      manifest = OutputManifest(self.outputFile)
+      if not manifest.Load(): return False
+      
+      inputFile = os.path.join(self.workingDir, self.inputFile)
+      pieces = self._Pieces(None, self._IndexedNsets(inputFile))
+      oldPieces = manifest.pieces
+      old = dict((record[0], record) for record in oldPieces)
+      meshIndex = [name for name, key, content in pieces].index("mesh")
+      if "mesh" not in old or old["mesh"][1] != pieces[meshIndex][1]: return False
+      if self.meshInclude is not None and not all(os.path.isfile(path) for name, path, Write in self._MeshIncludes(None, self._InputStamp())): return False
+      
+      # unchanged pieces are identified by name and key, everything from the first difference on is rewritten
+      numKept = 0
+      while numKept < min(len(pieces), len(oldPieces)) and pieces[numKept][:2] == oldPieces[numKept][:2]:
+         numKept += 1
+      if numKept == len(pieces) == len(oldPieces):
+         log.info("Output file %s is up to date.", self.outputFile)
+         return True
+      
+      reuse = dict((name, old[name]) for name, key, content in pieces[numKept:] if name in old and old[name][1] == key)
+      regenerated = [name for name, key, content in pieces[numKept:] if name not in reuse]
+      # node sets read from the .inp file have the original node IDs, geometric ones need the coordinates
+      if (self.renumber or self.mergeTol) and any(name.startswith("nset ") for name in regenerated): return False
+      if any("nset " + nset.name in regenerated for nset in self.conf_nsets if nset.select is not None): return False
+      log.debug(".Incremental build: keeping %d pieces, regenerating %s.", len(pieces) - len(regenerated), ", ".join(regenerated))
+      
+      if meshIndex < numKept:
+         # modify in place: buffer the unchanged pieces behind the first change, truncate and append
+         with open(self.outputFile, 'r+b', FeapWriter.BUFFER_SIZE) as f:
+            for name in reuse.keys():
+               f.seek(reuse[name][2])
+               reuse[name] = f.read(reuse[name][3])
+            offset = oldPieces[numKept][2] if numKept < len(oldPieces) else oldPieces[-1][2] + oldPieces[-1][3]
+            f.seek(offset)
+            f.truncate()
+            tail = [(name, key, reuse.get(name, content)) for name, key, content in pieces[numKept:]]
+            records = self._WritePieces(f, tail)
+         manifest.pieces = oldPieces[:numKept] + records
+      else:
+         # write a new file, copying the coor/elem blocks
+         tmpFile = "%s.tmp%d" % (self.outputFile, os.getpid())
+         try:
+            with open(self.outputFile, 'rb') as source:
+               with open(tmpFile, 'wb', FeapWriter.BUFFER_SIZE) as f:
+                  reuse[None] = source
+                  manifest.pieces = self._WritePieces(f, pieces, reuse)
+            os.rename(tmpFile, self.outputFile)
+         finally:
+            if os.path.isfile(tmpFile): os.remove(tmpFile)
+      
+      manifest.Save()
+      log.info("File %s written.", self.outputFile)
+      return True
+   
+   def _IndexedNsets(self, inputFile):
+      """
+      Node sets of the .inp file with boun/load cards from the config, in file order like Build() writes
+      them, found by indexing the keywords of the .inp file. Their members are read on demand.
+      """
+      if Compression(inputFile):
+         select = SectionFilter(nsets=[nset.name for nset in self.conf_nsets if nset.select is None], elsets=[], nodes=False, elems=False)
+         return self._AssignNsets(InpFileParser(inputFile, select=select).Parse().nsets)
+      
+      builder = MeshBuilder()
+      index = KeywordIndex(inputFile)
+      index.Close()
+      for section in index.sections:
+         if section.readMode == InpFileParser.READ_NSET:
+            builder.AddDeferredSet(section, _SectionLoader(inputFile, section.start, section.end))
+      return self._AssignNsets(builder.mesh.nsets)
+   
+   def _AssignNsets(self, nsets, mesh=None):
+      """
+      Transfer boun/load cards from the config file's nsets to the first mesh nset of the same name and return the nsets having any.
+      Config nsets selecting nodes geometrically are returned after them, with the nodes of 'mesh' in their box as members (none
+      if no mesh is given), found with a NodeGrid built on first use.
+      """
+      nsetsByName = _IndexByName(nsets)
+      selected = []
+      grid = None
+      for conf_nset in self.conf_nsets:
+         if conf_nset.select is not None:
+            if mesh is not None and mesh.NumNodes() > 0:
+               if grid is None:
+                  grid = NodeGrid(mesh)
+                  log.debug(".Indexed %d nodes in a grid of %s cells.", mesh.NumNodes(), "x".join([str(n) for n in grid.shape]))
+               rows = grid.Rows(*conf_nset.select.Box(grid.cMin, grid.cMax))
+               conf_nset.nodes = IdSet([mesh.nodeIds[row] for row in rows])
+               if len(rows) == 0: log.warning("No nodes found for nset '%s' (%s).", conf_nset.name, conf_nset.select)
+               else: log.debug(".Selected %d nodes for nset %s (%s).", len(rows), conf_nset.name, conf_nset.select)
+            if len(conf_nset.setBoun)>0 or len(conf_nset.setLoad)>0: selected.append(conf_nset)
+            continue
+         
+         # try to find this nset (from config file) in mesh and set boundary conditions
+         mesh_nset = nsetsByName.get(conf_nset.name)
+         if mesh_nset is None:
+            log.warning("Couldn't find nset '%s' (specified in %s) in mesh %s.", conf_nset.name, self.confName, self.inputFile)
+            continue
+         
+         mesh_nset.setBoun = conf_nset.setBoun
+         mesh_nset.setLoad = conf_nset.setLoad
+         if len(conf_nset.setBoun)>0: log.debug(".Adding 'boun' card '%s' for all nodes in nset %s.", mesh_nset.setBoun, mesh_nset.name)
+         if len(conf_nset.setLoad)>0: log.debug(".Adding 'load' card '%s' for all nodes in nset %s.", mesh_nset.setLoad, mesh_nset.name)
+         
+      return [nset for nset in nsets if len(nset.setBoun)>0 or len(nset.setLoad)>0] + selected
+   
+   def _DuplicateElems(self, mesh):
+      """ Append copies of all elements marked for duplication, with new IDs following the last element. """
+      lastId = mesh.elemIds[-1] if mesh.NumElems() > 0 else 0
+      numNewElems = 0
+      for row in sorted(mesh.elemDuplicate.keys()):
+         for matn in mesh.elemDuplicate[row]:
+            numNewElems += 1
+            mesh.AddElem(lastId + numNewElems, mesh.ElemNodes(row), matn, mesh.typeNames[mesh.elemTypes[row]])
+            
+   def _AssignElemTypes(self, mesh):
+      """ Set the material numbers of all elements whose type is mapped in the config file's elemTypes. """
+      typeNames = [name.upper() for name in mesh.typeNames]
+      for elemType in self.conf_elemTypes:
+         if elemType.name.upper() not in typeNames:
+            log.warning("Couldn't find any elements of type %s in the mesh.", elemType.name)
+            continue
+         
+         t = typeNames.index(elemType.name.upper())
+         elemMats = mesh.elemMats
+         numElems = 0
+         for row, rowType in enumerate(mesh.elemTypes):
+            if rowType == t:
+               elemMats[row] = elemType.Material(elemMats[row])
+               numElems += 1
+         if elemType.setMat is not None: log.debug(".Assigning material %d to %d elements of type %s.", elemType.setMat, numElems, elemType.name)
+         else: log.debug(".Adding %d to the material numbers of %d elements of type %s.", elemType.matOffset, numElems, elemType.name)
+         
+   def _CenterMesh(self, mesh):
+      """ Translate the origin to the center of the mesh's bounding box. """
+      if mesh.NumNodes() == 0: return
+      nDim = mesh.nDim
+      cMin, cMax = mesh.BoundingBox()
+      shift = [-cMin[d] - (cMax[d]-cMin[d])/2. for d in xrange(nDim)]
+      
+      if any(ds != 0. for ds in shift):
+         box = lambda lo, hi: "x".join(["[%.2f,%.2f]" % (lo[d], hi[d]) for d in xrange(nDim)])
+         log.debug(".Translating mesh from bounding box %s by (%s) to new bounding box %s.", box(cMin, cMax), ",".join(["%.2f" % ds for ds in shift]),
+                   box([cMin[d]+shift[d] for d in xrange(nDim)], [cMax[d]+shift[d] for d in xrange(nDim)]))
+         for d in xrange(nDim):
+            mesh.coords[d::nDim] = array('d', [c + shift[d] for c in mesh.coords[d::nDim]])
+            
+   def _WriteOutput(self, mesh, nsets, writer=None):
+      """
+      Write the complete output file for the mesh and the node sets having boun/load cards, or complete the
+      output of a pipelined build with its FeapWriter 'writer' (see _ParsePipelined()).
+      """
+      if self.outputStream is not None:
+         self._WritePieces(_CountingStream(self.outputStream), self._Pieces(mesh, nsets))
+         log.info("Output written.")
+         return
+      
+      manifest = OutputManifest(self.outputFile)
+      if writer is None:
+         with OpenOutput(self.outputFile) as f:
+            manifest.pieces = self._WritePieces(f, self._Pieces(mesh, nsets))
+      else:
+         pieces = self._Pieces(mesh, nsets)
+         with writer.f as f:
+            self._WritePieces(f, pieces[[name for name, key, content in pieces].index("mesh"):], writer=writer)
+         
+      log.info("File %s written.", self.outputFile)
+      
+      # a manifest left by an earlier incremental build doesn't describe this output
+      if self.incremental: manifest.Save()
+      else: manifest.Remove()
+      
+   def _DiscardOutput(self, f):
+      """ Stop the writer thread 'f' (a _WriteBehind) of a failed pipelined build and remove its incomplete output file. """
+      try: f.close()
+      except Exception: pass # the build's own error is reported
+      if os.path.isfile(self.outputFile): os.remove(self.outputFile)
+      
+   def _ConvertMesh(self, mesh, writer=None):
+      """
+      The build stages following the parsing of the mesh, up to writing the output (completing the output
+      of a pipelined build with its FeapWriter 'writer'). Returns EXIT_SUCCESS or EXIT_FAILURE.
+      """
+      # check the integrity of the mesh, no output is written for a mesh with errors
+      if self.validate:
+         with self.profiler.Stage("validate") as stage:
+            self.validation = MeshValidator(mesh).Validate()
+            stage.Count(mesh.NumElems(), "elems")
+         MeshValidator.Report(self.validation)
+         if self.validation["errors"] > 0:
+            log.error("Mesh validation failed, output not written.")
+            return EXIT_FAILURE
+      
+      # merge coincident nodes, e.g. of parts meshed separately
+      if self.mergeTol:
+         with self.profiler.Stage("merge") as stage:
+            stage.Count(mesh.NumNodes(), "nodes")
+            NodeMerger(mesh, self.mergeTol).Merge()
+      
+      # assign materials to mesh's ELSETS and set element materials accordingly
+      with self.profiler.Stage("elsets") as stage:
+         self._AssignElsets(mesh)
+         stage.Count(mesh.NumElems(), "elems")
+      
+      # duplicate elements
+      with self.profiler.Stage("duplicate") as stage:
+         numElems = mesh.NumElems()
+         self._DuplicateElems(mesh)
+         stage.Count(mesh.NumElems() - numElems, "elems")
+      
+      # map element types to FEAP materials
+      if len(self.conf_elemTypes) > 0:
+         with self.profiler.Stage("types") as stage:
+            self._AssignElemTypes(mesh)
+            stage.Count(mesh.NumElems(), "elems")
+      
+      # renumber nodes to reduce the profile of the stiffness matrix
+      if self.renumber:
+         with self.profiler.Stage("renumber") as stage:
+            NodeRenumberer(mesh).Renumber(self.renumber)
+            stage.Count(mesh.NumNodes(), "nodes")
+      
+      # assign boundary conditions to mesh's NSETS
+      with self.profiler.Stage("nsets"):
+         nsets = self._AssignNsets(mesh.nsets, mesh)
+      
+      # translate origin to center of mesh?
+      if self.centerMesh:
+         with self.profiler.Stage("center") as stage:
+            self._CenterMesh(mesh)
+            stage.Count(mesh.NumNodes(), "nodes")
+      
+      # write output: header, coor, elem, custom input and boun/load blocks, footer
+      with self.profiler.Stage("write") as stage:
+         self._WriteOutput(mesh, nsets, writer)
+         if self.outputStream is None: stage.Count(os.path.getsize(self.outputFile) / 1e6, "MB")
+      
+      return EXIT_SUCCESS
+      
+   def Build(self, confFile=None, mesh=None):
+      """
+      Execute the complete build process from .inp to FEAP. This is the only
+      function that should be invoked from outside.
+      An already parsed mesh for the config's input file may be given, it will be modified.
+      """
+      
+      profiler = self.profiler
+      self.inputDigest = None
+      
+      # parse conf file
+      with profiler.Stage("config"):
+         status = self._ParseConfig(confFile)
+         
+      if EXIT_SUCCESS == status:
+         
+         # parse header and footer
+         with profiler.Stage("read"):
+            if self.headerFile: 
+               with open(os.path.join(self.workingDir, self.headerFile), 'r') as f:
+                  self.headerString = f.read()
+            if self.footerFile:
+               with open(os.path.join(self.workingDir, self.footerFile), 'r') as f:
+                  self.footerString = f.read()
+         
+         # output to a stream is always generated completely, in this thread
+         if self.outputStream is not None:
+            self.incremental = self.pipeline = False
+            self.meshInclude = None
+         
+         # only regenerate the changed parts of a previous output?
+         if self.incremental and Compression(self.outputFile, sniff=False):
+            log.warning("Compressed output %s cannot be modified, incremental build disabled.", self.outputFile)
+            self.incremental = False
+         if self.incremental and mesh is None:
+            with profiler.Stage("incremental"):
+               done = self._BuildIncremental()
+            if done: return EXIT_SUCCESS
+         
+         # overlap reading, parsing and writing? the output must be written in file order
+         if self.pipeline and (self.incremental or self.renumber or self.mergeTol or self.meshInclude is not None):
+            log.warning("Pipelined builds don't support %s, pipeline disabled.", "incremental builds" if self.incremental else
+                        "renumbering" if self.renumber else "merging nodes" if self.mergeTol else "mesh include files")
+            self.pipeline = False
+         
+         # parse .inp file (mesh)
+         writer = None # FeapWriter of a pipelined build, already writing the output
+         if mesh is None:
+            with profiler.Stage("parse") as stage:
+               inputFile = os.path.join(self.workingDir, self.inputFile)
+               if self.pipeline: mesh, writer = self._ParsePipelined(inputFile)
+               else: mesh = self._ParseInputFile(inputFile)
+               stage.Count(os.path.getsize(inputFile) / 1e6, "MB")
+         
+         # the remaining stages complete the output of a pipelined build, which is discarded if they fail
+         try: status = self._ConvertMesh(mesh, writer)
+         except:
+            if writer is not None: self._DiscardOutput(writer.f)
+            raise
+         if status != EXIT_SUCCESS and writer is not None: self._DiscardOutput(writer.f)
+         return status
+      
+      return status # the config file couldn't be parsed
+
+def ParseMesh(conf, jobs=1):
+   """
+   Parse the input file of a config (dict or file name, see Convert()) with all its node and element sets,
+   so that the mesh can be converted several times with different configs.
+   """
+   parser = ConfigFileParser(conf, jobs=jobs)
+   parser.outputStream = StringIO() # the config doesn't need an output file
+   if EXIT_SUCCESS != parser._ParseConfig():
+      raise ValueError("Error: Invalid config, see the log for details.")
+   return parser._ParseInputFile(os.path.join(parser.workingDir, parser.inputFile), SectionFilter())
+   
+def Convert(conf, mesh=None, stream=None, jobs=1):
+   """
+   Convert an Abaqus .inp file in-process, e.g. from a driver script converting many variants of a model.
+   'conf' is a dict with the parameters of a config file (relative paths are relative to the current directory)
+   or the name of a config file. An already parsed mesh of its input file may be given (see ParseMesh()), which
+   isn't modified, so it can be reused for further conversions.
+   The output is written to the file-like object 'stream' if given, otherwise it is returned as a string. The
+   config's "output" is optional and ignored, as are "incremental", "pipeline" and "meshInclude". Nothing is printed unless
+   enabled by LogToConsole(). Raises ValueError if the conversion fails.
+   """
+   parser = ConfigFileParser(conf, jobs=jobs)
+   parser.outputStream = stream if stream is not None else StringIO()
+   if EXIT_SUCCESS != parser.Build(mesh=copy.deepcopy(mesh) if mesh is not None else None):
+      raise ValueError("Error: Conversion failed, see the log for details.")
+   if stream is None: return parser.outputStream.getvalue()
+   
+class _CaptureOutput:
+   """ Context manager redirecting everything written to sys.stdout (including the log, see LogToConsole()) into the string buffer 'text'. """
+   def __enter__(self):
+      self.stdout, sys.stdout = sys.stdout, StringIO()
+      return self
+   
+   def __exit__(self, *excInfo):
+      self.text = sys.stdout.getvalue()
+      sys.stdout = self.stdout
+      
+_batchMesh = None # mesh shared with the worker processes of a BatchConverter
+   
+def _InitBatchWorker(mesh):
+   global _batchMesh
+   _batchMesh = mesh
+   
+def _BuildBatchConfig(confFile, mesh=None):
+   """ Build a config in a batch on a copy of the mesh (or the worker's shared mesh). Returns (status, seconds, log). """
+   start = time.time()
+   status = "ok"
+   with _CaptureOutput() as output:
+      try:
+         if EXIT_SUCCESS != ConfigFileParser(confFile).Build(mesh=mesh if mesh is not None else copy.deepcopy(_batchMesh)):
+            status = "failed"
+      except Exception as e:
+         log.error("%s", e)
+         status = "failed"
+   return status, time.time() - start, output.text
+   
+class BatchConverter:
+   """
+   Converts a batch of config files, e.g. the load cases of a parameter study, which typically
+   share only a few different .inp files. Configs are grouped by their input file (and nodesPerElem),
+   each distinct mesh is parsed once, and the remaining build stages of all configs in a group run
+   on private copies of it in a pool of worker processes. Worker processes inherit the mesh when they
+   are started. The log of each config is printed when it is finished, followed by a summary of all
+   configs with status and timings.
+   """
+   def __init__(self, confFiles, jobs=1):
+      self.confFiles = confFiles
+      self.jobs = jobs
+      self.results = {} # config file -> (status, parse time, build time)
+      
+   def _Group(self):
+      """
+      Return (list of config files, SectionFilter) for each group of configs sharing the same mesh, in order of first
+      appearance. The filter selects the sections of the .inp file needed by any config of the group.
+      """
+      groups = {}
+      filters = {}
+      order = []
+      for confFile in self.confFiles:
+         with _CaptureOutput() as output:
+            try:
+               parser = ConfigFileParser(confFile)
+               key = parser.InputKey() if EXIT_SUCCESS == parser._ParseConfig() else None
+            except Exception as e:
+               log.error("%s", e)
+               key = None
+         if key is None:
+            sys.stdout.write(output.text)
+            self.results[confFile] = ("invalid config", 0., 0.)
+            continue
+         if key not in groups:
+            groups[key] = []
+            filters[key] = parser.SectionFilter()
+            order.append(key)
+         groups[key].append(confFile)
+         filters[key] = filters[key].Union(parser.SectionFilter())
+      return [(groups[key], filters[key]) for key in order]
+   
+   def Run(self):
+      """ Convert all configs. Returns EXIT_SUCCESS if all of them were successful. """
+      for group, select in self._Group():
+         log.info("Batch: parsing mesh for %d config(s) %s.", len(group), ", ".join(group))
+         start = time.time()
+         try:
+            parser = ConfigFileParser(group[0], jobs=self.jobs)
+            parser._ParseConfig()
+            mesh = parser._ParseInputFile(os.path.join(parser.workingDir, parser.inputFile), select)
+         except Exception as e:
+            log.error("%s", e)
+            for confFile in group: self.results[confFile] = ("parse failed", time.time() - start, 0.)
+            continue
+         parseTime = time.time() - start
+         
+         if self.jobs > 1 and len(group) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(group)), _InitBatchWorker, (mesh,))
+            try:
+               results = pool.imap(_BuildBatchConfig, group)
+               for confFile in group: self._Report(confFile, parseTime, results.next())
+               pool.close()
+            finally:
+               pool.terminate()
+         else:
+            for confFile in group: self._Report(confFile, parseTime, _BuildBatchConfig(confFile, copy.deepcopy(mesh)))
+         del mesh
+            
+      log.info("\nBatch summary:")
+      log.info("%-40s %-16s %10s %10s", "config", "status", "parse [s]", "build [s]")
+      for confFile in self.confFiles:
+         status, parseTime, buildTime = self.results[confFile]
+         log.info("%-40s %-16s %10.2f %10.2f", confFile, status, parseTime, buildTime)
+      numFailed = len([r for r in self.results.values() if r[0] != "ok"])
+      log.info("%d of %d configs converted successfully.", len(self.confFiles) - numFailed, len(self.confFiles))
+      
+      return EXIT_SUCCESS if numFailed == 0 else EXIT_FAILURE
+   
+   def _Report(self, confFile, parseTime, result):
+      status, buildTime, text = result
+      log.info("--- %s (%s) ---", confFile, status)
+      sys.stdout.write(text)
+      self.results[confFile] = (status, parseTime, buildTime)
+
+class _WatchedConfig(ConfigFileParser):
+   """ ConfigFileParser building incrementally and taking its meshes from a ConfigWatcher instead of parsing them. """
+   def __init__(self, confFile, watcher):
+      ConfigFileParser.__init__(self, confFile, jobs=watcher.jobs)
+      self.watcher = watcher
+
+   def _ParseConfig(self, confFile=None):
+      status = ConfigFileParser._ParseConfig(self, confFile)
+      self.incremental = True
+      return status
+
+   def _ParseInputFile(self, inputFile, select=None, **kwargs):
+      # a pipelined build (compressed output isn't built incrementally) passes 'readAhead' and 'nodesListener',
+      # the hot mesh never reports its nodes, its coor block is written completely with the rest of the mesh
+      return self.watcher.Mesh(self, inputFile)
+
+class ConfigWatcher:
+   """
+   Long-running conversion of a config file, which is rebuilt whenever the config file or any of the
+   input, header and footer files it refers to change (checked every 'interval' seconds by their size
+   and modification time).
+
+   The parsed mesh is kept in memory as long as the .inp file doesn't change, and each build runs on a
+   copy of it. Builds are incremental (see OutputManifest), so e.g. after editing the footer only the
+   footer is rewritten, and after changing elsets the hot mesh is converted without parsing it again.
+   """
+   def __init__(self, confFile, jobs=1, interval=0.5):
+      self.confFile = confFile
+      self.jobs = jobs
+      self.interval = interval
+      self.files = [confFile] # files watched for changes
+      self.stamps = None
+      self.meshKey = None # (real path, size, mtime, nodesPerElem) of the .inp file 'mesh' was parsed from
+      self.mesh = None
+
+   def Mesh(self, parser, inputFile):
+      """ Return a copy of the hot mesh for 'inputFile', parsing the file with 'parser' first if it changed. """
+      st = os.stat(inputFile)
+      key = (os.path.realpath(inputFile), st.st_size, st.st_mtime, parser.nodesPerElem)
+      if key != self.meshKey:
+         self.mesh = self.meshKey = None
+         self.mesh = ConfigFileParser._ParseInputFile(parser, inputFile, SectionFilter()) # all sets, the config may change
+         self.meshKey = key
+      else:
+         log.debug(".Using mesh of %s kept in memory.", inputFile)
+      return copy.deepcopy(self.mesh)
+
+   def _Stamps(self):
+      stamps = []
+      for filename in self.files:
+         try:
+            st = os.stat(filename)
+            stamps.append((st.st_size, st.st_mtime))
+         except OSError:
+            stamps.append(None)
+      return stamps
+
+   def Poll(self):
+      """ Rebuild the config if any watched file changed since the last build. Returns True if it was rebuilt. """
+      if self._Stamps() == self.stamps: return False
+
+      start = time.time()
+      parser = _WatchedConfig(self.confFile, self)
+      try:
+         status = parser.Build()
+      except Exception as e:
+         log.error("%s", e)
+         status = EXIT_FAILURE
+
+      # watch the files named in the config as it is now
+      self.files = [self.confFile]
+      for filename in (parser.inputFile, parser.headerFile, parser.footerFile):
+         if filename: self.files.append(os.path.join(parser.workingDir, filename))
+      self.stamps = self._Stamps()
+
+      log.info("%s after %.2f s, watching %s.", "Converted" if status == EXIT_SUCCESS else "Conversion failed", time.time() - start, ", ".join(self.files))
+      return True
+
+   def Run(self):
+      """ Rebuild on changes until interrupted with Ctrl+C. """
+      log.info("Watching %s, press Ctrl+C to stop.", self.confFile)
+      try:
+         while True:
+            self.Poll()
+            time.sleep(self.interval)
+      except KeyboardInterrupt:
+         log.info("Stopped watching %s.", self.confFile)
+      return EXIT_SUCCESS
+
+def main():
+   argParser = argparse.ArgumentParser(description="Convert Abaqus .inp job files into FEAP input files.")
+   argParser.add_argument("config", nargs="*", help="JSON config file (several files or glob patterns with --batch)")
+   argParser.add_argument("-j", "--jobs", type=int, default=1,
+                          help="number of processes used to parse large *Node/*Element blocks and to build configs in batch mode (default: 1)")
+   argParser.add_argument("--batch", action="store_true",
+                          help="convert all given configs, parsing each distinct .inp file only once")
+   argParser.add_argument("--profile", nargs="?", const="", metavar="METRICS",
+                          help="print time, memory and throughput of each build stage and write them to the JSON file METRICS (default: <output>.metrics.json)")
+   argParser.add_argument("--cprofile", metavar="STAGE", choices=StageProfiler.STAGES,
+                          help="with --profile, run the build stage STAGE (%s) under cProfile and save its statistics next to the metrics file" % ", ".join(StageProfiler.STAGES))
+   argParser.add_argument("--validate", nargs="?", const="", metavar="REPORT",
+                          help="check the parsed mesh for errors before converting it, exit with an error code if there are any, and write the report to the JSON file REPORT")
+   argParser.add_argument("--watch", action="store_true",
+                          help="keep running and convert the config again whenever it or its input, header or footer file changes")
+   argParser.add_argument("-q", "--quiet", action="store_true",
+                          help="only print warnings and errors")
+   args = argParser.parse_args()
+   LogToConsole(logging.WARNING if args.quiet else logging.DEBUG)
+   
+   if args.validate is not None and (args.batch or args.watch):
+      argParser.error("--validate can't be combined with --batch or --watch")
+   
+   if args.batch:
+      confFiles = []
+      for pattern in args.config:
+         confFiles.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+      return BatchConverter(confFiles, jobs=args.jobs).Run()
+   
+   if len(args.config) > 1:
+      argParser.error("only one config file can be converted without --batch")
+   elif len(args.config) == 1:
+      inputFile = args.config[0]
+   else:
+      inputFile = raw_input("Input file: ")
+      
+   if args.watch:
+      return ConfigWatcher(inputFile, jobs=args.jobs).Run()
+   
+   parser = ConfigFileParser(inputFile, jobs=args.jobs)
+   if args.profile is not None: parser.profiler = StageProfiler(args.cprofile)
+   parser.validate = args.validate is not None
+   status = parser.Build()
+   
+   if args.validate and parser.validation is not None:
+      with open(args.validate, 'w') as f:
+         json.dump(dict(parser.validation, config=inputFile, input=parser.inputFile), f, indent=1, sort_keys=True)
+      log.info("Validation report written to %s.", args.validate)
+   
+   if args.profile is not None:
+      log.info("\nProfile:")
+      parser.profiler.Report()
+      if args.profile or parser.outputFile:
+         parser.profiler.Save(args.profile or parser.outputFile + ".metrics.json", config=inputFile, input=parser.inputFile,
+                              output=parser.outputFile, jobs=args.jobs)
+   return status
+
+if __name__=="__main__":
+   sys.exit(main())
\ No newline at end of file
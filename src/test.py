@@ -1,6 +1,31 @@
 # -*- coding: utf-8 -*-
 
-import unittest, inp2feap, random
+import unittest, inp2feap, bench, random, os, tempfile, shutil, json, gzip, bz2, logging, threading, subprocess, sys
+from cStringIO import StringIO
+
+SMALL_INP = """*Heading
+** comment
+*Node
+      1,          0.,          0.,           0.
+      2,          1.,          0.,           0.
+      3,          1.,          1.,           0.
+      4,          0.,          1.,           0.
+*Element, type=S4R
+1, 1, 2, 3, 4
+*Nset, nset=N-EDGE
+ 1, 2
+*Elset, elset=E-ALL, generate
+ 1, 1, 1
+*Material, name=Steel
+*Elastic
+210000., 0.3
+"""
+
+def WriteTempInp(text):
+   """ Write 'text' to a temporary .inp file and return its filename. """
+   fd, filename = tempfile.mkstemp(suffix='.inp')
+   with os.fdopen(fd, 'w') as f: f.write(text)
+   return filename
 
 class TestNode(unittest.TestCase):
    def test_negative_id(self):
@@ -76,6 +101,1065 @@ class RandomNodeTestCase(unittest.TestCase):
          for d in xrange(len(args)-1):
             self.assertLess(abs(args[1+d]-float(params[2+d])), EPS) # coordinates valid with sufficient accuracy
          
+class TestAbaqusMesh(unittest.TestCase):
+   def setUp(self):
+      self.mesh = inp2feap.AbaqusMesh()
+      self.mesh.AddNode(1, 0., 0., 0.)
+      self.mesh.AddNode(2, 1., 0., 0.)
+      self.mesh.AddNode(3, "1.", "1.", "0.")
+      self.mesh.AddElem(10, [1, 2, 3])
+      self.mesh.AddElem(11, ["3", "2", "1"], 4)
+      
+   def test_columns(self):
+      """ Test if nodes and elements are stored in flat typed columns. """
+      self.assertEqual(self.mesh.nDim, 3)
+      self.assertEqual(self.mesh.nodesPerElem, 3)
+      self.assertEqual(list(self.mesh.nodeIds), [1, 2, 3])
+      self.assertEqual(list(self.mesh.coords), [0., 0., 0., 1., 0., 0., 1., 1., 0.])
+      self.assertEqual(list(self.mesh.elemNodes), [1, 2, 3, 3, 2, 1])
+      self.assertEqual(list(self.mesh.elemMats), [1, 4])
+      
+   def test_views(self):
+      """ Test if Node and Element views read from and write to the mesh columns. """
+      n = self.mesh.nodes[-1]
+      self.assertEqual((n.id, n.x, n.y, n.z), (3, 1., 1., 0.))
+      n.z = 2.5
+      self.assertEqual(self.mesh.coords[8], 2.5)
+      
+      e = self.mesh.elems[1]
+      self.assertEqual((e.id, e.nodes, e.matn), (11, [3, 2, 1], 4))
+      e.matn = 7
+      self.assertEqual(self.mesh.elemMats[1], 7)
+      self.assertEqual(str(e), "      11, 7, 3, 2, 1\n")
+      self.assertEqual([x.id for x in self.mesh.elems], [10, 11])
+      
+   def test_inconsistentRows(self):
+      """ Test if ValueError is raised for nodes or elements not matching the mesh's row width. """
+      with self.assertRaises(ValueError):
+         self.mesh.AddNode(4, 1., 2.)
+      with self.assertRaises(ValueError):
+         self.mesh.AddElem(12, [1, 2, 3, 4])
+      self.assertEqual(self.mesh.NumNodes(), 3)
+      self.assertEqual(self.mesh.NumElems(), 2)
+      
+   def test_mixedTypes(self):
+      """ Test if elements of different types are stored in CSR form without padding. """
+      mesh = inp2feap.AbaqusMesh()
+      mesh.AddElem(1, [1, 2, 3, 4], elemType="S4R")
+      mesh.AddElem(2, [3, 4, 5], elemType="S3R")
+      mesh.AddElem(3, [5, 6, 7, 8], elemType="S4R")
+      self.assertEqual(mesh.nodesPerElem, inp2feap.AbaqusMesh.MIXED)
+      self.assertEqual(list(mesh.elemOffsets), [0, 4, 7, 11])
+      self.assertEqual((mesh.typeNames, mesh.typeNodes), (["S4R", "S3R"], [4, 3]))
+      self.assertEqual([(e.nodes, e.numNodes, e.type) for e in mesh.elems],
+                       [([1, 2, 3, 4], 4, "S4R"), ([3, 4, 5], 3, "S3R"), ([5, 6, 7, 8], 4, "S4R")])
+      self.assertEqual(mesh.TypeRuns(), [(0, 0, 1), (1, 1, 2), (0, 2, 3)])
+      with self.assertRaises(ValueError):
+         mesh.AddElem(4, [1, 2, 3], elemType="S4R")
+         
+class TestIdSet(unittest.TestCase):
+   def test_runsAndIds(self):
+      """ Test if generated ranges and explicit IDs are iterated in ascending order and found by membership tests. """
+      ids = inp2feap.IdSet([9, 2, 7])
+      ids.AddRange(1, 10, 3)
+      ids.AddRange(100, 99)
+      self.assertEqual(ids.runs, [(1, 10, 3)])
+      self.assertEqual(list(ids), [1, 2, 4, 7, 7, 9, 10])
+      self.assertEqual(len(ids), 7)
+      self.assertEqual([i for i in xrange(12) if i in ids], [1, 2, 4, 7, 9, 10])
+      with self.assertRaises(ValueError):
+         ids.AddRange(1, 5, 0)
+         
+   def test_generatedSets(self):
+      """ Test if generated node and element sets are stored as runs without expanding them. """
+      filename = WriteTempInp(SMALL_INP + "*Nset, nset=N-ALL, generate\n 1, 4000000, 1\n*Elset, elset=E-ODD, generate\n1, 9, 2\n")
+      try:
+         mesh = inp2feap.InpFileParser(filename).Parse()
+      finally:
+         os.remove(filename)
+      nodes = mesh.nsets[1].nodes
+      self.assertEqual((mesh.nsets[1].generate, nodes.runs, len(nodes.Ids()), len(nodes)), (True, [(1, 4000000, 1)], 0, 4000000))
+      self.assertTrue(3999999 in nodes and 0 not in nodes)
+      self.assertEqual(mesh.elsets[1].elems, [1, 3, 5, 7, 9])
+      
+class TestNodeRenumberer(unittest.TestCase):
+   def setUp(self):
+      """ A strip of 20x2 quads with node IDs numbered across the strip's length and gaps in between. """
+      self.mesh = inp2feap.AbaqusMesh()
+      nodeId = lambda i, j: 1000 * j + 7 * i + 5
+      for j in xrange(3):
+         for i in xrange(21):
+            self.mesh.AddNode(nodeId(i, j), float(i), float(j))
+      for j in xrange(2):
+         for i in xrange(20):
+            self.mesh.AddElem(len(self.mesh.elemIds) + 1, [nodeId(i, j), nodeId(i+1, j), nodeId(i+1, j+1), nodeId(i, j+1)])
+      nset = inp2feap.NodeSet()
+      nset.nodes = [nodeId(0, j) for j in xrange(3)]
+      self.mesh.nsets.append(nset)
+      
+   def _Coords(self):
+      """ Coordinates of the nodes of each element and of the nset. """
+      rowOf = self.mesh.NodeRowIndex()
+      xy = lambda nid: tuple(self.mesh.coords[2*rowOf[nid]:2*rowOf[nid]+2])
+      return [xy(nid) for nid in self.mesh.elemNodes], sorted([xy(nid) for nid in self.mesh.nsets[0].nodes])
+      
+   def test_rcm(self):
+      """ Test if RCM renumbering compacts the IDs, keeps the geometry and reduces the bandwidth. """
+      coords = self._Coords()
+      profile, bandwidth = inp2feap.NodeRenumberer.Metrics(self.mesh.elemNodes, self.mesh.elemOffsets)
+      inp2feap.NodeRenumberer(self.mesh).Renumber("rcm")
+      self.assertEqual(list(self.mesh.nodeIds), range(1, 64))
+      self.assertEqual(self._Coords(), coords)
+      newProfile, newBandwidth = inp2feap.NodeRenumberer.Metrics(self.mesh.elemNodes, self.mesh.elemOffsets)
+      self.assertLess(newProfile, profile)
+      self.assertLess(newBandwidth, bandwidth / 100)
+      
+   def test_compact(self):
+      """ Test if compact renumbering keeps the order of the node IDs. """
+      coords = self._Coords()
+      inp2feap.NodeRenumberer(self.mesh).Renumber("compact")
+      self.assertEqual(self._Coords(), coords)
+      self.assertEqual(list(self.mesh.nsets[0].nodes), [1, 22, 43])
+      
+class BuildTestCase(unittest.TestCase):
+   """ Base class for tests running a complete conversion in a temporary directory. """
+   def setUp(self):
+      self.tmpDir = tempfile.mkdtemp()
+      
+   def tearDown(self):
+      shutil.rmtree(self.tmpDir)
+      
+   def Build(self, inpText, **conf):
+      """ Convert 'inpText' using the config parameters 'conf' and return the output file contents. """
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(inpText)
+      conf.setdefault("input", "model.inp")
+      conf.setdefault("output", os.path.join(self.tmpDir, "iModel"))
+      confFile = os.path.join(self.tmpDir, "model.json")
+      with open(confFile, 'w') as f: json.dump(conf, f)
+      
+      inp2feap.ConfigFileParser(confFile).Build()
+      with open(conf["output"], 'r') as f: return f.read()
+      
+class TestNodeMerger(BuildTestCase):
+   def setUp(self):
+      """ Two strips of 3x2 quads meshed separately, the second one with its own node IDs and slightly moved edge nodes at x = 3. """
+      BuildTestCase.setUp(self)
+      self.mesh = inp2feap.AbaqusMesh()
+      for part, offset in ((0, 0), (1, 100)):
+         nodeId = lambda i, j: offset + 4 * j + i + 1
+         for j in xrange(3):
+            for i in xrange(4):
+               self.mesh.AddNode(nodeId(i, j), 3. * part + i + (1e-7 * j if part and i == 0 else 0.), float(j))
+         for j in xrange(2):
+            for i in xrange(3):
+               self.mesh.AddElem(len(self.mesh.elemIds) + 1, [nodeId(i, j), nodeId(i+1, j), nodeId(i+1, j+1), nodeId(i, j+1)])
+      nset = inp2feap.NodeSet()
+      nset.nodes = [101, 105, 109, 102]
+      self.mesh.nsets.append(nset)
+      
+   def test_merge(self):
+      """ Test if the edge nodes of the second part are merged into those of the first one and dropped. """
+      self.assertEqual(inp2feap.NodeMerger(self.mesh, 1e-4).Merge(), 3)
+      self.assertEqual(self.mesh.NumNodes(), 21)
+      self.assertNotIn(101, self.mesh.nodeIds)
+      self.assertEqual(list(self.mesh.ElemNodes(6)), [4, 102, 106, 8])
+      self.assertEqual(list(self.mesh.nsets[0].nodes), [4, 8, 12, 102])
+      rowOf = self.mesh.NodeRowIndex()
+      self.assertEqual(list(self.mesh.coords[2*rowOf[102]:2*rowOf[102]+2]), [4., 0.])
+      
+      # nothing closer than the tolerance, also across cell boundaries of the spatial hash
+      self.assertEqual(inp2feap.NodeMerger(self.mesh, 1e-9).Merge(), 0)
+      mesh = inp2feap.AbaqusMesh()
+      for nid, x in ((1, 0.), (2, 0.9), (3, 1.1), (4, 1.35), (5, 1.8)): mesh.AddNode(nid, x, 0., 0.)
+      self.assertEqual(inp2feap.NodeMerger(mesh, 0.26).Merge(), 2)
+      self.assertEqual(list(mesh.nodeIds), [1, 2, 5])
+      
+   def test_config(self):
+      """ Test if a conversion with "mergeNodes" writes the merged mesh. """
+      inp = "*Node\n1, 0., 0.\n2, 1., 0.\n3, 1., 1.\n4, 0., 1.\n11, 1., 0.\n12, 2., 0.\n13, 2., 1.\n14, 1.000001, 1.\n" + \
+            "*Element\n1, 1, 2, 3, 4\n2, 11, 12, 13, 14\n*Nset, nset=RIGHT\n12, 13\n*Nset, nset=MIDDLE\n11, 14\n"
+      nsets = [{ "name" : "RIGHT", "setLoad" : "1, 0" }, { "name" : "MIDDLE", "setBoun" : "0, 1" }]
+      out = self.Build(inp, mergeNodes={ "tol" : 1e-4 }, nsets=nsets)
+      self.assertNotIn("\n11, ", out)
+      self.assertIn("       2, 1, 2, 12, 13, 3\n", out)
+      self.assertIn("boun ** NSET=MIDDLE\n2, 0, 0, 1\n3, 0, 0, 1\n", out)
+      
+class TestMeshValidator(BuildTestCase):
+   INP = """*Node
+1, 0., 0.
+2, 1., 0.
+3, 1., 1.
+3, 0., 1.
+5, 5., 5.
+*Element, type=CPS4
+1, 1, 2, 3, 4
+2, 1, 2, 2, 3
+*Element, type=C3D8
+2, 1, 2, 3, 3, 1, 2, 3, 3
+*Nset, nset=FIX
+1, 9
+"""
+   def test_checks(self):
+      """ Test if every kind of error is found with the offending IDs. """
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(self.INP)
+      mesh = inp2feap.InpFileParser(os.path.join(self.tmpDir, "model.inp")).Parse()
+      report = inp2feap.MeshValidator(mesh).Validate()
+      found = dict((check["check"], (check["count"], check["examples"])) for check in report["checks"])
+      self.assertEqual(found, { "duplicateNodeIds" : (1, [3]), "duplicateElemIds" : (1, [2]), "undefinedElemNodes" : (1, ["1 (node 4)"]),
+                                "degenerateElems" : (2, [2, 2]), "elemDimension" : (1, ["C3D8"]), "undefinedNsetNodes" : (1, ["FIX (node 9)"]),
+                                "unusedNodes" : (1, [5]) })
+      self.assertEqual((report["errors"], report["warnings"]), (7, 1))
+      self.assertEqual([inp2feap.MeshValidator.TypeDim(t) for t in ("C3D20R", "S4R", "CPE8", "CAX4", "T2D2", "B31", "DCOUP3D")], [3, 3, 2, 2, 2, 3, None])
+
+   def test_sparseIds(self):
+      """ Test if sparse IDs are kept in a sorted array instead of flags and found like dense ones. """
+      big = 10**8
+      for ids, dense in (([3, 1, 7, 3], True), ([3, big, 7, 3], False), ([3, -1, 7, 3], False)):
+         idSet = inp2feap.IdBitmap(ids)
+         self.assertEqual(idSet.flags is not None, dense)
+         self.assertEqual(len(idSet), 3)
+         self.assertEqual([i for i in (-1, 1, 3, 5, 7, big, 2*big) if i in idSet], sorted(set(ids)))
+         self.assertEqual(idSet.Missing([5, 7, 2, 5, 2*big]), [2, 5, 2*big])
+         self.assertEqual(list(idSet), sorted(set(ids)))
+         for other in ([1, 7], [2, big, 2*big], range(2, 500)):
+            self.assertEqual(idSet.Difference(inp2feap.IdBitmap(other)), sorted(set(ids) - set(other)))
+
+      mesh = inp2feap.AbaqusMesh()
+      for nid, x in ((1, 0.), (big, 1.), (big, 2.), (2*big, 3.)): mesh.AddNode(nid, x, 0.)
+      mesh.AddElem(1, [1, big, 3*big], elemType="CPS3")
+      report = inp2feap.MeshValidator(mesh).Validate()
+      found = dict((check["check"], (check["count"], check["examples"])) for check in report["checks"] if check["count"] > 0)
+      self.assertEqual(found, { "duplicateNodeIds" : (1, [big]), "undefinedElemNodes" : (1, ["1 (node %d)" % (3*big)]), "unusedNodes" : (1, [2*big]) })
+
+   def test_build(self):
+      """ Test if a build with validation fails without writing output for a broken mesh, but not for a valid one. """
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(self.INP)
+      for pipeline in (False, True):
+         parser = inp2feap.ConfigFileParser({ "input" : os.path.join(self.tmpDir, "model.inp"), "output" : os.path.join(self.tmpDir, "iModel"), "pipeline" : pipeline })
+         parser.validate = True
+         self.assertEqual(parser.Build(), inp2feap.EXIT_FAILURE)
+         self.assertFalse(os.path.exists(os.path.join(self.tmpDir, "iModel")))
+         
+      parser = inp2feap.ConfigFileParser({ "input" : os.path.join(self.tmpDir, "model.inp"), "output" : os.path.join(self.tmpDir, "iModel") })
+      with open(parser.confFile["input"], 'w') as f: f.write("*Node\n1, 0., 0.\n2, 1., 0.\n3, 1., 1.\n*Element, type=CPS3\n1, 1, 2, 3\n")
+      parser.validate = True
+      self.assertEqual(parser.Build(), inp2feap.EXIT_SUCCESS)
+      self.assertEqual(parser.validation["errors"] + parser.validation["warnings"], 0)
+      
+class TestElsets(BuildTestCase):
+   INP = """*Node
+1, 0., 0.
+2, 1., 0.
+3, 1., 1.
+*Element, type=T3D2
+1, 1, 2
+2, 2, 3
+3, 3, 1
+*Elset, elset=A, generate
+1, 3, 1
+*Elset, elset=B
+2, 3, 99
+*Elset, elset=A
+3
+"""
+   def test_lastElsetWins(self):
+      """ Test if elements in several elsets get the material of the last one (the second, unconfigured elset A
+          resets element 3 to material 1) and duplicates are appended. """
+      out = self.Build(TestElsets.INP, elsets=[{"name" : "A", "setMat" : 2, "duplicate" : 5}, {"name" : "B", "setMat" : 3}])
+      elem = out.split("elem\n")[1].strip().splitlines()
+      self.assertEqual([l.split(",")[1].strip() for l in elem], ["2", "3", "1", "5", "5", "5"])
+      self.assertEqual([int(l.split(",")[0]) for l in elem], [1, 2, 3, 4, 5, 6])
+      
+class TestMixedElements(BuildTestCase):
+   INP = """*Node
+1, 0., 0.
+2, 1., 0.
+3, 1., 1.
+4, 0., 1.
+5, 2., 0.
+6, 2., 1.
+*Element, type=S4R
+1, 1, 2, 3, 4
+*Element, type=S3R
+2, 2, 5, 3
+3, 5, 6, 3
+*Element, type=S4R
+4, 4, 3, 6, 1
+*Elset, elset=ALL, generate
+1, 4, 1
+"""
+   def Blocks(self, out):
+      """ Split the elem blocks of an output into {heading : list of element lines}. """
+      blocks = out.split("\nelem")[1:]
+      return dict([(b.splitlines()[0].strip(), [l.strip() for l in b.strip().splitlines()[1:] if l.strip()]) for b in blocks])
+      
+   def test_groupedOutput(self):
+      """ Test if a mixed mesh is written as one elem block per element type with its own number of nodes. """
+      blocks = self.Blocks(self.Build(TestMixedElements.INP))
+      self.assertEqual(blocks["** TYPE=S4R"], ["1, 1, 1, 2, 3, 4", "4, 1, 4, 3, 6, 1"])
+      self.assertEqual(blocks["** TYPE=S3R"], ["2, 1, 2, 5, 3", "3, 1, 5, 6, 3"])
+      
+   def test_typeMaterials(self):
+      """ Test if element types are mapped to materials by setMat or matOffset after the elsets. """
+      blocks = self.Blocks(self.Build(TestMixedElements.INP, elsets=[{"name" : "ALL", "setMat" : 2}],
+                                      elemTypes=[{"type" : "s3r", "matOffset" : 10}, {"type" : "S4R", "setMat" : 5}]))
+      self.assertEqual([l.split(",")[1].strip() for l in blocks["** TYPE=S3R"]], ["12", "12"])
+      self.assertEqual([l.split(",")[1].strip() for l in blocks["** TYPE=S4R"]], ["5", "5"])
+
+class TestNodeSelection(BuildTestCase):
+   def test_grid(self):
+      """ Test if grid queries find the same nodes as a full scan, also in flat and 2d meshes. """
+      random.seed(7)
+      for numNodes, nDim, flat in ((500, 3, False), (300, 2, False), (400, 3, True)):
+         mesh = inp2feap.AbaqusMesh()
+         for i in xrange(numNodes):
+            mesh.AddNode(i+1, *[1.5 if flat and d == 2 else random.uniform(-5., 20.) for d in xrange(nDim)])
+         grid = inp2feap.NodeGrid(mesh)
+         for q in xrange(50):
+            lo = [random.uniform(-8., 22.) for d in xrange(nDim)]
+            hi = [l + random.uniform(0., 10.) for l in lo]
+            expected = [r for r in xrange(numNodes) if all(lo[d] <= mesh.coords[r*nDim+d] <= hi[d] for d in xrange(nDim))]
+            self.assertEqual(grid.Rows(lo, hi), expected)
+
+   def test_nearlyFlatGrid(self):
+      """ Test if a planar mesh with a tiny offset out of its plane gets a grid of about numNodes/NODES_PER_CELL cells. """
+      for offset in (1e-12, 1e-6):
+         mesh = inp2feap.AbaqusMesh()
+         for i in xrange(10000): mesh.AddNode(i+1, i % 100, i / 100, offset if i == 5050 else 0.)
+         grid = inp2feap.NodeGrid(mesh)
+         self.assertEqual(grid.shape[2], 1)
+         self.assertLessEqual(reduce(lambda a, b: a*b, grid.shape), 10000 / inp2feap.NodeGrid.NODES_PER_CELL)
+         self.assertEqual(grid.Rows([10., 20., -1.], [12., 21., 1.]), [2010, 2011, 2012, 2110, 2111, 2112])
+         self.assertEqual(grid.Rows([50., 50., offset], [50., 50., offset]), [5050])
+
+   def test_config(self):
+      """ Test if config nsets select nodes by planes, bounding box faces and ranges with tolerance, without a mesh nset. """
+      inp = "*Node\n" + "".join(["%d, %g, %g\n" % (1 + i + 3*j, 0.5*i, 0.5*j) for j in xrange(3) for i in xrange(3)])
+      nsets = [{ "name" : "LEFT", "setBoun" : "1, 1", "select" : { "x" : "min" } },
+               { "name" : "MIDDLE", "setLoad" : "0, -1", "select" : { "y" : 0.5001, "tol" : 0.001 } },
+               { "name" : "CORNER", "setBoun" : "0, 1", "select" : { "x" : [0.4, "max"], "y" : ["min", 0.6] } }]
+      out = self.Build(inp, centerMesh=True, nsets=nsets)
+      self.assertIn("boun ** NSET=LEFT\n1, 0, 1, 1\n4, 0, 1, 1\n7, 0, 1, 1\n", out)
+      self.assertIn("load ** NSET=MIDDLE\n4, 0, 0, -1\n5, 0, 0, -1\n6, 0, 0, -1\n", out)
+      self.assertIn("boun ** NSET=CORNER\n2, 0, 0, 1\n3, 0, 0, 1\n5, 0, 0, 1\n6, 0, 0, 1\n", out)
+
+      # planes refer to the .inp coordinates, y = 0 is the bottom row although centering moves it to y = -0.5
+      out = self.Build(inp, centerMesh=True, nsets=[{ "name" : "BOTTOM", "setBoun" : "0, 1", "select" : { "y" : 0 } }])
+      self.assertIn("       1, 0,    -0.50000000,    -0.50000000\n", out)
+      self.assertIn("boun ** NSET=BOTTOM\n1, 0, 0, 1\n2, 0, 0, 1\n3, 0, 0, 1\n\n", out)
+      
+      with self.assertRaises(ValueError):
+         self.Build(inp, nsets=[{ "name" : "TOP", "setBoun" : "1, 1", "select" : { "z" : "max" } }])
+      for select in ({ "x" : "left" }, { "x" : [0] }, { "tol" : 0.1 }, { "w" : 1 }):
+         self.assertRaises(ValueError, inp2feap.NodeSelection, select)
+
+class TestBatch(BuildTestCase):
+   # more configs than worker processes, so that workers build several configs on their shared mesh
+   BOUN = ["1, 1, 1", "0, 1, 0", "1, 0, 0", "0, 0, 1", "1, 1, 0"]
+   
+   def _WriteConfigs(self):
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(SMALL_INP)
+      confFiles = []
+      for i, setBoun in enumerate(TestBatch.BOUN + [None]):
+         conf = { "input" : "model.inp", "output" : os.path.join(self.tmpDir, "iCase%d" % i),
+                  "elsets" : [{ "name" : "E-ALL", "setMat" : 2, "duplicate" : 3 }] }
+         if setBoun: conf["nsets"] = [{ "name" : "N-EDGE", "setBoun" : setBoun }]
+         else: conf["input"] = "missing.inp"
+         confFiles.append(os.path.join(self.tmpDir, "case%d.json" % i))
+         with open(confFiles[-1], 'w') as f: json.dump(conf, f)
+      return confFiles
+   
+   def _Check(self, jobs):
+      confFiles = self._WriteConfigs()
+      batch = inp2feap.BatchConverter(confFiles, jobs=jobs)
+      self.assertEqual(batch.Run(), inp2feap.EXIT_FAILURE)
+      self.assertEqual([batch.results[c][0] for c in confFiles], ["ok"] * len(TestBatch.BOUN) + ["parse failed"])
+      for i, setBoun in enumerate(TestBatch.BOUN):
+         with open(os.path.join(self.tmpDir, "iCase%d" % i)) as f: out = f.read()
+         self.assertIn("boun ** NSET=N-EDGE\n1, 0, %s\n2, 0, %s\n" % (setBoun, setBoun), out)
+         self.assertEqual(out.count("boun"), 1)
+         # elements of a previous config built by the same worker must not be duplicated again
+         self.assertIn("elem\n       1, 2, 1, 2, 3, 4\n       2, 3, 1, 2, 3, 4\n\n", out)
+         
+   def test_serial(self):
+      """ Test if configs sharing a mesh are converted independently in a batch. """
+      self._Check(1)
+      
+   def test_parallel(self):
+      """ Test if configs sharing a mesh are converted in worker processes. """
+      self._Check(2)
+
+class TestIncrementalBuild(BuildTestCase):
+   def setUp(self):
+      BuildTestCase.setUp(self)
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(SMALL_INP)
+      self.files = { "header.txt" : "feap\n0 0 0 3 3 4\n", "footer.txt" : "end\n" }
+      self.conf = { "input" : "model.inp", "output" : os.path.join(self.tmpDir, "iModel"), "header" : "header.txt", "footer" : "footer.txt",
+                    "nsets" : [{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }], "customInput" : { "block" : "vbou", "pos" : 1, "cards" : ["1, 1"] },
+                    "incremental" : True }
+      self.parsed = 0
+
+   def _Build(self):
+      """ Build the current config incrementally and from scratch, check that both outputs match and return it. """
+      for name, text in self.files.iteritems():
+         with open(os.path.join(self.tmpDir, name), 'w') as f: f.write(text)
+      outputs = []
+      for incremental in (False, True):
+         conf = dict(self.conf, output=os.path.join(self.tmpDir, "iModel" if incremental else "iScratch"), incremental=incremental)
+         confFile = os.path.join(self.tmpDir, "model.json")
+         with open(confFile, 'w') as f: json.dump(conf, f)
+         parser = inp2feap.ConfigFileParser(confFile)
+         parse = parser._ParseInputFile
+         def CountingParse(inputFile):
+            self.parsed += incremental
+            return parse(inputFile)
+         parser._ParseInputFile = CountingParse
+         parser.Build()
+         with open(conf["output"], 'r') as f: outputs.append(f.read())
+      self.assertEqual(outputs[0], outputs[1])
+      return outputs[1]
+
+   def test_footerChange(self):
+      """ Test if a changed footer is spliced into the output without parsing the mesh again. """
+      self._Build()
+      self.files["footer.txt"] = "inte\nend\n"
+      self.assertTrue(self._Build().endswith("\ninte\nend\n"))
+      self.assertEqual(self.parsed, 1)
+
+   def test_inputChange(self):
+      """ Test if a changed .inp file is detected by its contents, even with the same size and modification time. """
+      inputFile = os.path.join(self.tmpDir, "model.inp")
+      os.utime(inputFile, (1000000000, 1000000000))
+      self._Build()
+      with open(inputFile, 'w') as f: f.write(SMALL_INP.replace("1.,          1.,", "2.,          1.,"))
+      os.utime(inputFile, (1000000000, 1000000000))
+      self.assertEqual(os.path.getsize(inputFile), len(SMALL_INP))
+      self.assertIn("       3, 0,     2.00000000,     1.00000000", self._Build())
+      self.assertEqual(self.parsed, 2)
+      
+   def test_nsetChange(self):
+      """ Test if only the boun blocks are regenerated when the boundary conditions of an nset change. """
+      self._Build()
+      self.conf["nsets"] = [{ "name" : "N-EDGE", "setBoun" : "0, 1, 0", "setLoad" : "0, 0, 1" }]
+      out = self._Build()
+      self.assertIn("load ** NSET=N-EDGE\n1, 0, 0, 0, 1\n", out)
+      self.assertEqual(self.parsed, 1)
+
+   def test_headerChange(self):
+      """ Test if the coor/elem blocks are copied when the header in front of them changes. """
+      self._Build()
+      self.files["header.txt"] = "feap\n0 0 0 2 2 4\n"
+      self.assertTrue(self._Build().startswith("feap\n0 0 0 2 2 4\n\ncoor\n"))
+      self.assertEqual(self.parsed, 1)
+
+   def test_meshChange(self):
+      """ Test if the output is built from scratch when elset settings change or the output was modified otherwise. """
+      self._Build()
+      self.conf["elsets"] = [{ "name" : "E-ALL", "setMat" : 2 }]
+      self._Build()
+      self.assertEqual(self.parsed, 2)
+      with open(self.conf["output"], 'a') as f: f.write("modified\n")
+      self._Build()
+      self.assertEqual(self.parsed, 3)
+      
+class TestMeshInclude(BuildTestCase):
+   INP = """*Node
+1, 0., 0.
+2, 1., 0.
+3, 1., 1.
+4, 0., 1.
+*Element, type=CPS4
+1, 1, 2, 3, 4
+*Nset, nset=LEFT
+1, 4
+*Elset, elset=ALL
+1
+"""
+   def BuildCase(self, case, **conf):
+      """ Convert the load case 'case' of the model and return the output file contents. The .inp file is not rewritten. """
+      conf.update(input=os.path.join(self.tmpDir, "model.inp"), output=os.path.join(self.tmpDir, "i" + case), meshInclude="mesh")
+      inp2feap.ConfigFileParser(conf).Build()
+      with open(conf["output"], 'r') as f: return f.read()
+      
+   def Includes(self):
+      """ The names of the include files, in ascending order. """
+      return sorted(name for name in os.listdir(os.path.join(self.tmpDir, "mesh")) if name.endswith(".inc"))
+      
+   def test_loadCases(self):
+      """ Test if load cases share the coor/elem include files, and only a changed elem block gets a new one. """
+      inline = self.Build(self.INP)
+      out = {}
+      for case, setLoad in (("A", "1, 0"), ("B", "0, 1")):
+         out[case] = self.BuildCase(case, nsets=[{ "name" : "LEFT", "setLoad" : setLoad }])
+      includes = self.Includes()
+      self.assertEqual([name[:5] for name in includes], ["coor_", "elem_"])
+      self.assertTrue(out["A"].startswith("include,mesh/%s\ninclude,mesh/%s\n\nload" % tuple(includes)))
+      self.assertEqual(out["A"].replace(", 0, 1, 0\n", ", 0, 0, 1\n"), out["B"])
+      
+      # the include files contain the blocks of the single file output, each ending with a blank line
+      contents = [open(os.path.join(self.tmpDir, "mesh", name)).read() for name in includes]
+      self.assertEqual(inline, contents[0] + contents[1][:-1])
+      
+      self.BuildCase("C", elsets=[{ "name" : "ALL", "setMat" : 2 }])
+      changed = self.Includes()
+      self.assertEqual(len(changed), 3)
+      self.assertIn(includes[0], changed)
+      
+   def test_staleIncludes(self):
+      """ Test if any change of the .inp file gives new include files, and the old ones are removed once no load case refers to them. """
+      filename = os.path.join(self.tmpDir, "model.inp")
+      with open(filename, 'w') as f: f.write(self.INP)
+      os.utime(filename, (1000000000, 1000000000))
+      for case in ("A", "B"): self.BuildCase(case, nsets=[{ "name" : "LEFT", "setBoun" : "1, 1" }])
+      old = self.Includes()
+      
+      # same size and modification time, other contents
+      with open(filename, 'w') as f: f.write(self.INP.replace("3, 1., 1.", "3, 2., 1."))
+      os.utime(filename, (1000000000, 1000000000))
+      out = self.BuildCase("A", nsets=[{ "name" : "LEFT", "setBoun" : "1, 1" }])
+      new = [line.split("/")[1] for line in out.splitlines()[:2]]
+      self.assertEqual(self.Includes(), sorted(old + new)) # B still refers to the old files
+      with open(os.path.join(self.tmpDir, "mesh", new[0])) as f: self.assertIn("       3, 0,     2.00000000,     1.00000000\n", f.read())
+      
+      self.BuildCase("B", nsets=[{ "name" : "LEFT", "setBoun" : "1, 1" }])
+      self.assertEqual(self.Includes(), sorted(new))
+      
+class TestStageProfiler(BuildTestCase):
+   def test_stages(self):
+      """ Test if the build stages are recorded with throughput and saved as metrics with a cProfile dump. """
+      with open(os.path.join(self.tmpDir, "model.inp"), 'w') as f: f.write(SMALL_INP)
+      confFile = os.path.join(self.tmpDir, "model.json")
+      with open(confFile, 'w') as f: json.dump({ "input" : "model.inp", "output" : os.path.join(self.tmpDir, "iModel") }, f)
+      parser = inp2feap.ConfigFileParser(confFile)
+      parser.profiler = inp2feap.StageProfiler("parse")
+      parser.Build()
+      stages = parser.profiler.stages
+      self.assertEqual([s["name"] for s in stages], ["config", "read", "parse", "elsets", "duplicate", "nsets", "write"])
+      self.assertEqual((stages[3]["amount"], stages[3]["unit"]), (1, "elems"))
+      
+      metricsFile = os.path.join(self.tmpDir, "metrics.json")
+      parser.profiler.Save(metricsFile)
+      with open(metricsFile) as f: metrics = json.load(f)
+      self.assertEqual(len(metrics["stages"]), 7)
+      self.assertTrue(os.path.isfile(os.path.join(self.tmpDir, "metrics.parse.prof")))
+      
+class TestCompression(BuildTestCase):
+   def _Parse(self, filename):
+      mesh = inp2feap.InpFileParser(filename, jobs=2, lazy=True).Parse()
+      return list(mesh.nodeIds), list(mesh.coords), list(mesh.elemNodes), [(ns.name, list(ns.nodes)) for ns in mesh.nsets]
+      
+   def test_compressedInput(self):
+      """ Test if gzip (with several streams) and bzip2 compressed files are recognized by their magic bytes and parsed. """
+      filename = os.path.join(self.tmpDir, "model.inp")
+      with open(filename, 'w') as f: f.write(SMALL_INP)
+      half = len(SMALL_INP) / 2
+      with open(os.path.join(self.tmpDir, "model.dat"), 'wb') as f:
+         for part in (SMALL_INP[:half], SMALL_INP[half:]):
+            gz = gzip.GzipFile(fileobj=f, mode='wb')
+            gz.write(part)
+            gz.close()
+      with open(os.path.join(self.tmpDir, "model.inp.bz2"), 'wb') as f: f.write(bz2.compress(SMALL_INP))
+      
+      expected = self._Parse(filename)
+      for name, compression in (("model.dat", "gz"), ("model.inp.bz2", "bz2")):
+         self.assertEqual(inp2feap.Compression(os.path.join(self.tmpDir, name)), compression)
+         self.assertEqual(self._Parse(os.path.join(self.tmpDir, name)), expected)
+
+   def test_streamAtChunkBoundary(self):
+      """ Test if a compressed stream ending exactly at the end of a read chunk is followed by the next stream. """
+      filename = os.path.join(self.tmpDir, "model.inp")
+      with open(filename, 'w') as f: f.write(SMALL_INP)
+      half = len(SMALL_INP) / 2
+      first, second = bz2.compress(SMALL_INP[:half]), bz2.compress(SMALL_INP[half:])
+      with open(os.path.join(self.tmpDir, "model.inp.bz2"), 'wb') as f: f.write(first + second)
+
+      expected = self._Parse(filename)
+      chunkBytes = inp2feap.InpFileParser.CHUNK_BYTES
+      inp2feap.InpFileParser.CHUNK_BYTES = len(first)
+      try: self.assertEqual(self._Parse(os.path.join(self.tmpDir, "model.inp.bz2")), expected)
+      finally: inp2feap.InpFileParser.CHUNK_BYTES = chunkBytes
+
+   def test_compressedOutput(self):
+      """ Test if the output is compressed according to its extension. """
+      plain = self.Build(SMALL_INP, nsets=[{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }])
+      self.Build(SMALL_INP, output=os.path.join(self.tmpDir, "iModel.gz"), nsets=[{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }])
+      with gzip.open(os.path.join(self.tmpDir, "iModel.gz")) as f: self.assertEqual(f.read(), plain)
+      
+class TestPipeline(BuildTestCase):
+   INP = SMALL_INP.replace("*Element", "*Node\n      5,          2.,          0.,           0.\n      6,          2.,          1.,           0.\n*Element") \
+                  .replace("1, 1, 2, 3, 4\n", "1, 1, 2, 3, 4\n2, 2, 5, 6, 3\n")
+
+   def setUp(self):
+      BuildTestCase.setUp(self)
+      self.blockLines = inp2feap.InpFileParser.BLOCK_LINES
+      inp2feap.InpFileParser.BLOCK_LINES = 2 # several blocks of nodes per section
+
+   def tearDown(self):
+      inp2feap.InpFileParser.BLOCK_LINES = self.blockLines
+      BuildTestCase.tearDown(self)
+
+   def test_pipelinedOutput(self):
+      """ Test if pipelined builds write the same output as sequential ones, also with centering and compressed input and output. """
+      with open(os.path.join(self.tmpDir, "model.head"), 'w') as f: f.write("feap\n0 0 0 2 2 4")
+      conf = { "header" : "model.head", "elsets" : [{ "name" : "E-ALL", "setMat" : 2 }],
+               "nsets" : [{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }], "customInput" : { "block" : "vbou", "pos" : -1, "cards" : ["1, 0"] } }
+      for centerMesh in (False, True):
+         expected = self.Build(self.INP, centerMesh=centerMesh, **conf)
+         self.assertEqual(self.Build(self.INP, centerMesh=centerMesh, pipeline=True, **conf), expected)
+
+      with gzip.open(os.path.join(self.tmpDir, "model.inp.gz"), 'wb') as f: f.write(self.INP)
+      self.Build(self.INP, input="model.inp.gz", output=os.path.join(self.tmpDir, "iModel.gz"), centerMesh=True, pipeline=True, **conf)
+      with gzip.open(os.path.join(self.tmpDir, "iModel.gz")) as f: self.assertEqual(f.read(), expected)
+
+   def test_failedBuild(self):
+      """ Test if a pipelined build failing after the parse stops its writer thread and leaves no partial output. """
+      threads = threading.active_count()
+      inp = "*Node\n1, 0., 0.\n2, 1., 0.\n3, 1., 1.\n*Element\n1, 1, 2, 3\n"
+      with self.assertRaises(ValueError):
+         self.Build(inp, pipeline=True, nsets=[{ "name" : "TOP", "setBoun" : "1, 1", "select" : { "z" : "max" } }])
+      self.assertFalse(os.path.exists(os.path.join(self.tmpDir, "iModel")))
+      self.assertEqual(threading.active_count(), threads)
+      
+   def test_threadErrors(self):
+      """ Test if errors of the reader and writer threads are raised in the calling thread. """
+      def Chunks():
+         yield "a"
+         raise IOError("read failed")
+      chunks = inp2feap._ReadAhead(Chunks())
+      self.assertRaises(IOError, list, chunks)
+
+      class FailingFile:
+         def write(self, data): raise IOError("disk full")
+         def close(self): pass
+      f = inp2feap._WriteBehind(FailingFile())
+      f.write("coor\n")
+      self.assertEqual(f.tell(), 5)
+      self.assertRaises(IOError, f.close)
+
+class TestConvert(BuildTestCase):
+   CONF = { "elsets" : [{ "name" : "E-ALL", "setMat" : 2, "duplicate" : 3 }], "nsets" : [{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }] }
+
+   def test_configDict(self):
+      """ Test if a config dict is converted like a config file, from the input file or a reused mesh, to a string or a stream. """
+      expected = self.Build(SMALL_INP, **self.CONF)
+      conf = dict(self.CONF, input=os.path.join(self.tmpDir, "model.inp"))
+      self.assertEqual(inp2feap.Convert(conf), expected)
+
+      mesh = inp2feap.ParseMesh(conf)
+      for i in xrange(2):
+         stream = StringIO()
+         self.assertEqual(inp2feap.Convert(conf, mesh, stream), None)
+         self.assertEqual(stream.getvalue(), expected)
+      self.assertEqual(mesh.NumElems(), 1) # not modified by the conversions
+      self.assertRaises(ValueError, inp2feap.Convert, dict(self.CONF), mesh)
+
+   def test_exitCode(self):
+      """ Test if the command line script exits with an error code if the config file is invalid. """
+      script = os.path.join(os.path.dirname(os.path.abspath(inp2feap.__file__)), "inp2feap.py")
+      self.Build(SMALL_INP)
+      confFile = os.path.join(self.tmpDir, "model.json")
+      self.assertEqual(subprocess.call([sys.executable, script, "-q", confFile]), inp2feap.EXIT_SUCCESS)
+      with open(confFile, 'w') as f: json.dump({ "input" : "model.inp" }, f) # no output
+      with open(os.devnull, 'w') as devnull:
+         self.assertEqual(subprocess.call([sys.executable, script, "-q", confFile], stderr=devnull), inp2feap.EXIT_FAILURE)
+
+   def test_logging(self):
+      """ Test if messages are only printed to the console up to the level set by LogToConsole(). """
+      conf = dict(self.CONF, input=WriteTempInp(SMALL_INP), elsets=[{ "name" : "MISSING", "setMat" : 2 }])
+      warning = "Warning: Couldn't find elset 'MISSING' (specified in <config dict>) in mesh %s." % conf["input"]
+      try:
+         with inp2feap._CaptureOutput() as output: inp2feap.Convert(conf)
+         self.assertEqual(output.text, "")
+         
+         lines = {}
+         for level in (logging.WARNING, logging.INFO, logging.DEBUG):
+            inp2feap.LogToConsole(level)
+            with inp2feap._CaptureOutput() as output: inp2feap.Convert(conf)
+            lines[level] = output.text.splitlines()
+         self.assertEqual(lines[logging.WARNING], [warning])
+         self.assertIn("Parsing input file '%s'." % conf["input"], lines[logging.INFO])
+         self.assertEqual([l for l in lines[logging.INFO] if l.startswith(".")], [])
+         self.assertIn(".Parsed 4 nodes (ndim=3) and 1 elements (nodes per element=4).", lines[logging.DEBUG])
+         self.assertEqual(len(inp2feap.log.handlers), 2) # one console handler
+      finally:
+         inp2feap.log.setLevel(logging.NOTSET)
+         inp2feap.log.handlers = [h for h in inp2feap.log.handlers if not isinstance(h, inp2feap._ConsoleHandler)]
+         os.remove(conf["input"])
+         
+class TestConfigWatcher(BuildTestCase):
+   def _Write(self, name, text):
+      with open(os.path.join(self.tmpDir, name), 'w') as f: f.write(text)
+      
+   def test_rebuildOnChange(self):
+      """ Test if changes of the config, footer and input file are converted, the mesh being parsed only for the latter. """
+      conf = { "input" : "model.inp", "output" : os.path.join(self.tmpDir, "iModel"), "footer" : "footer.txt" }
+      self._Write("model.inp", SMALL_INP)
+      self._Write("footer.txt", "end\n")
+      self._Write("model.json", json.dumps(conf))
+      watcher = inp2feap.ConfigWatcher(os.path.join(self.tmpDir, "model.json"))
+      self.assertTrue(watcher.Poll())
+      self.assertFalse(watcher.Poll())
+      mesh = watcher.mesh
+      
+      self._Write("footer.txt", "inte\nend\n")
+      self.assertTrue(watcher.Poll())
+      with open(conf["output"]) as f: self.assertTrue(f.read().endswith("\ninte\nend\n"))
+      
+      conf["elsets"] = [{ "name" : "E-ALL", "setMat" : 3 }]
+      self._Write("model.json", json.dumps(conf))
+      self.assertTrue(watcher.Poll())
+      with open(conf["output"]) as f: self.assertIn("1, 3, 1, 2, 3, 4\n", f.read())
+      self.assertIs(watcher.mesh, mesh)
+      self.assertEqual(list(mesh.elemMats), [1])
+      
+      self._Write("model.inp", SMALL_INP.replace("1.,          1.", "2.,          2."))
+      self.assertTrue(watcher.Poll())
+      self.assertIsNot(watcher.mesh, mesh)
+
+   def test_pipeline(self):
+      """ Test if a pipelined build of compressed output, which isn't built incrementally, works in watch mode. """
+      plain = self.Build(SMALL_INP, nsets=[{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }])
+      conf = { "input" : "model.inp", "output" : os.path.join(self.tmpDir, "iModel.gz"), "pipeline" : True,
+               "nsets" : [{ "name" : "N-EDGE", "setBoun" : "1, 1, 1" }] }
+      self._Write("model.json", json.dumps(conf))
+      watcher = inp2feap.ConfigWatcher(os.path.join(self.tmpDir, "model.json"))
+      self.assertTrue(watcher.Poll())
+      with gzip.open(conf["output"]) as f: self.assertEqual(f.read(), plain)
+
+      self._Write("footer.txt", "end\n")
+      conf["footer"] = "footer.txt"
+      self._Write("model.json", json.dumps(conf))
+      self.assertTrue(watcher.Poll())
+      with gzip.open(conf["output"]) as f: self.assertEqual(f.read(), plain + "\nend\n")
+
+class TestInpFileParser(unittest.TestCase):
+   def setUp(self):
+      self.filename = WriteTempInp(SMALL_INP)
+      
+   def tearDown(self):
+      os.remove(self.filename)
+      
+   def test_records(self):
+      """ Test if the record stream dispatches keywords and yields split data lines. """
+      records = list(inp2feap.InpFileParser(self.filename).Records())
+      keywords = [(ln, data[0]) for kind, ln, data in records if kind == inp2feap.InpFileParser.KEYWORD]
+      self.assertEqual(keywords, [(1, inp2feap.InpFileParser.UNKNOWN), (2, inp2feap.InpFileParser.UNKNOWN),
+                                  (3, inp2feap.InpFileParser.READ_NODES), (8, inp2feap.InpFileParser.READ_ELEMS),
+                                  (10, inp2feap.InpFileParser.READ_NSET), (12, inp2feap.InpFileParser.READ_ELSET),
+                                  (14, inp2feap.InpFileParser.UNKNOWN), (15, inp2feap.InpFileParser.UNKNOWN)])
+      self.assertEqual(records[11][2][1:], ({'elset' : 'E-ALL'}, set(['generate'])))
+      self.assertEqual(records[8], (inp2feap.InpFileParser.READ_ELEMS, 9, ['1', ' 1', ' 2', ' 3', ' 4']))
+      self.assertEqual(records[-1], (inp2feap.InpFileParser.UNKNOWN, 16, None))
+      
+   def test_parse(self):
+      """ Test if Parse() builds the mesh from the record stream. """
+      mesh = inp2feap.InpFileParser(self.filename).Parse()
+      self.assertEqual(list(mesh.nodeIds), [1, 2, 3, 4])
+      self.assertEqual(list(mesh.elemNodes), [1, 2, 3, 4])
+      self.assertEqual([(ns.name, ns.nodes) for ns in mesh.nsets], [("N-EDGE", [1, 2])])
+      self.assertEqual([(es.name, es.elems) for es in mesh.elsets], [("E-ALL", [1])])
+      
+   def test_dataBlocks(self):
+      """ Test if *Node/*Element data lines are gathered into blocks and converted in bulk like line by line. """
+      records = list(inp2feap.InpFileParser(self.filename).Records(blocks=True))
+      self.assertEqual(records[3][:2], (inp2feap.InpFileParser.DATA_BLOCK, 4))
+      self.assertEqual(records[3][2][0], inp2feap.InpFileParser.READ_NODES)
+      self.assertEqual(len(records[3][2][1]), 4)
+      
+      builder = inp2feap.MeshBuilder()
+      builder.Consume(inp2feap.InpFileParser(self.filename).Records())
+      mesh = inp2feap.InpFileParser(self.filename).Parse()
+      for name in inp2feap.AbaqusMesh.ARRAYS:
+         self.assertEqual(getattr(mesh, name), getattr(builder.mesh, name))
+      
+   def test_numberArray(self):
+      """ Test if numbers which are no valid JSON are converted, too. """
+      self.assertEqual(list(inp2feap._NumberArray('d', ["1.", "-2.5e1", "+3"])), [1., -25., 3.])
+      self.assertEqual(list(inp2feap._NumberArray('i', ["007", "8"])), [7, 8])
+      with self.assertRaises(ValueError):
+         inp2feap._NumberArray('i', ["1", "2.5"])
+      
+   def test_invalidLine(self):
+      """ Test if invalid data lines are reported with their line number. """
+      os.remove(self.filename)
+      self.filename = WriteTempInp(SMALL_INP.replace("3,          1.,", "3,          1.x,"))
+      with self.assertRaisesRegexp(ValueError, "line 6"):
+         inp2feap.InpFileParser(self.filename).Parse()
+         
+class TestSectionFilter(unittest.TestCase):
+   INP = """*Node
+1, 0., 0.
+2, 1., 0.
+*Element, type=T3D2
+1, 1, 2
+2, 2, 1
+*Nset, nset=A
+1
+*Nset, nset=B
+1, 2
+*Elset, elset=E1
+1
+*Elset, elset=E2
+2
+*Elset, elset=E3
+1, 2
+*Node
+3, x, 0.
+"""
+   def setUp(self):
+      self.filename = WriteTempInp(TestSectionFilter.INP.replace("*Node\n3, x, 0.\n", ""))
+      self.select = inp2feap.SectionFilter(nsets=["A"], elsets=["E2"])
+      
+   def tearDown(self):
+      os.remove(self.filename)
+      
+   def test_records(self):
+      """ Test if data lines of unselected sections are counted, but not split. """
+      builder = inp2feap.MeshBuilder()
+      builder.Consume(inp2feap.InpFileParser(self.filename, select=self.select).Records(blocks=True))
+      self.assertEqual([ns.name for ns in builder.mesh.nsets], ["A"])
+      self.assertEqual([es.name for es in builder.mesh.elsets], ["E2", "E3"]) # E3 may override E2
+      self.assertEqual((builder.unusedSections, builder.unusedLines, builder.unusedBytes), (2, 2, 7))
+      self.assertEqual(builder.mesh.NumElems(), 2)
+      
+   def test_indexed(self):
+      """ Test if the indexed parser skips the same sections and keeps counting lines. """
+      mesh = inp2feap.InpFileParser(self.filename, lazy=True, select=self.select).Parse()
+      self.assertEqual([(ns.name, ns.nodes) for ns in mesh.nsets], [("A", [1])])
+      self.assertEqual([(es.name, es.elems) for es in mesh.elsets], [("E2", [2]), ("E3", [1, 2])])
+      
+      mesh = inp2feap.InpFileParser(self.filename, select=inp2feap.SectionFilter(nodes=False, elems=False)).Parse()
+      self.assertEqual((mesh.NumNodes(), mesh.NumElems(), len(mesh.nsets)), (0, 0, 2))
+      
+      os.remove(self.filename)
+      self.filename = WriteTempInp(TestSectionFilter.INP)
+      with self.assertRaisesRegexp(ValueError, "line 18"):
+         inp2feap.InpFileParser(self.filename, select=self.select).Parse()
+         
+class TestGridGenerator(unittest.TestCase):
+   def test_c3d20(self):
+      """ Test if a synthetic grid of quadratic hex elements written on two lines each is parsed completely. """
+      filename = WriteTempInp("")
+      try:
+         self.assertEqual(bench.GridGenerator("c3d20", 8).Write(filename), (8, 2))
+         mesh = inp2feap.InpFileParser(filename).Parse()
+      finally:
+         os.remove(filename)
+      self.assertEqual((mesh.NumNodes(), mesh.NumElems(), mesh.nodesPerElem), (125, 8, 20))
+      first, second = mesh.elems[0].nodes, mesh.elems[1].nodes
+      self.assertEqual((first[1], first[2], first[9]), (second[0], second[3], second[11]))
+      self.assertEqual(sorted(mesh.elsets[1].elems), [5, 6, 7, 8])
+      self.assertEqual(len(mesh.nsets[0].nodes), 25)
+      
+class TestElementAssembler(unittest.TestCase):
+   def test_nodesForType(self):
+      """ Test if the number of nodes is derived correctly from Abaqus element type names. """
+      for elemType, numNodes in (("S4R", 4), ("s3r", 3), ("C3D20R", 20), ("C3D27", 27), ("C3D8I", 8), ("CPS4R", 4),
+                                 ("T3D2", 2), ("S8R5", 8), ("B31", 2), ("XYZ12", None), (None, None)):
+         self.assertEqual(inp2feap.ElementAssembler.NodesForType(elemType), numNodes)
+   
+   def test_wrappedLines(self):
+      """ Test if element records wrapped onto continuation lines are assembled correctly. """
+      mesh = inp2feap.AbaqusMesh()
+      assembler = inp2feap.ElementAssembler(mesh, 20)
+      for line in ("1, 101, 102, 103, 104, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114, 115,",
+                   "   116, 117, 118, 119, 120",
+                   "2, 201, 202, 203, 204, 205, 206, 207, 208, 209, 210, 211, 212, 213, 214, 215,",
+                   "   216, 217, 218, 219, 220, 3, 301"):
+         assembler.Feed(line.split(','))
+      self.assertEqual(list(mesh.elemIds), [1, 2])
+      self.assertEqual(mesh.elems[1].nodes, range(201, 221))
+      self.assertEqual(assembler.Pending(), 2)
+      
+   def test_parseTypeFromKeyword(self):
+      """ Test if the parser reads wrapped C3D20R elements without nodesPerElem being specified. """
+      nodes = "".join(["%d, %d., 0., 0.\n" % (i, i) for i in xrange(1, 21)])
+      filename = WriteTempInp("*Node\n" + nodes + "*Element, type=C3D20R\n" +
+                              "7, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,\n 16, 17, 18, 19, 20\n" +
+                              "8, 20, 19, 18, 17, 16, 15, 14, 13, 12, 11, 10, 9, 8, 7, 6,\n 5, 4, 3, 2, 1\n*End Part\n")
+      try: mesh = inp2feap.InpFileParser(filename).Parse()
+      finally: os.remove(filename)
+      self.assertEqual(mesh.nodesPerElem, 20)
+      self.assertEqual(list(mesh.elemIds), [7, 8])
+      self.assertEqual(mesh.elems[1].nodes, range(20, 0, -1))
+         
+class TestFeapWriter(unittest.TestCase):
+   def setUp(self):
+      self.chunkRows = inp2feap.FeapWriter.CHUNK_ROWS
+      inp2feap.FeapWriter.CHUNK_ROWS = 7 # force several chunks with a partial last one
+      
+      self.mesh = inp2feap.AbaqusMesh()
+      for i in xrange(1, 31):
+         self.mesh.AddNode(i*3, (random.random()-0.5) * 200., random.random(), -random.random())
+      for i in xrange(1, 24):
+         self.mesh.AddElem(i, [i*3, i*3+3, i*3+6, i*3+9], random.randint(1, 5))
+         
+   def tearDown(self):
+      inp2feap.FeapWriter.CHUNK_ROWS = self.chunkRows
+      
+   def test_blocks(self):
+      """ Test if chunked coor and elem blocks are identical to formatting each node/element on its own. """
+      f = StringIO()
+      inp2feap.FeapWriter(f).WriteCoor(self.mesh)
+      self.assertEqual(f.getvalue(), "".join([str(n) for n in self.mesh.nodes]))
+      
+      f = StringIO()
+      inp2feap.FeapWriter(f).WriteElem(self.mesh)
+      self.assertEqual(f.getvalue(), "".join([str(e) for e in self.mesh.elems]))
+      
+   def test_nodeSet(self):
+      """ Test if node sets are written sorted with their boun card. """
+      nset = inp2feap.NodeSet()
+      nset.name = "N"
+      nset.nodes = [5, 3, 4, 1, 2, 9, 8, 7, 6, 10]
+      nset.setBoun = "1, 0, 100%"
+      self.assertEqual(str(nset), "boun ** NSET=N\n" + "".join(["%d, 0, 1, 0, 100%%\n" % i for i in xrange(1, 11)]))
+      self.assertEqual(list(nset.nodes), range(1, 11))
+         
+class TestKeywordIndex(unittest.TestCase):
+   def setUp(self):
+      self.filename = WriteTempInp("1, 0., 0., 0.\n" + SMALL_INP)
+      
+   def tearDown(self):
+      os.remove(self.filename)
+      
+   def test_sections(self):
+      """ Test if all keyword lines are indexed with the byte ranges of their sections. """
+      index = inp2feap.KeywordIndex(self.filename)
+      try:
+         self.assertEqual([s.keyword for s in index.sections],
+                          [None, "*Heading", "** comment", "*Node", "*Element", "*Nset", "*Elset", "*Material", "*Elastic"])
+         with open(self.filename, 'rb') as f: text = f.read()
+         elset = index.sections[6]
+         self.assertEqual(text[elset.start:elset.dataStart], "*Elset, elset=E-ALL, generate\n")
+         self.assertEqual(text[elset.dataStart:elset.end], " 1, 1, 1\n")
+         self.assertEqual((elset.params, elset.flags), ({'elset' : 'E-ALL'}, set(['generate'])))
+         self.assertEqual(index.sections[-1].end, len(text))
+         self.assertEqual(index.CountLines(0, elset.start), 12)
+      finally:
+         index.Close()
+         
+   def test_lazy(self):
+      """ Test if set members are only read on access in lazy mode. """
+      mesh = inp2feap.InpFileParser(self.filename, lazy=True).Parse()
+      self.assertEqual(list(mesh.nodeIds), [1, 1, 2, 3, 4])
+      self.assertEqual([ns.IsLoaded() for ns in mesh.nsets + mesh.elsets], [False, False])
+      self.assertEqual(mesh.nsets[0].nodes, [1, 2])
+      self.assertEqual(mesh.elsets[0].elems, [1])
+      self.assertTrue(mesh.elsets[0].generate)
+      self.assertEqual([ns.IsLoaded() for ns in mesh.nsets + mesh.elsets], [True, True])
+      
+class TestMeshCache(unittest.TestCase):
+   def setUp(self):
+      self.cacheDir = tempfile.mkdtemp()
+      self.filename = WriteTempInp(SMALL_INP)
+      
+   def tearDown(self):
+      shutil.rmtree(self.cacheDir)
+      os.remove(self.filename)
+      
+   def test_roundtrip(self):
+      """ Test if a stored mesh is loaded with identical columns and sets, deferred sets staying deferred. """
+      cache = inp2feap.MeshCache(self.cacheDir)
+      self.assertIsNone(cache.Load(self.filename))
+      mesh = inp2feap.InpFileParser(self.filename, lazy=True).Parse()
+      mesh.nsets[0].nodes # load one set, keep the other one deferred
+      cache.Store(self.filename, mesh)
+      
+      cached = cache.Load(self.filename)
+      for name in inp2feap.AbaqusMesh.ARRAYS:
+         self.assertEqual(getattr(cached, name), getattr(mesh, name))
+      self.assertEqual((cached.nDim, cached.nodesPerElem), (3, 4))
+      self.assertTrue(cached.nsets[0].IsLoaded())
+      self.assertFalse(cached.elsets[0].IsLoaded())
+      self.assertEqual((cached.nsets[0].name, cached.nsets[0].nodes), ("N-EDGE", [1, 2]))
+      self.assertEqual((cached.elsets[0].name, cached.elsets[0].elems, cached.elsets[0].generate), ("E-ALL", [1], True))
+      self.assertIsNone(cache.Load(self.filename, nodesPerElem=4))
+      
+   def test_invalidation(self):
+      """ Test if entries are invalidated when the input file changes. """
+      cache = inp2feap.MeshCache(self.cacheDir)
+      cache.Store(self.filename, inp2feap.InpFileParser(self.filename).Parse())
+      with open(self.filename, 'a') as f: f.write("** changed\n")
+      self.assertIsNone(inp2feap.MeshCache(self.cacheDir).Load(self.filename))
+      
+      # same size and modification time, e.g. restored by cp -p
+      os.utime(self.filename, (1000000000, 1000000000))
+      cache.Store(self.filename, inp2feap.InpFileParser(self.filename).Parse())
+      size = os.path.getsize(self.filename)
+      with open(self.filename, 'r+') as f:
+         text = f.read().replace("** changed", "** edited!")
+         f.seek(0)
+         f.write(text)
+      os.utime(self.filename, (1000000000, 1000000000))
+      self.assertEqual(os.path.getsize(self.filename), size)
+      self.assertIsNone(inp2feap.MeshCache(self.cacheDir).Load(self.filename))
+      
+   def test_eviction(self):
+      """ Test if least recently used entries are evicted when the cache grows too large. """
+      cache = inp2feap.MeshCache(self.cacheDir)
+      mesh = inp2feap.InpFileParser(self.filename).Parse()
+      cache.Store(self.filename, mesh, nodesPerElem=4)
+      cache.Store(self.filename, mesh)
+      entrySize = os.path.getsize(os.path.join(self.cacheDir, os.listdir(self.cacheDir)[0]))
+      self.assertEqual(len(os.listdir(self.cacheDir)), 2)
+      
+      cache.maxBytes = entrySize
+      os.utime(os.path.join(self.cacheDir, os.listdir(self.cacheDir)[0]), (0, 0))
+      cache.Store(self.filename, mesh, nodesPerElem=3)
+      self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+      self.assertIsNotNone(cache.Load(self.filename, nodesPerElem=3))
+      
+class TestParallelParse(unittest.TestCase):
+   def setUp(self):
+      self.chunkBytes = inp2feap.InpFileParser.CHUNK_BYTES
+      self.minBytes = inp2feap.InpFileParser.PARALLEL_MIN_BYTES
+      inp2feap.InpFileParser.CHUNK_BYTES = 500
+      inp2feap.InpFileParser.PARALLEL_MIN_BYTES = 100
+      
+   def tearDown(self):
+      inp2feap.InpFileParser.CHUNK_BYTES = self.chunkBytes
+      inp2feap.InpFileParser.PARALLEL_MIN_BYTES = self.minBytes
+      
+   def _CompareSerial(self, text):
+      filename = WriteTempInp(text)
+      try:
+         serial = inp2feap.InpFileParser(filename).Parse()
+         parallel = inp2feap.InpFileParser(filename, jobs=3).Parse()
+      finally: os.remove(filename)
+      for name in inp2feap.AbaqusMesh.ARRAYS:
+         self.assertEqual(getattr(parallel, name), getattr(serial, name))
+      self.assertEqual([(ns.name, ns.nodes) for ns in parallel.nsets], [(ns.name, ns.nodes) for ns in serial.nsets])
+      self.assertEqual([(es.name, es.elems) for es in parallel.elsets], [(es.name, es.elems) for es in serial.elsets])
+      return parallel
+      
+   def _Model(self, continuation):
+      nodes = "".join(["%d, %f, %f, 0.\n" % (i, i*0.1, i*0.2) for i in xrange(1, 301)])
+      elems = "".join(["%d, %s%s\n %s\n" % (e, ", ".join([str(e+i) for i in xrange(15)]), continuation,
+                                             ", ".join([str(e+i) for i in xrange(15, 20)])) for e in xrange(1, 101)])
+      return ("*Heading\n*Node\n" + nodes + "*Nset, nset=A\n1, 2, 3\n*Element, type=C3D20R\n" + elems +
+              "*Elset, elset=B, generate\n1, 100, 3\n*Boundary\nA, 1, 3\n*Node\n" + nodes.replace("\n", "1\n"))
+      
+   def test_parallel(self):
+      """ Test if parsing in parallel gives the same mesh as serial parsing. """
+      mesh = self._CompareSerial(self._Model(","))
+      self.assertEqual(mesh.NumNodes(), 600)
+      self.assertEqual(mesh.NumElems(), 100)
+      
+   def test_mixedTypes(self):
+      """ Test if blocks of different element types parsed in parallel are merged with the right offsets and types. """
+      nodes = "".join(["%d, %f, %f, 0.\n" % (i, i*0.1, i*0.2) for i in xrange(1, 301)])
+      quads = "".join(["%d, %d, %d, %d, %d\n" % (e, e, e+1, e+2, e+3) for e in xrange(1, 101)])
+      trias = "".join(["%d, %d, %d, %d\n" % (e, e, e+1, e+2) for e in xrange(101, 201)])
+      mesh = self._CompareSerial("*Node\n" + nodes + "*Element, type=S4R\n" + quads + "*Element, type=S3R\n" + trias)
+      self.assertEqual((mesh.typeNames, mesh.typeNodes), (["S4R", "S3R"], [4, 3]))
+      self.assertEqual(mesh.elems[150].nodes, [151, 152, 153])
+      
+   def test_fallback(self):
+      """ Test if wrapped element records without trailing commas (which can't be split safely) are parsed correctly. """
+      mesh = self._CompareSerial(self._Model(""))
+      self.assertEqual(mesh.NumElems(), 100)
+         
 if __name__=="__main__":
    unittest.main()
       
\ No newline at end of file